@@ -0,0 +1,21 @@
+from django.test import TestCase
+
+from query_budget import QueryBudgetMixin
+from .models import Author, Book
+
+
+class BookListQueryBudgetTests(QueryBudgetMixin, TestCase):
+    # The book list must cost the same number of queries at N and 10*N books.
+
+    def seed_books(self, n):
+        for i in range(n):
+            author = Author.objects.create(name=f'author {i}')
+            Book.objects.create(title=f'book {i}', publication_year=2000, author=author)
+
+    def get(self, url):
+        return lambda: self.client.get(url)
+
+    def test_book_list(self):
+        for url in ['/api/books/', '/api/books/?ordering=title', '/api/books/?publication_year=2000']:
+            with self.subTest(url=url):
+                self.assertQueryBudget(self.get(url), self.seed_books)
@@ -2,6 +2,7 @@ from django.shortcuts import render
 from rest_framework import generics, filters, serializers, permissions
 from .models import Book
 from .serializers import BookSerializer
+from .permissions import IsAuthorOrReadOnly
 from datetime import datetime
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
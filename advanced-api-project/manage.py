@@ -2,6 +2,10 @@
 """Django's command-line utility for administrative tasks."""
 import os
 import sys
+from pathlib import Path
+
+# The repository root holds code shared by its projects, e.g. query_budget.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
 
 
 def main():
@@ -1,3 +1,29 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from query_budget import QueryBudgetMixin
+from .models import Post, PostTag, Tag
+
+
+class ListQueryBudgetTests(QueryBudgetMixin, TestCase):
+    # Every list page must cost the same number of queries at N and 10*N posts.
+
+    def setUp(self):
+        self.tag = Tag.objects.create(name='django')
+        self.authors = 0
+
+    def seed_posts(self, n):
+        for i in range(n):
+            # Each post by a different author, so per-author lookups show up.
+            self.authors += 1
+            author = User.objects.create_user(f'author{self.authors}')
+            post = Post.objects.create(author=author, title=f'django post {i}', content='body')
+            PostTag.objects.create(post=post, tag=self.tag)
+
+    def get(self, url):
+        return lambda: self.client.get(url)
+
+    def test_list_pages(self):
+        for url in ['/posts/', '/tags/django/', '/search/?q=django']:
+            with self.subTest(url=url):
+                self.assertQueryBudget(self.get(url), self.seed_posts)
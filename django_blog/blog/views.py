@@ -76,7 +76,7 @@ class PostByTagListView(ListView):
     def get_queryset(self):
         tag_slug = self.kwargs['tag_slug']
         tag = get_object_or_404(Tag, name=tag_slug)
-        return Post.objects.filter(tags=tag)
+        return Post.objects.filter(tags=tag).select_related('author')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -89,6 +89,7 @@ class PostListView(ListView):
     template_name = 'blog/post_list.html'
     context_object_name = 'posts'
     ordering = ['-published_date']
+    queryset = Post.objects.select_related('author')  # the list template shows each post's author
 
 class PostDetailView(DetailView):
     model = Post
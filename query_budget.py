@@ -0,0 +1,91 @@
+import os
+import sys
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+
+
+# Query-count budgets for list endpoints, shared by every project in the
+# repository (each manage.py puts the repository root on sys.path).
+#
+# A list endpoint must run the same number of queries whether it renders N rows
+# or 10*N rows; any growth means an N+1 pattern crept in. On failure the
+# queries of the larger run are printed grouped by the line of project code
+# (or template) that issued them, relative to the project's BASE_DIR.
+
+
+def _is_test_file(filename):
+    return os.path.basename(filename).startswith('test')
+
+
+def call_site():
+    # Innermost frame that belongs to the project: a template node if the query
+    # came from rendering one, else the first non-test project source line.
+    root = str(settings.BASE_DIR)
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            origin = getattr(node, 'origin', None)
+            token = getattr(node, 'token', None)
+            if origin is not None and token is not None and str(origin.name).startswith(root):
+                return f'{os.path.relpath(origin.name, root)}:{token.lineno} (template)'
+        elif (
+            code.co_filename.startswith(root)
+            and code.co_filename != __file__
+            and not _is_test_file(code.co_filename)
+        ):
+            return f'{os.path.relpath(code.co_filename, root)}:{frame.f_lineno} in {code.co_name}'
+        frame = frame.f_back
+    return '<framework>'
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((call_site(), sql))
+        return execute(sql, params, many, context)
+
+
+def format_report(small_count, large_count, rows, factor, queries):
+    lines = [
+        f'Query count grew from {small_count} ({rows} rows) to {large_count} '
+        f'({rows * factor} rows). Queries of the larger run by call site:'
+    ]
+    sites = Counter(site for site, _ in queries)
+    samples = {}
+    for site, sql in queries:
+        samples.setdefault(site, sql)
+    for site, count in sites.most_common():
+        lines.append(f'  {count:>4} x {site}')
+        lines.append(f'         {samples[site][:300]}')
+    return '\n'.join(lines)
+
+
+class QueryBudgetMixin:
+    # Mix into a TestCase. `seed(n)` must add n more rows that the endpoint
+    # lists; `fetch()` must issue the request and return the response.
+    budget_rows = 5
+    budget_factor = 10
+
+    def record_queries(self, fetch):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = fetch()
+        self.assertLess(response.status_code, 400, getattr(response, 'content', b'')[:500])
+        return recorder.queries
+
+    def assertQueryBudget(self, fetch, seed, rows=None, factor=None):
+        rows = rows or self.budget_rows
+        factor = factor or self.budget_factor
+        seed(rows)
+        fetch()  # warm per-process caches (content types, settings-driven caches)
+        small = self.record_queries(fetch)
+        seed(rows * (factor - 1))
+        large = self.record_queries(fetch)
+        if len(large) > len(small):
+            self.fail(format_report(len(small), len(large), rows, factor, large))
@@ -0,0 +1,155 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+# Cached token authentication.
+#
+# DRF's TokenAuthentication reads Token joined to the user on every request.
+# CachedTokenAuthentication keeps token key -> user in two tiers:
+#
+#   local   a per-process LRU of at most TOKEN_AUTH_LRU_SIZE entries, trusted
+#           for TOKEN_AUTH_LOCAL_TTL seconds: no I/O at all.
+#   shared  the default cache for TOKEN_AUTH_CACHE_TIMEOUT seconds, so a
+#           process that has not seen a token yet still skips the database.
+#
+# Deleting a token (logout) or saving its user (password change,
+# deactivation, profile edits) drops both tiers in this process and the
+# shared tier everywhere; other processes' local entries age out within
+# TOKEN_AUTH_LOCAL_TTL seconds.
+
+TOKEN_CACHE_KEY = 'auth:token:{}'
+
+
+def _shared_key(key):
+    # Keys are credentials; keep them out of cache key listings.
+    return TOKEN_CACHE_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+class TokenCache:
+    def __init__(self, size, local_ttl, timeout):
+        self.size = size
+        self.local_ttl = local_ttl
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (user, monotonic time stored)
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] < self.local_ttl:
+                self._entries.move_to_end(key)
+                self.local_hits += 1
+                return entry[0]
+        user = cache.get(_shared_key(key))
+        if user is None:
+            with self._lock:
+                self._entries.pop(key, None)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.shared_hits += 1
+        self._remember(key, user, now)
+        return user
+
+    def put(self, key, user):
+        cache.set(_shared_key(key), user, self.timeout)
+        self._remember(key, user, time.monotonic())
+
+    def _remember(self, key, user, now):
+        with self._lock:
+            self._entries[key] = (user, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, keys):
+        keys = list(keys)
+        if not keys:
+            return
+        cache.delete_many([_shared_key(key) for key in keys])
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+            self.invalidations += len(keys)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.local_hits + self.shared_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'capacity': self.size,
+                'local_hits': self.local_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': (self.local_hits + self.shared_hits) / lookups if lookups else None,
+                'invalidations': self.invalidations,
+            }
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    global _token_cache
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                _token_cache = TokenCache(
+                    settings.TOKEN_AUTH_LRU_SIZE,
+                    settings.TOKEN_AUTH_LOCAL_TTL,
+                    settings.TOKEN_AUTH_CACHE_TIMEOUT,
+                )
+    return _token_cache
+
+
+def remember_token(token):
+    # Warm the cache when a token is issued; its first request skips the database.
+    get_token_cache().put(token.key, token.user)
+
+
+def invalidate_user_tokens(user_id):
+    keys = Token.objects.filter(user_id=user_id).values_list('key', flat=True)
+    get_token_cache().invalidate(keys)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        token_cache = get_token_cache()
+        user = token_cache.get(key)
+        if user is None:
+            try:
+                token = Token.objects.select_related('user').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            user = token.user
+            token_cache.put(key, user)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        # An unsaved Token stands in for request.auth without another query.
+        # Assigning `user` would ask the router for a write database.
+        token = Token(key=key, user_id=user.pk)
+        Token.user.field.set_cached_value(token, user)
+        return (user, token)
+
+
+@receiver(setting_changed)
+def reset_token_cache(setting, **kwargs):
+    global _token_cache
+    if setting.startswith('TOKEN_AUTH_'):
+        _token_cache = None
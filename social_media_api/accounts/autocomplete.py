@@ -0,0 +1,184 @@
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db.models import Max, Q
+from django.dispatch import receiver
+
+from .models import username_key
+
+
+# Username autocomplete.
+#
+# Each process keeps the usernames of all active users in memory, sorted by
+# (lowercased name, id) in parallel lists, so a prefix lookup is a binary
+# search plus a short walk: microseconds, no I/O. The index is loaded once and
+# then kept current incrementally, at most every AUTOCOMPLETE_SYNC_INTERVAL
+# seconds:
+#   - users with ids above the largest one seen are new;
+#   - saves and deletions (sign-ups, renames, deactivation) append the user
+#     id to a journal in the shared cache, numbered by a counter, and each
+#     process re-reads the ids it has not seen yet. Sign-ups are journaled
+#     too, since ids can commit out of order.
+# If the journal has been evicted or lapped by more than
+# AUTOCOMPLETE_JOURNAL_LENGTH entries, the index is reloaded.
+
+JOURNAL_SEQ_KEY = 'users:journal:seq'
+JOURNAL_ENTRY_KEY = 'users:journal:{}'
+JOURNAL_TIMEOUT = 24 * 60 * 60
+LOAD_CHUNK_SIZE = 10000
+
+User = get_user_model()
+
+
+def username_prefix_range(prefix):
+    # (lowest, highest or None) bounds, lowest inclusive and highest
+    # exclusive, of the username keys that start with prefix.
+    key = username_key(prefix)
+    stem = key.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return key, None
+    following = ord(stem[-1]) + 1
+    if 0xD800 <= following <= 0xDFFF:
+        following = 0xE000  # surrogates cannot be encoded
+    return key, stem[:-1] + chr(following)
+
+
+def record_user_change(user_id):
+    cache.add(JOURNAL_SEQ_KEY, 0, None)
+    seq = cache.incr(JOURNAL_SEQ_KEY)
+    cache.set(JOURNAL_ENTRY_KEY.format(seq), user_id, JOURNAL_TIMEOUT)
+
+
+class UsernameIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.keys = []
+        self.ids = array('q')
+        self.usernames = []
+        self.key_by_id = {}
+        self.max_id = 0
+        self.seq = None
+        self.missing_seq = None
+        self.synced_at = None
+
+    def search(self, prefix, limit):
+        # [(id, username), ...] of up to limit users whose names start with
+        # prefix, case-insensitively, in (lowercased name, id) order.
+        self.sync()
+        key = username_key(prefix)
+        with self._lock:
+            i = bisect_left(self.keys, key)
+            end = min(i + limit, len(self.keys))
+            matches = []
+            while i < end and self.keys[i].startswith(key):
+                matches.append((self.ids[i], self.usernames[i]))
+                i += 1
+            return matches
+
+    def sync(self):
+        now = time.monotonic()
+        if self.synced_at is not None and now - self.synced_at < settings.AUTOCOMPLETE_SYNC_INTERVAL:
+            return
+        with self._lock:
+            if self.synced_at is not None and now - self.synced_at < settings.AUTOCOMPLETE_SYNC_INTERVAL:
+                return
+            if self.seq is None or not self._catch_up():
+                self._load()
+            self.synced_at = time.monotonic()
+
+    def _load(self):
+        # Changes made while loading are in the journal after this seq.
+        self.seq = cache.get(JOURNAL_SEQ_KEY, 0)
+        self.missing_seq = None
+        rows = sorted(
+            (username_key(username), pk, username)
+            for pk, username in User.objects.filter(is_active=True)
+            .values_list('pk', 'username').iterator(chunk_size=LOAD_CHUNK_SIZE)
+        )
+        self.keys = [key for key, _, _ in rows]
+        self.ids = array('q', (pk for _, pk, _ in rows))
+        self.usernames = [username for _, _, username in rows]
+        self.key_by_id = {pk: key for key, pk, _ in rows}
+        self.max_id = User.objects.aggregate(max_id=Max('pk'))['max_id'] or 0
+
+    def _catch_up(self):
+        # Applies the journal and new users; False if the index must be reloaded.
+        seq = cache.get(JOURNAL_SEQ_KEY, 0)
+        if seq < self.seq or seq - self.seq > settings.AUTOCOMPLETE_JOURNAL_LENGTH:
+            return False
+        wanted = [JOURNAL_ENTRY_KEY.format(n) for n in range(self.seq + 1, seq + 1)]
+        found = cache.get_many(wanted)
+        changed = set()
+        for n, entry_key in enumerate(wanted, self.seq + 1):
+            if entry_key not in found:
+                # Either still being written or evicted; only the latter
+                # survives until the next sync.
+                if self.missing_seq == n:
+                    return False
+                self.missing_seq = n
+                break
+            changed.add(found[entry_key])
+            self.seq = n
+        rows = User.objects.filter(Q(pk__gt=self.max_id) | Q(pk__in=changed)).values_list(
+            'pk', 'username', 'is_active'
+        )
+        seen = set()
+        for pk, username, is_active in rows:
+            seen.add(pk)
+            self.max_id = max(self.max_id, pk)
+            self._remove(pk)
+            if is_active:
+                self._insert(pk, username)
+        for pk in changed - seen:
+            self._remove(pk)  # deleted
+        return True
+
+    def _position(self, key, pk):
+        i = bisect_left(self.keys, key)
+        while i < len(self.keys) and self.keys[i] == key and self.ids[i] < pk:
+            i += 1
+        return i
+
+    def _insert(self, pk, username):
+        key = username_key(username)
+        i = self._position(key, pk)
+        self.keys.insert(i, key)
+        self.ids.insert(i, pk)
+        self.usernames.insert(i, username)
+        self.key_by_id[pk] = key
+
+    def _remove(self, pk):
+        key = self.key_by_id.pop(pk, None)
+        if key is None:
+            return
+        i = self._position(key, pk)
+        del self.keys[i]
+        del self.ids[i]
+        del self.usernames[i]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_username_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = UsernameIndex()
+    return _index
+
+
+@receiver(setting_changed)
+def reset_username_index(setting, **kwargs):
+    global _index
+    if setting.startswith('AUTOCOMPLETE_'):
+        _index = None
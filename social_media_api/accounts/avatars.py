@@ -0,0 +1,197 @@
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.signals import setting_changed
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.dispatch import receiver
+from PIL import Image, ImageOps, UnidentifiedImageError
+from rest_framework import serializers
+
+from .authentication import invalidate_user_tokens
+
+logger = logging.getLogger(__name__)
+
+
+# Profile pictures.
+#
+# Uploads are spooled to a temporary file by Django's upload handler (see
+# FILE_UPLOAD_HANDLERS) and hashed chunk by chunk, so an image never has to fit
+# in memory. The original is stored under its SHA-256 and a worker pool renders
+# one square thumbnail per AVATAR_SIZES bucket next to it:
+#
+#     avatars/ab/ab12...ef.jpg         the upload
+#     avatars/ab/ab12...ef-64.webp     64x64 thumbnail
+#
+# Identical uploads share their files, and a name never changes content. A
+# user's avatar_digest is set once their thumbnails exist; until then
+# serializers hand out the original. The pool lives in this process, so
+# uploads still queued when it exits are picked up by rebuild_avatars.
+# Updates bypass save(), so cached token users are dropped by hand.
+
+AVATAR_DIR = 'avatars'
+ALLOWED_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+THUMBNAIL_FORMAT = 'WEBP'
+
+
+def original_name(digest, extension):
+    return f'{AVATAR_DIR}/{digest[:2]}/{digest}.{extension}'
+
+
+def thumbnail_name(digest, size):
+    return f'{AVATAR_DIR}/{digest[:2]}/{digest}-{size}.{THUMBNAIL_FORMAT.lower()}'
+
+
+def thumbnails_exist(digest):
+    return all(default_storage.exists(thumbnail_name(digest, size)) for size in settings.AVATAR_SIZES.values())
+
+
+def avatar_url(name, digest, bucket):
+    # Storage URL of a user's avatar in one AVATAR_SIZES bucket.
+    if digest:
+        return default_storage.url(thumbnail_name(digest, settings.AVATAR_SIZES[bucket]))
+    if name:
+        return default_storage.url(name)
+    return None
+
+
+def identify(upload):
+    # The file extension of a supported image; reads the header and checks
+    # the data stream without decoding the pixels.
+    if upload.size > settings.AVATAR_MAX_UPLOAD_SIZE:
+        raise serializers.ValidationError(
+            f'Profile pictures must be at most {settings.AVATAR_MAX_UPLOAD_SIZE} bytes.'
+        )
+    try:
+        with Image.open(upload) as image:
+            if image.format not in ALLOWED_FORMATS:
+                raise serializers.ValidationError(f'Unsupported image format: {image.format}.')
+            if image.width * image.height > settings.AVATAR_MAX_PIXELS:
+                raise serializers.ValidationError('The image has too many pixels.')
+            image.verify()
+            return ALLOWED_FORMATS[image.format]
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError):
+        raise serializers.ValidationError('Upload a valid image.')
+    finally:
+        upload.seek(0)
+
+
+def digest_upload(upload):
+    sha = hashlib.sha256()
+    for chunk in upload.chunks():
+        sha.update(chunk)
+    upload.seek(0)
+    return sha.hexdigest()
+
+
+def _save_once(name, content):
+    # Content-addressed: an existing file already holds these bytes.
+    if default_storage.exists(name):
+        return
+    saved = default_storage.save(name, content)
+    if saved != name:
+        # Another worker stored the same file in the meantime.
+        default_storage.delete(saved)
+
+
+def store_upload(upload):
+    # (storage name, digest) of the stored original.
+    extension = identify(upload)
+    digest = digest_upload(upload)
+    name = original_name(digest, extension)
+    _save_once(name, upload)
+    return name, digest
+
+
+def set_profile_picture(user, upload):
+    name, digest = store_upload(upload)
+    ready = digest if thumbnails_exist(digest) else ''
+    get_user_model().objects.filter(pk=user.pk).update(
+        profile_picture=name, avatar_digest=ready, profile_version=F('profile_version') + 1
+    )
+    invalidate_user_tokens(user.pk)
+    user.profile_picture.name = name
+    user.avatar_digest = ready
+    user.profile_version += 1
+    if not ready:
+        transaction.on_commit(lambda: schedule_thumbnails(user.pk, name, digest))
+
+
+def clear_profile_picture(user):
+    # The files stay: other users may have uploaded the same image.
+    get_user_model().objects.filter(pk=user.pk).update(
+        profile_picture='', avatar_digest='', profile_version=F('profile_version') + 1
+    )
+    invalidate_user_tokens(user.pk)
+    user.profile_picture.name = ''
+    user.avatar_digest = ''
+    user.profile_version += 1
+
+
+def render_thumbnails(name, digest):
+    sizes = sorted(settings.AVATAR_SIZES.values())
+    with default_storage.open(name) as source, Image.open(source) as image:
+        # JPEGs decode straight at the smallest scale that still covers the
+        # largest bucket.
+        image.draft('RGB', (sizes[-1], sizes[-1]))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+        for size in reversed(sizes):
+            target = thumbnail_name(digest, size)
+            if default_storage.exists(target):
+                continue
+            image = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+            buffer = BytesIO()
+            image.save(buffer, THUMBNAIL_FORMAT, quality=settings.AVATAR_THUMBNAIL_QUALITY)
+            _save_once(target, ContentFile(buffer.getvalue()))
+
+
+def process_avatar(user_id, name, digest):
+    render_thumbnails(name, digest)
+    # Unless the user has uploaded another picture since.
+    rows = get_user_model().objects.filter(pk=user_id, profile_picture=name)
+    if rows.update(avatar_digest=digest, profile_version=F('profile_version') + 1):
+        invalidate_user_tokens(user_id)
+
+
+def _process_in_worker(user_id, name, digest):
+    try:
+        process_avatar(user_id, name, digest)
+    except Exception:
+        logger.exception('Rendering thumbnails of %s failed.', name)
+        raise
+    finally:
+        close_old_connections()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_avatar_pool():
+    # Pillow releases the GIL while resizing and encoding, so threads render
+    # in parallel.
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=settings.AVATAR_WORKERS, thread_name_prefix='avatar')
+    return _pool
+
+
+def schedule_thumbnails(user_id, name, digest):
+    return get_avatar_pool().submit(_process_in_worker, user_id, name, digest)
+
+
+@receiver(setting_changed)
+def reset_avatar_pool(setting, **kwargs):
+    global _pool
+    if setting == 'AVATAR_WORKERS':
+        _pool = None
@@ -0,0 +1,125 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .authentication import invalidate_user_tokens
+
+
+# The follow graph.
+#
+# Follow(from_customuser=author, to_customuser=reader) means reader follows
+# author. Each user carries followers_count and following_count so profiles
+# never touch the graph; follow() and unfollow() change a row and both counts
+# in one transaction, and only when the row actually changed, so repeated or
+# racing requests cannot drift them. Rows written any other way (bulk loads)
+# need recount_follows afterwards.
+#
+# relationships() answers a batch of "do I follow them, do they follow me"
+# with one query over the through table's (from, to) indexes. With
+# RELATIONSHIPS_CACHE set, a user's whole following and follower id sets are
+# cached instead while they have at most MAX_SIZE entries; users who keep
+# asking are then answered without touching the database.
+
+User = get_user_model()
+Follow = User.followers.through
+
+FOLLOWING_CACHE_KEY = 'follows:following:{}'
+FOLLOWERS_CACHE_KEY = 'follows:followers:{}'
+
+
+def _adjust_counts(user_id, author_id, delta):
+    User.objects.filter(pk=author_id).update(followers_count=F('followers_count') + delta)
+    User.objects.filter(pk=user_id).update(following_count=F('following_count') + delta)
+
+    def drop_cached_users():
+        # The updates bypass save(); drop the users cached by token authentication.
+        invalidate_user_tokens(user_id)
+        invalidate_user_tokens(author_id)
+        if settings.RELATIONSHIPS_CACHE is not None:
+            cache.delete_many([FOLLOWING_CACHE_KEY.format(user_id), FOLLOWERS_CACHE_KEY.format(author_id)])
+
+    transaction.on_commit(drop_cached_users)
+
+
+def follow(user, author):
+    # True if user did not follow author before.
+    with transaction.atomic():
+        _, created = Follow.objects.get_or_create(from_customuser_id=author.pk, to_customuser_id=user.pk)
+        if created:
+            _adjust_counts(user.pk, author.pk, 1)
+    return created
+
+
+def unfollow(user, author):
+    # True if user followed author before.
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(from_customuser_id=author.pk, to_customuser_id=user.pk).delete()
+        if deleted:
+            _adjust_counts(user.pk, author.pk, -1)
+    return bool(deleted)
+
+
+afollow = sync_to_async(follow)
+aunfollow = sync_to_async(unfollow)
+
+
+def followers_of(user_id):
+    # Follow rows of user_id's followers; the user is `to_customuser`.
+    return Follow.objects.filter(from_customuser_id=user_id)
+
+
+def followed_by(user_id):
+    # Follow rows of the users user_id follows; the user is `from_customuser`.
+    return Follow.objects.filter(to_customuser_id=user_id)
+
+
+def _cached_ids(key, size, rows, field):
+    # The cached id set of one side of a user's follows, loaded if it is small
+    # enough to cache; None when the caller has to query.
+    options = settings.RELATIONSHIPS_CACHE
+    if options is None:
+        return None
+    ids = cache.get(key)
+    if ids is None and size <= options['MAX_SIZE']:
+        ids = frozenset(rows.values_list(field, flat=True))
+        cache.set(key, ids, options['TIMEOUT'])
+    return ids
+
+
+def relationships(user, ids):
+    # (ids user follows, ids following user), both restricted to ids.
+    ids = [pk for pk in ids if pk != user.pk]
+    following = _cached_ids(
+        FOLLOWING_CACHE_KEY.format(user.pk), user.following_count, followed_by(user.pk), 'from_customuser_id'
+    )
+    followers = _cached_ids(
+        FOLLOWERS_CACHE_KEY.format(user.pk), user.followers_count, followers_of(user.pk), 'to_customuser_id'
+    )
+    condition = Q()
+    if following is None:
+        condition |= Q(to_customuser_id=user.pk, from_customuser_id__in=ids)
+    if followers is None:
+        condition |= Q(from_customuser_id=user.pk, to_customuser_id__in=ids)
+    following = set(following or ()).intersection(ids)
+    followers = set(followers or ()).intersection(ids)
+    if condition and ids:
+        for from_id, to_id in Follow.objects.filter(condition).values_list('from_customuser_id', 'to_customuser_id'):
+            if to_id == user.pk:
+                following.add(from_id)
+            else:
+                followers.add(to_id)
+    return following, followers
+
+
+def recount_follows(user_ids=None):
+    # Recompute the counts from the graph, for all users or the given ones.
+    def count(field):
+        rows = Follow.objects.filter(**{field: OuterRef('pk')}).order_by().values(field)
+        return Coalesce(Subquery(rows.annotate(n=Count('pk')).values('n')), 0)
+
+    users = User.objects.all() if user_ids is None else User.objects.filter(pk__in=user_ids)
+    return users.update(followers_count=count('from_customuser'), following_count=count('to_customuser'))
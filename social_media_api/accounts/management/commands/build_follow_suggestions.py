@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.suggestions import build_suggestions
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute friends-of-friends follow suggestions. Meant to run '
+        'periodically, e.g. nightly from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Only rebuild this user id (repeatable).')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Users per query (default: FOLLOW_SUGGESTIONS_CHUNK_SIZE).')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        stored = build_suggestions(options['user_ids'], options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {stored} suggestion(s) in {time.perf_counter() - started:.1f}s.'
+        ))
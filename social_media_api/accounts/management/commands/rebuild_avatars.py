@@ -0,0 +1,50 @@
+from concurrent.futures import wait
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from rest_framework import serializers
+
+from accounts.avatars import AVATAR_DIR, schedule_thumbnails, store_upload
+
+
+class Command(BaseCommand):
+    help = (
+        'Render missing avatar thumbnails, e.g. after changing AVATAR_SIZES or a '
+        'restart with uploads still queued. Pictures stored before the avatar '
+        'pipeline are moved to content-addressed names first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Only process this user id (repeatable).')
+        parser.add_argument('--all', action='store_true',
+                            help='Also process users whose thumbnails are marked ready.')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        users = User.objects.exclude(profile_picture='').exclude(profile_picture=None).order_by('pk')
+        if options['user_ids']:
+            users = users.filter(pk__in=options['user_ids'])
+        if not options['all']:
+            users = users.filter(avatar_digest='')
+        jobs, skipped = [], 0
+        for user_id, name in users.values_list('pk', 'profile_picture').iterator():
+            if not name.startswith(f'{AVATAR_DIR}/'):
+                try:
+                    with default_storage.open(name) as legacy:
+                        name, _ = store_upload(legacy)
+                except (OSError, serializers.ValidationError) as exc:
+                    self.stderr.write(f'User {user_id}: skipping {name}: {exc}')
+                    skipped += 1
+                    continue
+                User.objects.filter(pk=user_id).update(profile_picture=name, avatar_digest='')
+            digest = name.rsplit('/', 1)[-1].split('.', 1)[0]
+            jobs.append(schedule_thumbnails(user_id, name, digest))
+        done, _ = wait(jobs)
+        failed = [job.exception() for job in done if job.exception() is not None]
+        for exc in failed:
+            self.stderr.write(f'Rendering failed: {exc}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {len(jobs) - len(failed)} avatar(s); {len(failed) + skipped} failed.'
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from accounts.follows import recount_follows
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute followers_count and following_count from the follow graph, '
+        'e.g. after follows were bulk-loaded around accounts.follows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Only recount this user id (repeatable).')
+
+    def handle(self, *args, **options):
+        updated = recount_follows(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Recounted follows of {updated} user(s).'))
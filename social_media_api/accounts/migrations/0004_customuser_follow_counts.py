@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:32
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_follow_counts(apps, schema_editor):
+    # Same as accounts.follows.recount_follows at the time of writing.
+    User = apps.get_model('accounts', 'CustomUser')
+    Follow = User.followers.through
+
+    def count(field):
+        rows = Follow.objects.filter(**{field: OuterRef('pk')}).order_by().values(field)
+        return Coalesce(Subquery(rows.annotate(n=Count('pk')).values('n')), 0)
+
+    User.objects.update(followers_count=count('from_customuser'), following_count=count('to_customuser'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_customuser_avatar_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='followers_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_follow_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+def fill_username_keys(apps, schema_editor):
+    # Same as accounts.models.username_key at the time of writing; SQL LOWER()
+    # only folds ASCII on some backends.
+    User = apps.get_model('accounts', 'CustomUser')
+    users = []
+    for user in User.objects.only('pk', 'username').iterator(chunk_size=2000):
+        user.username_key = user.username.lower()
+        users.append(user)
+        if len(users) == 2000:
+            User.objects.bulk_update(users, ['username_key'])
+            users = []
+    User.objects.bulk_update(users, ['username_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_followsuggestion'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='username_key',
+            field=models.CharField(default='', editable=False, max_length=300),
+        ),
+        migrations.RunPython(fill_username_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['username_key', 'id'], name='user_username_key_idx'),
+        ),
+    ]
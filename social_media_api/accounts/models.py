@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.contrib.auth.models import Group, Permission
@@ -5,10 +6,29 @@ from django.utils.translation import gettext_lazy as _
 
 # Create your models here.
 
+# What posts and comments show of their author.
+PROFILE_FIELDS = {'username', 'profile_picture', 'avatar_digest'}
+
+
+def username_key(username):
+    # The case-insensitive form usernames are sorted and matched by, both in
+    # the database (CustomUser.username_key) and in memory (autocomplete.py).
+    return username.lower()
+
 class CustomUser(AbstractUser):
     bio = models.TextField(blank=True)
+    # username_key(username), kept by save(); lowercasing can lengthen a name.
+    username_key = models.CharField(max_length=300, editable=False, default='')
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    # SHA-256 of profile_picture once its thumbnails exist (accounts/avatars.py).
+    avatar_digest = models.CharField(max_length=64, blank=True, editable=False)
     followers = models.ManyToManyField('self', symmetrical=False, blank=True, related_name='following')
+    # Sizes of followers and following, kept by accounts/follows.py.
+    followers_count = models.PositiveIntegerField(default=0, editable=False, db_index=True)
+    following_count = models.PositiveIntegerField(default=0, editable=False)
+    # Bumped whenever the name or avatar shown on the user's posts and
+    # comments may have changed; part of their ETags.
+    profile_version = models.PositiveIntegerField(default=0, editable=False)
     groups = models.ManyToManyField(
         Group,
         verbose_name=_('groups'),
@@ -29,5 +49,39 @@ class CustomUser(AbstractUser):
         related_query_name="user",
     )
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Case-insensitive username prefixes and the directory's order.
+            models.Index(fields=['username_key', 'id'], name='user_username_key_idx'),
+        ]
+
+    def __str__(self):
+        return self.username
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        self.username_key = username_key(self.username)
+        if update_fields is not None and 'username' in update_fields:
+            update_fields = kwargs['update_fields'] = {*update_fields, 'username_key'}
+        if not self._state.adding and (update_fields is None or PROFILE_FIELDS.intersection(update_fields)):
+            self.profile_version += 1
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'profile_version'}
+        super().save(*args, **kwargs)
+
+
+class FollowSuggestion(models.Model):
+    # Precomputed "people you may know" row (accounts/suggestions.py): `suggested`
+    # is followed by `mutual` of the users `user` follows.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='follow_suggestions')
+    suggested = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    mutual = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'rank'], name='unique_suggestion_rank'),
+        ]
+
     def __str__(self):
-        return self.username
\ No newline at end of file
+        return f'{self.user_id} -> {self.suggested_id}'
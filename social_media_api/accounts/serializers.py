@@ -1,22 +1,80 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model, authenticate
+from django.db import transaction
 from rest_framework.authtoken.models import Token
+from .avatars import avatar_url, identify, set_profile_picture
+from .models import FollowSuggestion
 
-User = get_user_model().objects.create_user
+User = get_user_model()
+
+class AvatarField(serializers.Field):
+    # URL of a user's avatar in one AVATAR_SIZES bucket; the original until
+    # its thumbnails are ready. `source` is the user ('*' for the object itself).
+    def __init__(self, bucket, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+        self.bucket = bucket
+
+    @property
+    def sparse_sources(self):
+        # The columns sparse querysets must keep (posts/sparse.py).
+        prefix = '' if self.source == '*' else f'{self.source}.'
+        return (f'{prefix}profile_picture', f'{prefix}avatar_digest')
+
+    def to_representation(self, user):
+        url = avatar_url(user.profile_picture.name, user.avatar_digest, self.bucket)
+        request = self.context.get('request')
+        if url is not None and request is not None:
+            return request.build_absolute_uri(url)
+        return url
 
 class UserSerializer(serializers.ModelSerializer):
+    avatar = AvatarField('medium', source='*')
+
     class Meta:
         model = User
-        fields = ('id', 'username', 'email', 'password', 'bio', 'profile_picture', 'followers')
+        # Follow lists have their own paginated endpoints (users/<id>/followers/).
+        fields = ('id', 'username', 'email', 'password', 'bio', 'profile_picture', 'avatar', 'followers_count', 'following_count')
         extra_kwargs = {'password': {'write_only': True}}
 
+    def validate_profile_picture(self, value):
+        # Formats and sizes the avatar pipeline accepts, before any user exists.
+        if value is not None:
+            identify(value)
+        return value
+
+    @transaction.atomic
     def create(self, validated_data):
         password = validated_data.pop('password')
+        picture = validated_data.pop('profile_picture', None)
         user = User.objects.create_user(**validated_data)
         user.set_password(password)
         user.save()
+        if picture is not None:
+            set_profile_picture(user, picture)
         return user
 
+class UserListSerializer(serializers.ModelSerializer):
+    avatar = AvatarField('small', source='*')
+
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'avatar')
+
+class FollowSuggestionSerializer(serializers.ModelSerializer):
+    user = UserListSerializer(source='suggested', read_only=True)
+
+    class Meta:
+        model = FollowSuggestion
+        fields = ('user', 'mutual')
+
+class ProfilePictureSerializer(serializers.Serializer):
+    profile_picture = serializers.FileField()
+
+    def validate_profile_picture(self, value):
+        identify(value)
+        return value
+
 class LoginSerializer(serializers.Serializer):
     username = serializers.CharField()
     password = serializers.CharField()
@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import get_token_cache, invalidate_user_tokens
+from .autocomplete import record_user_change
+
+
+# Cached token users (accounts/authentication.py) are dropped right away and
+# again after commit, so a request racing the transaction cannot leave the old
+# user cached.
+
+def _invalidate_now_and_on_commit(invalidate, using):
+    invalidate()
+    transaction.on_commit(invalidate, using=using)
+
+
+@receiver(post_save, sender=get_user_model())
+def drop_cached_user(sender, instance, using, created, update_fields, **kwargs):
+    # Password changes, deactivation and profile edits; logging in through a
+    # session only touches last_login.
+    if created or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    user_id = instance.pk
+    _invalidate_now_and_on_commit(lambda: invalidate_user_tokens(user_id), using)
+
+
+@receiver(post_delete, sender=Token)
+def drop_cached_token(sender, instance, using, **kwargs):
+    # Logout, and users deleted along with their tokens. The key is the
+    # primary key, which delete() clears before on_commit runs.
+    key = instance.key
+    _invalidate_now_and_on_commit(lambda: get_token_cache().invalidate([key]), using)
+
+
+@receiver(post_save, sender=get_user_model())
+def journal_user_change(sender, instance, using, update_fields, **kwargs):
+    # Keeps every process's username index current (accounts/autocomplete.py).
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    user_id = instance.pk
+    transaction.on_commit(lambda: record_user_change(user_id), using=using)
+
+
+@receiver(post_delete, sender=get_user_model())
+def journal_user_deletion(sender, instance, using, **kwargs):
+    user_id = instance.pk
+    transaction.on_commit(lambda: record_user_change(user_id), using=using)
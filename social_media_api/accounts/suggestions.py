@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+
+from .follows import Follow
+from .models import FollowSuggestion
+
+
+# Friends-of-friends follow suggestions.
+#
+# A periodic job (build_follow_suggestions) ranks, for every user, the people
+# followed by the people they follow and do not follow yet, by how many of
+# their followees follow them (ties: more followers first). One grouped
+# self-join of the follow table per chunk of users does the counting in the
+# database, walking the through table's indexes; the best
+# FOLLOW_SUGGESTIONS_COUNT rows per user replace that user's FollowSuggestion
+# rows, so serving them is a range read of the (user, rank) index.
+
+User = get_user_model()
+
+
+def _ranked_candidates_sql(chunk_size):
+    quote = connection.ops.quote_name
+    follow = quote(Follow._meta.db_table)
+    user = quote(User._meta.db_table)
+    placeholders = ', '.join(['%s'] * chunk_size)
+    # f1: user follows middle. f2: middle follows candidate. f3: user already
+    # follows candidate.
+    return f'''
+        SELECT user_id, candidate_id, mutual FROM (
+            SELECT pairs.user_id, pairs.candidate_id, pairs.mutual,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY pairs.user_id
+                       ORDER BY pairs.mutual DESC, candidate.followers_count DESC, pairs.candidate_id
+                   ) AS position
+            FROM (
+                SELECT f1.to_customuser_id AS user_id,
+                       f2.from_customuser_id AS candidate_id,
+                       COUNT(*) AS mutual
+                FROM {follow} f1
+                JOIN {follow} f2 ON f2.to_customuser_id = f1.from_customuser_id
+                WHERE f1.to_customuser_id IN ({placeholders})
+                  AND f2.from_customuser_id <> f1.to_customuser_id
+                GROUP BY f1.to_customuser_id, f2.from_customuser_id
+                HAVING NOT EXISTS (
+                    SELECT 1 FROM {follow} f3
+                    WHERE f3.from_customuser_id = f2.from_customuser_id
+                      AND f3.to_customuser_id = f1.to_customuser_id
+                )
+            ) pairs
+            JOIN {user} candidate ON candidate.id = pairs.candidate_id
+            WHERE candidate.is_active = %s
+        ) ranked
+        WHERE position <= %s
+        ORDER BY user_id, position
+    '''
+
+
+def compute_suggestions(user_ids, count=None):
+    # {user_id: [(suggested_id, mutual), ...]}, best first.
+    count = settings.FOLLOW_SUGGESTIONS_COUNT if count is None else count
+    user_ids = list(user_ids)
+    suggestions = {user_id: [] for user_id in user_ids}
+    if not user_ids:
+        return suggestions
+    with connection.cursor() as cursor:
+        cursor.execute(_ranked_candidates_sql(len(user_ids)), [*user_ids, True, count])
+        for user_id, suggested_id, mutual in cursor.fetchall():
+            suggestions[user_id].append((suggested_id, mutual))
+    return suggestions
+
+
+def store_suggestions(suggestions):
+    with transaction.atomic():
+        FollowSuggestion.objects.filter(user_id__in=list(suggestions)).delete()
+        FollowSuggestion.objects.bulk_create(
+            FollowSuggestion(user_id=user_id, suggested_id=suggested_id, mutual=mutual, rank=rank)
+            for user_id, rows in suggestions.items()
+            for rank, (suggested_id, mutual) in enumerate(rows, 1)
+        )
+
+
+def build_suggestions(user_ids=None, chunk_size=None):
+    # Recompute the suggestions of all users, or the given ones; returns how
+    # many suggestion rows were stored.
+    chunk_size = chunk_size or settings.FOLLOW_SUGGESTIONS_CHUNK_SIZE
+    if user_ids is None:
+        user_ids = User.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=chunk_size)
+    stored, chunk = 0, []
+    for user_id in user_ids:
+        chunk.append(user_id)
+        if len(chunk) == chunk_size:
+            stored += _build_chunk(chunk)
+            chunk = []
+    return stored + _build_chunk(chunk)
+
+
+def _build_chunk(user_ids):
+    if not user_ids:
+        return 0
+    suggestions = compute_suggestions(user_ids)
+    store_suggestions(suggestions)
+    return sum(len(rows) for rows in suggestions.values())
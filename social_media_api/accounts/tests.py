@@ -1,3 +1,396 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import quote
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, router
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+
+from social_media_api.db_router import RoutingState, _routing
+
+from . import avatars
+from .authentication import CachedTokenAuthentication, get_token_cache
+from .follows import follow, unfollow
+from .models import FollowSuggestion
+from .suggestions import build_suggestions, compute_suggestions
+
+User = get_user_model()
+
+
+class CachedTokenAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        get_token_cache().invalidate(Token.objects.values_list('key', flat=True))
+        self.user = User.objects.create_user('reader', password='secret')
+        self.token = Token.objects.create(user=self.user)
+
+    def authenticate(self, key=None):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Token {key or self.token.key}')
+        return CachedTokenAuthentication().authenticate(request)
+
+    def test_cached_token_is_not_routed(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            user, token = self.authenticate()
+            self.assertEqual(token.user, user)
+        # A database is only picked when a token is bound to one through the router.
+        self.assertIsNone(token._state.db)
+        self.assertEqual((user.pk, token.key), (self.user.pk, self.token.key))
+
+    def test_token_request_is_not_a_write(self):
+        self.authenticate()
+        request = APIRequestFactory().get('/')
+        state = RoutingState(request, use_replicas=True)
+        reset = _routing.set(state)
+        try:
+            with mock.patch.object(router, 'db_for_write', wraps=router.db_for_write) as db_for_write:
+                self.authenticate()
+        finally:
+            _routing.reset(reset)
+        db_for_write.assert_not_called()
+        self.assertFalse(state.wrote)
+
+    def profile_token_queries(self):
+        # The profile response, and the token lookups it needed.
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/accounts/profile/')
+        return response, [query for query in queries if 'authtoken_token' in query['sql']]
+
+    def test_token_users_are_cached(self):
+        self.profile_token_queries()
+        response, lookups = self.profile_token_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(lookups, [])
+
+    def test_logout_drops_the_token(self):
+        self.profile_token_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/api/accounts/logout/').status_code, 204)
+        response, _ = self.profile_token_queries()
+        self.assertEqual(response.status_code, 401)
+
+    def test_user_changes_reload_the_user(self):
+        self.profile_token_queries()
+        self.user.set_password('changed')
+        self.user.save()
+        _, lookups = self.profile_token_queries()
+        self.assertTrue(lookups)
+        _, lookups = self.profile_token_queries()
+        self.assertEqual(lookups, [])
+
+        self.user.is_active = False
+        self.user.save()
+        response, _ = self.profile_token_queries()
+        self.assertEqual(response.status_code, 401)
+
+    def test_metrics_are_for_admins(self):
+        self.profile_token_queries()
+        self.assertEqual(self.client.get('/api/accounts/token/metrics/').status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/api/accounts/token/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(response.json()['misses'], 1)
+
+
+@override_settings(AUTOCOMPLETE_SYNC_INTERVAL=0)
+class UserDirectoryTests(TransactionTestCase):
+    # The autocomplete index learns about changes from on_commit callbacks.
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user('reader')
+        for username in ['bob', 'Émile', 'ÉMILIE', 'emma', 'alice', 'Alicia', 'inactive']:
+            User.objects.create_user(username, is_active=username != 'inactive')
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def directory(self, url):
+        names = []
+        while url:
+            page = self.client.get(url).json()
+            names += [user['username'] for user in page['results']]
+            url = page['next']
+        return names
+
+    def autocomplete(self, prefix):
+        response = self.client.get('/api/accounts/autocomplete/', {'q': prefix})
+        return [user['username'] for user in response.json()]
+
+    def test_directory_pages(self):
+        self.assertEqual(
+            self.directory('/api/accounts/users/?page_size=2'),
+            ['alice', 'Alicia', 'bob', 'emma', 'reader', 'Émile', 'ÉMILIE'],
+        )
+
+    def test_prefix_matching(self):
+        cases = {
+            'ALI': ['alice', 'Alicia'],
+            'émil': ['Émile', 'ÉMILIE'],
+            'ÉMILI': ['ÉMILIE'],
+            'e': ['emma'],
+            'inactive': [],
+            'z\U0010ffff': [],
+        }
+        for prefix, names in cases.items():
+            with self.subTest(prefix=prefix):
+                self.assertEqual(self.directory(f'/api/accounts/users/?page_size=1&q={quote(prefix)}'), names)
+                self.assertEqual(self.autocomplete(prefix), names)
+
+    def test_prefix_of_the_last_code_point(self):
+        User.objects.create_user('\U0010ffff\U0010ffffx')
+        self.assertEqual(self.directory(f'/api/accounts/users/?q={quote(chr(0x10ffff))}'), ['\U0010ffff\U0010ffffx'])
+
+    def test_autocomplete_follows_changes(self):
+        self.assertEqual(self.autocomplete('al'), ['alice', 'Alicia'])
+        User.objects.create_user('Albert')
+        self.assertEqual(self.autocomplete('al'), ['Albert', 'alice', 'Alicia'])
+        alice = User.objects.get(username='alice')
+        alice.username = 'zoe'
+        alice.save(update_fields=['username'])
+        self.assertEqual(self.autocomplete('al'), ['Albert', 'Alicia'])
+        self.assertEqual(self.directory('/api/accounts/users/?q=zo'), ['zoe'])
+        User.objects.filter(username='Alicia').get().delete()
+        self.assertEqual(self.autocomplete('al'), ['Albert'])
+        self.assertEqual(self.directory('/api/accounts/users/?q=al'), ['Albert'])
+
+
+class AvatarUploadTests(TransactionTestCase):
+    # Thumbnails are rendered by worker threads, which need committed rows.
+    client_class = APIClient
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        # A pool of this test's own, shut down to wait for its work.
+        self.enterContext(override_settings(MEDIA_ROOT=media, AVATAR_WORKERS=1))
+
+    def image(self, fmt, size=(300, 200), name='avatar'):
+        buffer = BytesIO()
+        Image.new('RGB', size, (200, 30, 30)).save(buffer, fmt)
+        return SimpleUploadedFile(f'{name}.{fmt.lower()}', buffer.getvalue())
+
+    def register(self, picture):
+        return self.client.post('/api/accounts/register/', {
+            'username': 'newcomer', 'password': 'secret', 'email': 'newcomer@example.com', 'profile_picture': picture,
+        }, format='multipart')
+
+    def test_rejected_pictures_create_no_user(self):
+        pictures = [self.image('BMP'), self.image('TIFF'), SimpleUploadedFile('avatar.png', b'not an image')]
+        for picture in pictures:
+            with self.subTest(picture=picture.name):
+                response = self.register(picture)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('profile_picture', response.json())
+                self.assertFalse(User.objects.filter(username='newcomer').exists())
+        with override_settings(AVATAR_MAX_UPLOAD_SIZE=100):
+            response = self.register(self.image('PNG'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('profile_picture', response.json())
+        self.assertFalse(User.objects.exists())
+
+    def test_registration_renders_thumbnails(self):
+        response = self.register(self.image('PNG'))
+        self.assertEqual(response.status_code, 201)
+        avatars.get_avatar_pool().shutdown(wait=True)
+
+        user = User.objects.get(username='newcomer')
+        self.assertEqual(len(user.avatar_digest), 64)
+        self.assertEqual(user.profile_picture.name, avatars.original_name(user.avatar_digest, 'png'))
+        for size in settings.AVATAR_SIZES.values():
+            with default_storage.open(avatars.thumbnail_name(user.avatar_digest, size)) as thumbnail:
+                self.assertEqual(Image.open(thumbnail).size, (size, size))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {response.json()["token"]}')
+        profile = self.client.get('/api/accounts/profile/').json()
+        self.assertTrue(profile['avatar'].endswith(f'-{settings.AVATAR_SIZES["medium"]}.webp'))
+
+
+class RelationshipsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.me = User.objects.create_user('me')
+        self.followed, self.follower, self.mutual, self.stranger = [
+            User.objects.create_user(name) for name in ('followed', 'follower', 'mutual', 'stranger')
+        ]
+        follow(self.me, self.followed)
+        follow(self.follower, self.me)
+        follow(self.me, self.mutual)
+        follow(self.mutual, self.me)
+        self.me.refresh_from_db()
+        self.client.force_authenticate(self.me)
+
+    def relationships(self, ids, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.get('/api/accounts/relationships/', {'ids': ','.join(map(str, ids))})
+        self.assertEqual(response.status_code, 200)
+        return {row['id']: (row['following'], row['followed_by']) for row in response.json()}
+
+    def test_batch(self):
+        missing = self.stranger.pk + 100
+        users = [self.followed, self.follower, self.mutual, self.stranger, self.me]
+        result = self.relationships([user.pk for user in users] + [self.followed.pk, missing], 1)
+        self.assertEqual(result, {
+            self.followed.pk: (True, False),
+            self.follower.pk: (False, True),
+            self.mutual.pk: (True, True),
+            self.stranger.pk: (False, False),
+            self.me.pk: (False, False),
+            missing: (False, False),
+        })
+
+    def test_limits(self):
+        for ids in ['1,two', '1,99999999999999999999', str(2 ** 63), '0', '-1']:
+            with self.subTest(ids=ids):
+                self.assertEqual(self.client.get('/api/accounts/relationships/', {'ids': ids}).status_code, 400)
+        self.assertEqual(self.client.get('/api/accounts/relationships/', {'ids': str(2 ** 63 - 1)}).status_code, 200)
+        with override_settings(RELATIONSHIPS_MAX_IDS=2):
+            self.assertEqual(self.client.get('/api/accounts/relationships/', {'ids': '1,2,3'}).status_code, 400)
+            self.assertEqual(self.client.get('/api/accounts/relationships/', {'ids': '1,2,1'}).status_code, 200)
+        self.assertEqual(self.relationships([], 0), {})
+
+    @override_settings(RELATIONSHIPS_CACHE={'TIMEOUT': 60, 'MAX_SIZE': 10})
+    def test_cached_id_sets_follow_changes(self):
+        self.relationships([self.followed.pk], 2)
+        self.assertEqual(self.relationships([self.followed.pk, self.mutual.pk], 0)[self.mutual.pk], (True, True))
+        with self.captureOnCommitCallbacks(execute=True):
+            unfollow(self.me, self.followed)
+        self.assertEqual(self.relationships([self.followed.pk], 1), {self.followed.pk: (False, False)})
+
+    def test_missing_users(self):
+        missing = self.stranger.pk + 100
+        for url in [f'/api/accounts/users/{missing}/followers/', f'/api/accounts/users/{missing}/following/']:
+            self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.post(f'/api/accounts/follow/{missing}/').status_code, 404)
+        self.assertEqual(self.client.post(f'/api/accounts/unfollow/{missing}/').status_code, 404)
+
+
+class FollowCountTests(APITestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('reader')
+        self.author = User.objects.create_user('author')
+        self.client.force_authenticate(self.reader)
+
+    def counts(self, user):
+        user.refresh_from_db()
+        return user.followers_count, user.following_count
+
+    def test_counts_follow_and_unfollow(self):
+        for _ in range(2):
+            # Following again changes nothing.
+            self.assertEqual(self.client.post(f'/api/accounts/follow/{self.author.pk}/').status_code, 200)
+            self.assertEqual((self.counts(self.author), self.counts(self.reader)), ((1, 0), (0, 1)))
+        self.assertFalse(follow(self.reader, self.author))
+        self.assertEqual(self.counts(self.author), (1, 0))
+
+        self.client.force_authenticate(User.objects.get(pk=self.reader.pk))
+        self.assertEqual(self.client.get('/api/accounts/profile/').json()['following_count'], 1)
+
+        for _ in range(2):
+            self.assertEqual(self.client.post(f'/api/accounts/unfollow/{self.author.pk}/').status_code, 200)
+            self.assertEqual((self.counts(self.author), self.counts(self.reader)), ((0, 0), (0, 0)))
+
+    def walk(self, url):
+        names, pages = [], 0
+        while url:
+            body = self.client.get(url).json()
+            names += [user['username'] for user in body['results']]
+            url, pages = body['next'], pages + 1
+        return names, pages
+
+    def test_follow_lists_are_cursor_paged(self):
+        fans = [User.objects.create_user(f'fan{i}') for i in range(5)]
+        for fan in fans:
+            follow(fan, self.author)
+            follow(self.reader, fan)
+        # Newest follows first.
+        expected = [fan.username for fan in reversed(fans)]
+        self.assertEqual(self.walk(f'/api/accounts/users/{self.author.pk}/followers/?page_size=2'), (expected, 3))
+        self.assertEqual(self.walk(f'/api/accounts/users/{self.reader.pk}/following/?page_size=2'), (expected, 3))
+
+        first = self.client.get(f'/api/accounts/users/{self.author.pk}/followers/?page_size=2').json()
+        second = self.client.get(first['next']).json()
+        previous = self.client.get(second['previous']).json()
+        self.assertEqual(previous['results'], first['results'])
+        self.assertEqual(self.client.get('/api/accounts/users/999/followers/').status_code, 404)
+
+
+class FollowCountMigrationTests(TransactionTestCase):
+    before = [('accounts', '0003_customuser_avatar_digest')]
+    after = [('accounts', '0004_customuser_follow_counts')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_existing_follows_are_counted(self):
+        OldUser = self.migrate(self.before).get_model('accounts', 'CustomUser')
+        author, reader, loner = [OldUser.objects.create(username=name) for name in ('author', 'reader', 'loner')]
+        OldUser.followers.through.objects.bulk_create([
+            OldUser.followers.through(from_customuser=author, to_customuser=reader),
+            OldUser.followers.through(from_customuser=reader, to_customuser=author),
+            OldUser.followers.through(from_customuser=author, to_customuser=loner),
+        ])
+
+        NewUser = self.migrate(self.after).get_model('accounts', 'CustomUser')
+        counts = {
+            user.username: (user.followers_count, user.following_count) for user in NewUser.objects.all()
+        }
+        self.assertEqual(counts, {'author': (2, 1), 'reader': (1, 1), 'loner': (0, 1)})
+
+
+class FollowSuggestionTests(APITestCase):
+    def setUp(self):
+        self.me, self.alice, self.bob, self.carol, self.dave, self.erin, self.gone = [
+            User.objects.create_user(name) for name in ('me', 'alice', 'bob', 'carol', 'dave', 'erin', 'gone')
+        ]
+        User.objects.filter(pk=self.gone.pk).update(is_active=False)
+        follow(self.me, self.alice)
+        follow(self.me, self.bob)
+        # What the people I follow follow: carol twice, dave once, and users
+        # that must never be suggested: me, bob (already followed), gone.
+        for user, author in [(self.alice, self.carol), (self.bob, self.carol), (self.alice, self.dave),
+                             (self.alice, self.me), (self.bob, self.me), (self.alice, self.bob),
+                             (self.alice, self.gone)]:
+            follow(user, author)
+        self.client.force_authenticate(self.me)
+
+    def suggestions(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/accounts/suggestions/')
+        return [(row['user']['username'], row['mutual']) for row in response.json()]
+
+    def test_ranked_friends_of_friends(self):
+        # Several chunks, each user's rows computed once.
+        stored = build_suggestions(chunk_size=2)
+        self.assertEqual(stored, FollowSuggestion.objects.count())
+        self.assertEqual(self.suggestions(), [('carol', 2), ('dave', 1)])
+        self.assertEqual(compute_suggestions([self.erin.pk]), {self.erin.pk: []})
+
+    def test_users_followed_since_the_last_run_are_hidden(self):
+        build_suggestions([self.me.pk])
+        follow(self.me, self.carol)
+        self.assertEqual(self.suggestions(), [('dave', 1)])
+
+    def test_rebuild_replaces_suggestions(self):
+        build_suggestions([self.me.pk])
+        with override_settings(FOLLOW_SUGGESTIONS_COUNT=1):
+            call_command('build_follow_suggestions', stdout=StringIO())
+        self.assertEqual(self.suggestions(), [('carol', 2)])
@@ -1,12 +1,23 @@
 from django.urls import path
-from .views import UserCreate, UserLogin, GetToken, UserProfile, FollowUser, UnfollowUser
+from .views import UserCreate, UserLogin, GetToken, Logout, TokenCacheMetrics, UserProfile, ProfilePicture, FollowUser, UnfollowUser, AsyncFollowUser, AsyncUnfollowUser, ListUsers, FollowersList, FollowingList, Relationships, FollowSuggestions, UsernameAutocomplete
 
 urlpatterns = [
     path('register/', UserCreate.as_view(), name='user_register'),
     path('login/', UserLogin.as_view(), name='user_login'),
     path('token/', GetToken.as_view(), name='get_token'),
+    path('logout/', Logout.as_view(), name='user_logout'),
+    path('token/metrics/', TokenCacheMetrics.as_view(), name='token_cache_metrics'),
     path('profile/', UserProfile.as_view(), name='user_profile'),
+    path('profile/picture/', ProfilePicture.as_view(), name='profile_picture'),
+    path('users/', ListUsers.as_view(), name='list_users'),
+    path('autocomplete/', UsernameAutocomplete.as_view(), name='username_autocomplete'),
+    path('suggestions/', FollowSuggestions.as_view(), name='follow_suggestions'),
+    path('relationships/', Relationships.as_view(), name='relationships'),
+    path('users/<int:user_id>/followers/', FollowersList.as_view(), name='user_followers'),
+    path('users/<int:user_id>/following/', FollowingList.as_view(), name='user_following'),
      path('follow/<int:user_id>/', FollowUser.as_view(), name='follow_user'),
     path('unfollow/<int:user_id>/', UnfollowUser.as_view(), name='unfollow_user'),
+    path('async/follow/<int:user_id>/', AsyncFollowUser.as_view(), name='async_follow_user'),
+    path('async/unfollow/<int:user_id>/', AsyncUnfollowUser.as_view(), name='async_unfollow_user'),
 
 ]
\ No newline at end of file
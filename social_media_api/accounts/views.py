@@ -1,14 +1,25 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .serializers import UserSerializer, LoginSerializer, TokenSerializer
+from .serializers import UserSerializer, UserListSerializer, FollowSuggestionSerializer, ProfilePictureSerializer, LoginSerializer, TokenSerializer
+from .authentication import get_token_cache, remember_token
+from .autocomplete import get_username_index, username_prefix_range
+from .avatars import clear_profile_picture, set_profile_picture
+from .follows import Follow, afollow, aunfollow, follow, followed_by, followers_of, relationships, unfollow
 from rest_framework.authtoken.models import Token
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import MultiPartParser
 from rest_framework import generics, permissions, status
-from django.shortcuts import get_object_or_404
-from .models import CustomUser
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from .models import CustomUser, FollowSuggestion
+from posts.pagination import KeysetPagination, positive_int
+from posts.timeline import aremove_following, backfill_following, remove_following
+from social_media_api.async_api import AsyncAPIView
 
 
 # Create your views here.
@@ -21,6 +32,7 @@ class UserCreate(APIView):
         if serializer.is_valid():
             user = serializer.save()
             token, created = Token.objects.get_or_create(user=user)
+            remember_token(token)
             return Response({'token': token.key}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -30,6 +42,7 @@ class UserLogin(APIView):
         if serializer.is_valid():
             user = serializer.validated_data
             token, created = Token.objects.get_or_create(user=user)
+            remember_token(token)
             return Response({'token': token.key}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -39,16 +52,52 @@ class GetToken(APIView):
         if serializer.is_valid():
             user = serializer.validated_data
             token, created = Token.objects.get_or_create(user=user)
+            remember_token(token)
             return Response({'token': token.key}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
 
+class Logout(APIView):
+    # Deleting the token also drops it from the token cache (accounts/signals.py).
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        Token.objects.filter(user=request.user).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class TokenCacheMetrics(APIView):
+    # Counters of this process's token cache.
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(get_token_cache().stats())
+
+
 class UserProfile(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        serializer = UserSerializer(request.user)
+        serializer = UserSerializer(request.user, context={'request': request})
         return Response(serializer.data)
+
+
+class ProfilePicture(APIView):
+    # The upload arrives spooled to a temporary file (FILE_UPLOAD_HANDLERS);
+    # thumbnails are rendered in the background, so the response may still
+    # point at the original.
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def put(self, request):
+        serializer = ProfilePictureSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        set_profile_picture(request.user, serializer.validated_data['profile_picture'])
+        return Response(UserSerializer(request.user, context={'request': request}).data, status=status.HTTP_202_ACCEPTED)
+
+    def delete(self, request):
+        clear_profile_picture(request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
     
 
 class FollowUser(generics.GenericAPIView):
@@ -58,7 +107,8 @@ class FollowUser(generics.GenericAPIView):
         user_to_follow = get_object_or_404(User, id=user_id)
         if request.user == user_to_follow:
             return Response({"detail": "You cannot follow yourself."}, status=status.HTTP_400_BAD_REQUEST)
-        request.user.followers.add(user_to_follow)
+        follow(request.user, user_to_follow)
+        backfill_following(request.user, user_to_follow)
         return Response({"detail": f"You are now following {user_to_follow.username}."}, status=status.HTTP_200_OK)
 
 class UnfollowUser(generics.GenericAPIView):
@@ -66,10 +116,138 @@ class UnfollowUser(generics.GenericAPIView):
 
     def post(self, request, user_id):
         user_to_unfollow = get_object_or_404(User, id=user_id)
-        request.user.followers.remove(user_to_unfollow)
+        unfollow(request.user, user_to_unfollow)
+        remove_following(request.user, user_to_unfollow)
         return Response({"detail": f"You have unfollowed {user_to_unfollow.username}."}, status=status.HTTP_200_OK)
 
+class AsyncFollowUser(AsyncAPIView):
+    # FollowUser on the async ORM.
+    async def post(self, request, user_id):
+        user_to_follow = await aget_object_or_404(User, id=user_id)
+        if request.user == user_to_follow:
+            return self.respond({"detail": "You cannot follow yourself."}, status=status.HTTP_400_BAD_REQUEST)
+        await afollow(request.user, user_to_follow)
+        await sync_to_async(backfill_following)(request.user, user_to_follow)
+        return self.respond({"detail": f"You are now following {user_to_follow.username}."}, status=status.HTTP_200_OK)
+
+class AsyncUnfollowUser(AsyncAPIView):
+    # UnfollowUser on the async ORM.
+    async def post(self, request, user_id):
+        user_to_unfollow = await aget_object_or_404(User, id=user_id)
+        await aunfollow(request.user, user_to_unfollow)
+        await aremove_following(request.user, user_to_unfollow)
+        return self.respond({"detail": f"You have unfollowed {user_to_unfollow.username}."}, status=status.HTTP_200_OK)
+
+class Relationships(APIView):
+    # /relationships/?ids=1,2,3: whether the requesting user follows, and is
+    # followed by, each of up to RELATIONSHIPS_MAX_IDS users.
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            ids = list(dict.fromkeys(int(pk) for pk in request.query_params.get('ids', '').split(',') if pk.strip()))
+            # Ids the database cannot hold would overflow the query parameters.
+            if not all(0 < pk < 2 ** 63 for pk in ids):
+                raise ValueError
+        except ValueError:
+            return Response({"detail": "ids must be a comma-separated list of user ids."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > settings.RELATIONSHIPS_MAX_IDS:
+            return Response({"detail": f"At most {settings.RELATIONSHIPS_MAX_IDS} ids per request."}, status=status.HTTP_400_BAD_REQUEST)
+        following, followers = relationships(request.user, ids)
+        return Response([
+            {'id': pk, 'following': pk in following, 'followed_by': pk in followers}
+            for pk in ids
+        ])
+
+class FollowSuggestions(generics.ListAPIView):
+    # Friends-of-friends computed by build_follow_suggestions, minus anyone
+    # followed since the last run.
+    serializer_class = FollowSuggestionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        followed = Follow.objects.filter(from_customuser=OuterRef('suggested'), to_customuser=self.request.user)
+        return (
+            FollowSuggestion.objects.filter(user=self.request.user)
+            .exclude(Exists(followed))
+            .select_related('suggested')
+            .only('mutual', 'suggested__id', 'suggested__username', 'suggested__profile_picture', 'suggested__avatar_digest')
+            .order_by('rank')
+        )
+
+class FollowPagination(KeysetPagination):
+    # Newest follows first.
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_fields = ('id',)
+
+class FollowListView(generics.ListAPIView):
+    # One side of a user's follows, paged over the follow rows so every page
+    # is a range read of the through table's index.
+    serializer_class = UserListSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = FollowPagination
+    follows = None  # user id -> Follow queryset
+    user_field = None  # the Follow field holding the listed users
+
+    def get_queryset(self):
+        user = get_object_or_404(User.objects.only('id'), id=self.kwargs['user_id'])
+        return self.follows(user.pk).select_related(self.user_field).only(
+            'id', *(f'{self.user_field}__{field}' for field in ('id', 'username', 'profile_picture', 'avatar_digest'))
+        )
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        users = [getattr(row, self.user_field) for row in page]
+        return self.get_paginated_response(self.get_serializer(users, many=True).data)
+
+class FollowersList(FollowListView):
+    follows = staticmethod(followers_of)
+    user_field = 'to_customuser'
+
+class FollowingList(FollowListView):
+    follows = staticmethod(followed_by)
+    user_field = 'from_customuser'
+
+class DirectoryPagination(KeysetPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_fields = ('username_key', 'id')
+    cursor_types = {'username_key': str, 'id': int}
+
 class ListUsers(generics.ListAPIView):
-    queryset = CustomUser.objects.all()
-    serializer_class = get_user_model()
-    permission_classes = [permissions.IsAuthenticated]
\ No newline at end of file
+    # The user directory, alphabetical regardless of case; ?q= narrows it to
+    # a username prefix. Both are range reads of user_username_key_idx.
+    serializer_class = UserListSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = DirectoryPagination
+    cursor_ascending = True
+
+    def get_queryset(self):
+        users = CustomUser.objects.filter(is_active=True).only(
+            'id', 'username', 'username_key', 'profile_picture', 'avatar_digest'
+        )
+        prefix = self.request.query_params.get('q', '').strip()
+        if prefix:
+            lowest, highest = username_prefix_range(prefix)
+            users = users.filter(username_key__gte=lowest)
+            if highest is not None:
+                users = users.filter(username_key__lt=highest)
+        return users
+
+class UsernameAutocomplete(APIView):
+    # /autocomplete/?q=prefix[&limit=N], answered from this process's
+    # in-memory username index.
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = positive_int(request.query_params.get('limit', settings.AUTOCOMPLETE_LIMIT),
+                                 cutoff=settings.AUTOCOMPLETE_MAX_LIMIT)
+        except ValueError:
+            return Response({"detail": "limit must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+        prefix = request.query_params.get('q', '').strip()
+        matches = get_username_index().search(prefix, limit) if prefix else []
+        return Response([{'id': pk, 'username': username} for pk, username in matches])
\ No newline at end of file
@@ -16,5 +16,10 @@ class Notification(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', '-timestamp'], name='notification_recipient_idx'),
+        ]
+
     def _str_(self):
         return self.verb
\ No newline at end of file
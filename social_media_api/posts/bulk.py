@@ -0,0 +1,120 @@
+import json
+from itertools import islice
+
+from django.db import DatabaseError, transaction
+from rest_framework.parsers import BaseParser
+
+from .models import Post, make_excerpt
+from .search import get_search_backend
+from .serializers import PostSerializer
+from .timeline import fan_out_posts
+from .feed_index import invalidate_authors
+
+
+# Bulk post import from newline-delimited JSON.
+#
+# Input is consumed line by line and written in batches with bulk_create, so
+# memory stays bounded by the batch size no matter how long the stream is. Bad
+# rows are reported by line number and skipped; they never abort the load.
+
+
+class NDJSONParser(BaseParser):
+    # Hands the view an iterator over the raw request lines instead of reading
+    # the whole body; decoding is left to import_posts so that each malformed
+    # line can be reported on its own.
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return iter(())
+        return iter(stream.readline, b'')
+
+
+class ImportResult:
+    def __init__(self, max_errors):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def add_error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+def _numbered_rows(lines):
+    for number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        line = line.strip()
+        if line:
+            yield number, line
+
+
+def import_posts(lines, author=None, resolve_authors=None, batch_size=500, max_errors=1000):
+    # `author` owns every row; alternatively `resolve_authors(rows)` maps each
+    # decoded row of a batch to its author (or None to reject the row).
+    result = ImportResult(max_errors)
+    rows = _numbered_rows(lines)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        _import_batch(batch, author, resolve_authors, result)
+    return result
+
+
+def _import_batch(batch, author, resolve_authors, result):
+    decoded = []
+    for number, line in batch:
+        try:
+            decoded.append((number, json.loads(line)))
+        except ValueError as exc:
+            result.add_error(number, {'non_field_errors': [f'Invalid JSON: {exc}']})
+
+    authors = [author] * len(decoded)
+    if resolve_authors is not None:
+        authors = resolve_authors([row for _, row in decoded])
+
+    posts, numbers = [], []
+    for (number, row), row_author in zip(decoded, authors):
+        serializer = PostSerializer(data=row)
+        if not serializer.is_valid():
+            result.add_error(number, serializer.errors)
+            continue
+        if row_author is None:
+            result.add_error(number, {'author': ['Unknown author.']})
+            continue
+        post = Post(author=row_author, **serializer.validated_data)
+        post.excerpt = make_excerpt(post.content)  # bulk_create skips save()
+        posts.append(post)
+        numbers.append(number)
+    if not posts:
+        return
+
+    try:
+        with transaction.atomic():
+            Post.objects.bulk_create(posts)
+            # bulk_create sends no post_save, so keep the timeline and search
+            # index up to date here.
+            if all(post.pk is not None for post in posts):
+                fan_out_posts(posts)
+                authors = {post.author_id for post in posts}
+                transaction.on_commit(lambda: invalidate_authors(authors))
+                backend = get_search_backend()
+                if backend is not None:
+                    backend.index_many(posts)
+    except DatabaseError as exc:
+        for number in numbers:
+            result.add_error(number, {'non_field_errors': [f'Database error: {exc}']})
+        return
+    result.created += len(posts)
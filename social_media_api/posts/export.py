@@ -0,0 +1,90 @@
+import csv
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Comment, Like, Post
+
+
+# Streaming exports.
+#
+# Rows are read with values_list().iterator(chunk_size=...) and encoded one at
+# a time into a generator that StreamingHttpResponse drains, so an export holds
+# one chunk of rows in memory however large the table is.
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class ExportResource:
+    def __init__(self, model, fields, author_field, date_field):
+        self.model = model
+        self.fields = fields
+        self.author_field = author_field
+        self.date_field = date_field
+
+    def get_rows(self, author=None, since=None, until=None, using='default'):
+        # since is inclusive and until exclusive (ExportView turns a bare
+        # until date into the following midnight).
+        queryset = self.model.objects.using(using).order_by('pk')
+        if author is not None:
+            queryset = queryset.filter(**{self.author_field: author})
+        if since is not None:
+            queryset = queryset.filter(**{f'{self.date_field}__gte': since})
+        if until is not None:
+            queryset = queryset.filter(**{f'{self.date_field}__lt': until})
+        return queryset.values_list(*self.fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+EXPORT_RESOURCES = {
+    'posts': ExportResource(
+        Post,
+        ('id', 'author_id', 'title', 'content', 'created_at', 'updated_at', 'like_count', 'comment_count'),
+        author_field='author_id',
+        date_field='created_at',
+    ),
+    'comments': ExportResource(
+        Comment,
+        ('id', 'post_id', 'author_id', 'content', 'created_at', 'updated_at'),
+        author_field='author_id',
+        date_field='created_at',
+    ),
+    'likes': ExportResource(
+        Like,
+        ('id', 'user_id', 'post_id', 'timestamp'),
+        author_field='user_id',
+        date_field='timestamp',
+    ),
+}
+
+
+class ExportJSONEncoder(DjangoJSONEncoder):
+    # Backups must round-trip, so keep full microsecond precision.
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def stream_ndjson(fields, rows):
+    encoder = ExportJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(dict(zip(fields, row))) + '\n'
+
+
+class _Echo:
+    # csv.writer only needs write(); hand each encoded line straight back.
+    def write(self, value):
+        return value
+
+
+def stream_csv(fields, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', stream_ndjson),
+    'csv': ('text/csv', stream_csv),
+}
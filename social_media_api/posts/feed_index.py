@@ -0,0 +1,112 @@
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+from heapq import merge
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Post
+
+
+# Per-author recent-post index (FEED_ENGINE = 'recent_index').
+#
+# The FEED_INDEX_CACHE cache holds, for each author, their newest
+# FEED_INDEX_AUTHOR_LENGTH posts as [(created_at in microseconds, post_id), ...],
+# newest first. A feed page is a heap-based k-way merge of the lists of everyone
+# the reader follows, cut at the cursor, and only that page's posts are read
+# from the database. A list is dropped whenever its author creates or deletes a
+# post and reloaded from the (author, created_at, id) index on the next read, so
+# feeds reach at most FEED_INDEX_AUTHOR_LENGTH posts back per author.
+
+FEED_INDEX_KEY = 'feed:recent:{}'
+LOAD_CHUNK_SIZE = 500
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_micros(moment):
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def author_key(author_id):
+    return FEED_INDEX_KEY.format(author_id)
+
+
+def index_cache():
+    return caches[settings.FEED_INDEX_CACHE]
+
+
+def load_recent(author_ids):
+    # {author_id: entries} read from the database.
+    length = settings.FEED_INDEX_AUTHOR_LENGTH
+    newest_first = Window(
+        RowNumber(),
+        partition_by=F('author_id'),
+        order_by=[F('created_at').desc(), F('id').desc()],
+    )
+    author_ids = list(author_ids)
+    recent = {author_id: [] for author_id in author_ids}
+    for start in range(0, len(author_ids), LOAD_CHUNK_SIZE):
+        rows = (
+            Post.objects.filter(author_id__in=author_ids[start:start + LOAD_CHUNK_SIZE])
+            .annotate(position=newest_first)
+            .filter(position__lte=length)
+            .order_by('author_id', 'position')
+            .values_list('author_id', 'created_at', 'id')
+        )
+        for author_id, created_at, post_id in rows:
+            recent[author_id].append((to_micros(created_at), post_id))
+    return recent
+
+
+def store_recent(recent):
+    index_cache().set_many(
+        {author_key(author_id): entries for author_id, entries in recent.items()},
+        settings.FEED_INDEX_TIMEOUT,
+    )
+
+
+def get_recent(author_ids):
+    keys = {author_key(author_id): author_id for author_id in author_ids}
+    recent = {keys[key]: entries for key, entries in index_cache().get_many(list(keys)).items()}
+    missing = [author_id for author_id in author_ids if author_id not in recent]
+    if missing:
+        loaded = load_recent(missing)
+        store_recent(loaded)
+        recent.update(loaded)
+    return recent
+
+
+def invalidate_authors(author_ids):
+    index_cache().delete_many([author_key(author_id) for author_id in author_ids])
+
+
+def merge_entries(lists, position=None, reverse=False, limit=None):
+    # The first `limit` entries strictly older than `position` (newest first),
+    # or with reverse=True strictly newer (oldest first).
+    if not reverse:
+        if position is not None:
+            # Lists are newest first; skip each one's entries at or after the cursor.
+            key = lambda entry: (-entry[0], -entry[1])
+            negated = (-position[0], -position[1])
+            lists = [entries[bisect_right(entries, negated, key=key):] for entries in lists]
+        return list(islice(merge(*lists, reverse=True), limit))
+    lists = [entries[::-1] for entries in lists]
+    if position is not None:
+        lists = [entries[bisect_right(entries, tuple(position)):] for entries in lists]
+    return list(islice(merge(*lists), limit))
+
+
+def get_index_feed_queryset(user, position=None, reverse=False, limit=None):
+    # Posts of one feed page (plus any lookahead in `limit`), annotated like
+    # timeline.get_feed_queryset so the same keyset pagination applies.
+    if position is not None:
+        position = (to_micros(position[0]), position[1])
+    followed = list(user.following.values_list('id', flat=True))
+    entries = merge_entries(get_recent(followed).values(), position, reverse, limit)
+    return Post.objects.filter(id__in=[post_id for _, post_id in entries]).annotate(
+        feed_created_at=F('created_at'),
+        feed_post_id=F('id'),
+    )
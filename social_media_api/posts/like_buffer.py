@@ -0,0 +1,236 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DatabaseError, close_old_connections
+from django.dispatch import receiver
+
+from .likes import write_likes
+from .models import Like, Post
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: journals cannot be claimed between processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+# Write-behind likes.
+#
+# With LIKES_WRITE_BEHIND set, LikePostView only checks that a like is new and
+# hands it to this process's LikeBuffer. A flusher thread writes whatever has
+# accumulated FLUSH_INTERVAL seconds after the first buffered like (or as soon
+# as FLUSH_SIZE likes are waiting) in one transaction, so a burst of likes
+# takes the database write lock once per batch instead of once per request.
+# While nothing is buffered the thread sleeps.
+#
+# Durability:
+#   no JOURNAL_DIR   buffered likes live in memory only; a crash loses them
+#                    (they are flushed on a clean exit).
+#   JOURNAL_DIR      each like is appended to a journal segment before it is
+#                    acknowledged and the segment is deleted once flushed; a
+#                    restarted process replays segments no live process holds.
+#   FSYNC = True     the journal is fsynced on every append, so acknowledged
+#                    likes also survive an OS crash or power loss.
+#
+# Read-your-own-writes: the liking user's own likes that are still buffered
+# count as liked (LikePostView answers "already liked") and are added to the
+# like_count they are shown. This holds within one process; with several
+# workers a user's requests must stick to one of them.
+
+
+def _claim(handle):
+    # An exclusive lock marks a segment as owned by a live process.
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+class LikeBuffer:
+    def __init__(self, flush_interval=0.005, flush_size=500, journal_dir=None, fsync=False, using='default'):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.journal_dir = Path(journal_dir) if journal_dir else None
+        self.fsync = fsync
+        self.using = using
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._has_events = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self._events = []
+        self._pending = {}  # user_id -> post ids liked but not yet written
+        self._segments = []  # (path, handle) of journal segments awaiting deletion
+        self._journal = None
+        self._thread = None
+        if self.journal_dir is not None:
+            self.journal_dir.mkdir(parents=True, exist_ok=True)
+            self._recover()
+            self._journal = self._open_segment()
+
+    def submit(self, user, post_id):
+        # Returns 'accepted', 'already_liked' or 'not_found'.
+        if post_id in self.pending_for(user.pk):
+            return 'already_liked'
+        if Like.objects.using(self.using).filter(user=user, post_id=post_id).exists():
+            return 'already_liked'
+        if not Post.objects.using(self.using).filter(pk=post_id).exists():
+            return 'not_found'
+        with self._lock:
+            pending = self._pending.setdefault(user.pk, set())
+            if post_id in pending:
+                return 'already_liked'
+            if self._journal is not None:
+                self._append(user.pk, post_id)
+            pending.add(post_id)
+            self._events.append((user.pk, post_id))
+            waiting = len(self._events)
+            self._has_events.notify()
+        self._start()
+        if waiting >= self.flush_size:
+            self._wake.set()
+        return 'accepted'
+
+    def pending_for(self, user_id):
+        with self._lock:
+            return set(self._pending.get(user_id, ()))
+
+    def settle(self, user_id, post_id=None):
+        # Writes out the user's buffered likes (or just the like of post_id)
+        # before an unlike or batch reads the Like table.
+        pending = self.pending_for(user_id)
+        if post_id is not None:
+            pending &= {post_id}
+        if pending:
+            self.flush()
+
+    def flush(self):
+        # Returns the number of likes written.
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+                if not events:
+                    return 0
+                if self._journal is not None:
+                    self._segments.append(self._journal)
+                    self._journal = self._open_segment()
+            try:
+                written = write_likes(events, using=self.using)
+            except DatabaseError:
+                with self._lock:
+                    self._events = events + self._events
+                raise
+            with self._lock:
+                for user_id, post_id in events:
+                    pending = self._pending.get(user_id)
+                    if pending is not None:
+                        pending.discard(post_id)
+                        if not pending:
+                            del self._pending[user_id]
+                segments, self._segments = self._segments, []
+            for path, handle in segments:
+                path.unlink(missing_ok=True)
+                handle.close()
+            return written
+
+    def _start(self):
+        if self._thread is None and self.flush_interval is not None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='like-buffer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        # Sleeps until a like arrives, then gives the batch flush_interval
+        # seconds (less if flush_size likes pile up) before writing it.
+        while True:
+            with self._has_events:
+                self._has_events.wait_for(lambda: self._events)
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except DatabaseError:
+                logger.exception('Writing buffered likes failed; retrying.')
+            finally:
+                close_old_connections()
+
+    def _open_segment(self):
+        path = self.journal_dir / f'likes-{uuid.uuid4().hex}.ndjson'
+        handle = open(path, 'a', encoding='utf-8')
+        _claim(handle)
+        return path, handle
+
+    def _append(self, user_id, post_id):
+        _, handle = self._journal
+        handle.write(json.dumps({'user': user_id, 'post': post_id}) + '\n')
+        handle.flush()
+        if self.fsync:
+            os.fsync(handle.fileno())
+
+    def _recover(self):
+        # Adopt segments left behind by processes that died before flushing.
+        for path in sorted(self.journal_dir.glob('likes-*.ndjson')):
+            handle = open(path, 'r+', encoding='utf-8')
+            if not _claim(handle):
+                handle.close()
+                continue
+            for line in handle:
+                try:
+                    row = json.loads(line)
+                    user_id, post_id = int(row['user']), int(row['post'])
+                except (ValueError, KeyError, TypeError):
+                    continue  # a torn last line from the crash
+                if post_id not in self._pending.setdefault(user_id, set()):
+                    self._pending[user_id].add(post_id)
+                    self._events.append((user_id, post_id))
+            self._segments.append((path, handle))
+        if self._events:
+            self._start()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_like_buffer():
+    # The process-wide buffer, or None when likes are written directly.
+    global _buffer
+    config = settings.LIKES_WRITE_BEHIND
+    if not config:
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = LikeBuffer(
+                    flush_interval=config.get('FLUSH_INTERVAL', 0.005),
+                    flush_size=config.get('FLUSH_SIZE', 500),
+                    journal_dir=config.get('JOURNAL_DIR'),
+                    fsync=config.get('FSYNC', False),
+                )
+                atexit.register(_buffer.flush)
+    return _buffer
+
+
+def pending_likes_for(user):
+    buffer = get_like_buffer()
+    if buffer is None or not user.is_authenticated:
+        return set()
+    return buffer.pending_for(user.pk)
+
+
+@receiver(setting_changed)
+def reset_like_buffer(setting, **kwargs):
+    global _buffer
+    if setting == 'LIKES_WRITE_BEHIND':
+        _buffer = None
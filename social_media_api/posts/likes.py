@@ -0,0 +1,181 @@
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, transaction
+from django.db.models import F, Subquery
+from django.utils import timezone
+
+from notifications.models import Notification
+from .models import Like, Post
+from .trending import record_engagement
+
+
+# Race-free likes.
+#
+# The (user, post) unique constraint on Like makes a like an insert-or-ignore:
+# one INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING statement both
+# checks that the post exists and reports whether a row was written, so two
+# concurrent likes can never both succeed and nothing is read first.
+
+LIKED_VERB = 'liked your post'
+
+
+def _insert_likes(user, post_ids, timestamp, using):
+    # Returns {post_id: like_id} for the likes that were actually inserted.
+    if not post_ids:
+        return {}
+    like_table = Like._meta.db_table
+    post_table = Post._meta.db_table
+    placeholders = ', '.join(['%s'] * len(post_ids))
+    connection = connections[using]
+    timestamp = connection.ops.adapt_datetimefield_value(timestamp)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {like_table} (user_id, post_id, timestamp) '
+            f'SELECT %s, id, %s FROM {post_table} WHERE id IN ({placeholders}) '
+            f'ON CONFLICT (user_id, post_id) DO NOTHING '
+            f'RETURNING post_id, id',
+            [user.pk, timestamp, *post_ids],
+        )
+        return dict(cursor.fetchall())
+
+
+def _insert_like_pairs(pairs, timestamp, using):
+    # Returns the (user_id, post_id) pairs that were actually inserted; pairs
+    # already liked or whose user or post is gone are left out.
+    like_table = Like._meta.db_table
+    post_table = Post._meta.db_table
+    user_table = get_user_model()._meta.db_table
+    rows = ', '.join(['(%s, %s)'] * len(pairs))
+    connection = connections[using]
+    timestamp = connection.ops.adapt_datetimefield_value(timestamp)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {like_table} (user_id, post_id, timestamp) '
+            f'SELECT pair.column1, pair.column2, %s FROM (VALUES {rows}) AS pair '
+            f'WHERE pair.column1 IN (SELECT id FROM {user_table}) '
+            f'AND pair.column2 IN (SELECT id FROM {post_table}) '
+            f'ON CONFLICT (user_id, post_id) DO NOTHING '
+            f'RETURNING user_id, post_id',
+            [timestamp, *(value for pair in pairs for value in pair)],
+        )
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+def _notify(user, recipients_by_post, using):
+    target_type = ContentType.objects.db_manager(using).get_for_model(Post)
+    Notification.objects.using(using).bulk_create([
+        Notification(
+            recipient_id=recipient_id,
+            actor=user,
+            verb=LIKED_VERB,
+            target_type=target_type,
+            target_id=post_id,
+        )
+        for post_id, recipient_id in recipients_by_post.items()
+    ])
+
+
+def like_post(user, post_id, using='default'):
+    # Returns the new Like, or None if the post is already liked or missing.
+    timestamp = timezone.now()
+    with transaction.atomic(using=using):
+        inserted = _insert_likes(user, [post_id], timestamp, using)
+        if not inserted:
+            return None
+        record_engagement([post_id], settings.TRENDING_LIKE_WEIGHT, using,
+                          like_count=F('like_count') + 1, version=F('version') + 1)
+        Notification.objects.using(using).create(
+            recipient_id=Subquery(Post.objects.filter(pk=post_id).values('author_id')),
+            actor=user,
+            verb=LIKED_VERB,
+            target_type=ContentType.objects.db_manager(using).get_for_model(Post),
+            target_id=post_id,
+        )
+    return Like(id=inserted[post_id], user=user, post_id=post_id, timestamp=timestamp)
+
+
+def unlike_post(user, post_id, using='default'):
+    # Returns True if a like was removed.
+    with transaction.atomic(using=using):
+        deleted, _ = Like.objects.using(using).filter(user=user, post_id=post_id).delete()
+        if not deleted:
+            return False
+        Post.objects.using(using).filter(pk=post_id, like_count__gt=0).update(
+            like_count=F('like_count') - 1, version=F('version') + 1
+        )
+    return True
+
+
+def apply_like_actions(user, actions, using='default'):
+    # Replays a list of (post_id, 'like' | 'unlike') actions in a fixed number of
+    # statements. Only the last action per post matters. Returns {post_id: outcome}.
+    final = {}
+    for post_id, action in actions:
+        final[post_id] = action
+    authors = dict(
+        Post.objects.using(using).filter(pk__in=list(final)).values_list('id', 'author_id')
+    )
+    results = {post_id: 'not_found' for post_id in final if post_id not in authors}
+    to_like = [post_id for post_id, action in final.items() if action == 'like' and post_id in authors]
+    to_unlike = [post_id for post_id, action in final.items() if action == 'unlike' and post_id in authors]
+
+    with transaction.atomic(using=using):
+        liked = _insert_likes(user, to_like, timezone.now(), using)
+        if liked:
+            record_engagement(liked, settings.TRENDING_LIKE_WEIGHT, using,
+                              like_count=F('like_count') + 1, version=F('version') + 1)
+            _notify(user, {post_id: authors[post_id] for post_id in liked}, using)
+
+        existing = Like.objects.using(using).filter(user=user, post_id__in=to_unlike)
+        unliked = set(existing.values_list('post_id', flat=True))
+        if unliked:
+            existing.delete()
+            Post.objects.using(using).filter(pk__in=unliked, like_count__gt=0).update(
+                like_count=F('like_count') - 1, version=F('version') + 1
+            )
+
+    for post_id in to_like:
+        results[post_id] = 'liked' if post_id in liked else 'already_liked'
+    for post_id in to_unlike:
+        results[post_id] = 'unliked' if post_id in unliked else 'not_liked'
+    return results
+
+
+def write_likes(pairs, using='default'):
+    # Writes (user_id, post_id) likes accepted by the write-behind buffer in one
+    # transaction: one insert-or-ignore, one counter update per distinct like
+    # count and one bulk notification insert. Only the rows the insert reports
+    # are counted, so pairs that are already liked, by this or any other
+    # process, or whose post or user is gone are skipped. Returns the number of
+    # likes written.
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs:
+        return 0
+    with transaction.atomic(using=using):
+        new = _insert_like_pairs(pairs, timezone.now(), using)
+        if not new:
+            return 0
+        posts_by_count = defaultdict(list)
+        for post_id, count in Counter(post_id for _, post_id in new).items():
+            posts_by_count[count].append(post_id)
+        for count, counted_posts in posts_by_count.items():
+            record_engagement(counted_posts, settings.TRENDING_LIKE_WEIGHT * count, using,
+                              like_count=F('like_count') + count, version=F('version') + 1)
+        authors = dict(
+            Post.objects.using(using).filter(pk__in={post_id for _, post_id in new}).values_list('id', 'author_id')
+        )
+        target_type = ContentType.objects.db_manager(using).get_for_model(Post)
+        Notification.objects.using(using).bulk_create([
+            Notification(
+                recipient_id=authors[post_id],
+                actor_id=user_id,
+                verb=LIKED_VERB,
+                target_type=target_type,
+                target_id=post_id,
+            )
+            for user_id, post_id in new
+        ])
+    return len(new)
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import secrets
+import statistics
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from social_media_api.asgi import application
+
+
+# Each scenario is a cycle of (method, sync path, async path, body) requests;
+# every worker repeats its cycle, so write scenarios leave the data as they
+# found it (like/unlike, follow/unfollow).
+SCENARIOS = {
+    'feed': [
+        ('GET', '/api/posts/feed/', '/api/posts/async/feed/', None),
+    ],
+    'like': [
+        ('POST', '/api/posts/like/', '/api/posts/async/like/', {'post': '{post}'}),
+        ('DELETE', '/api/posts/unlike/', '/api/posts/async/unlike/', {'post': '{post}'}),
+    ],
+    'follow': [
+        ('POST', '/api/accounts/follow/{target}/', '/api/accounts/async/follow/{target}/', None),
+        ('POST', '/api/accounts/unfollow/{target}/', '/api/accounts/async/unfollow/{target}/', None),
+    ],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare requests per second and tail latency of the sync and async feed, '
+        'like and follow endpoints, driving the ASGI application in this process '
+        'with many concurrent requests. Write scenarios touch the configured database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, required=True, help='Id of the user making the requests.')
+        parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='feed')
+        parser.add_argument('--post', type=int, help='Post id to like and unlike (like scenario).')
+        parser.add_argument('--target', type=int, help='User id to follow and unfollow (follow scenario).')
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per variant.')
+        parser.add_argument('--concurrency', type=int, default=100, help='Requests in flight at once.')
+        parser.add_argument('--host', default='localhost', help='Host header; must be in ALLOWED_HOSTS.')
+
+    def handle(self, *args, **options):
+        scenario = options['scenario']
+        if scenario == 'like' and options['post'] is None:
+            raise CommandError('The like scenario needs --post.')
+        if scenario == 'follow' and options['target'] is None:
+            raise CommandError('The follow scenario needs --target.')
+        try:
+            user = get_user_model().objects.get(pk=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist.")
+
+        headers = self.session_headers(user, options['host'])
+        self.stdout.write(
+            f"{scenario}: {options['requests']} requests per variant, concurrency {options['concurrency']}"
+        )
+        self.stdout.write(f"{'variant':<8}{'requests':>10}{'errors':>8}{'req/s':>10}"
+                          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for variant, column in (('sync', 1), ('async', 2)):
+            cycle = [
+                self.build_request(step[0], step[column], step[3], options)
+                for step in SCENARIOS[scenario]
+            ]
+            latencies, errors, elapsed = asyncio.run(
+                self.run(cycle, headers, options['requests'], options['concurrency'], options['host'])
+            )
+            self.stdout.write(self.format_row(variant, latencies, errors, elapsed))
+
+    def session_headers(self, user, host):
+        # A logged-in session plus a CSRF token, as a browser client would send.
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        csrf_token = secrets.token_hex(16)
+        cookies = f'{settings.SESSION_COOKIE_NAME}={session.session_key}; {settings.CSRF_COOKIE_NAME}={csrf_token}'
+        return [
+            (b'host', host.encode()),
+            (b'cookie', cookies.encode()),
+            (b'x-csrftoken', csrf_token.encode()),
+        ]
+
+    def build_request(self, method, path, body, options):
+        path = path.format(post=options['post'], target=options['target'])
+        if body is not None:
+            body = json.dumps({key: int(value.format(**options)) for key, value in body.items()}).encode()
+        return method, path, body
+
+    async def run(self, cycle, headers, total, concurrency, host):
+        latencies, errors = [], 0
+        remaining = total
+
+        async def worker():
+            nonlocal remaining, errors
+            step = 0
+            while remaining > 0:
+                remaining -= 1
+                method, path, body = cycle[step % len(cycle)]
+                step += 1
+                started = time.perf_counter()
+                status = await self.call(method, path, body, headers, host)
+                latencies.append(time.perf_counter() - started)
+                if status >= 500:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, errors, time.perf_counter() - started
+
+    async def call(self, method, path, body, headers, host):
+        request_headers = list(headers)
+        if body is not None:
+            request_headers += [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': b'',
+            'root_path': '',
+            'headers': request_headers,
+            'client': ('127.0.0.1', 0),
+            'server': (host, 80),
+        }
+        messages = [{'type': 'http.request', 'body': body or b'', 'more_body': False}]
+        status = 0
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # The client never disconnects; Django stops listening once it responds.
+            await asyncio.Future()
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        await application(scope, receive, send)
+        return status
+
+    def format_row(self, variant, latencies, errors, elapsed):
+        milliseconds = sorted(latency * 1000 for latency in latencies)
+        percentiles = statistics.quantiles(milliseconds, n=100) if len(milliseconds) > 1 else milliseconds * 99
+        return (
+            f'{variant:<8}{len(milliseconds):>10}{errors:>8}{len(milliseconds) / elapsed:>10.1f}'
+            f'{percentiles[49]:>10.1f}{percentiles[94]:>10.1f}{percentiles[98]:>10.1f}{milliseconds[-1]:>10.1f}'
+        )
@@ -0,0 +1,112 @@
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from posts.feed_index import invalidate_authors
+from posts.models import Post, make_excerpt
+from posts.timeline import rebuild_timeline
+from posts.views import PostPagination, UserFeedView
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare first-page feed latency of the timeline and recent_index feed '
+        'engines, and of a plain author__in query, for readers following '
+        'different numbers of authors. The data is created inside a transaction '
+        'that is rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--following', type=int, nargs='+', default=[10, 1000, 10000],
+                            help='Numbers of followed authors to measure.')
+        parser.add_argument('--posts-per-author', type=int, default=5)
+        parser.add_argument('--requests', type=int, default=20, help='Requests per variant.')
+        parser.add_argument('--host', default='localhost', help='Host header; must be in ALLOWED_HOSTS.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'following':>10}  {'variant':<22}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+        for following in options['following']:
+            with transaction.atomic():
+                reader, author_ids = self.seed(following, options['posts_per_author'])
+                try:
+                    for variant, latencies in self.measure(reader, author_ids, options):
+                        self.stdout.write(self.format_row(following, variant, latencies))
+                finally:
+                    invalidate_authors(author_ids)
+                    transaction.set_rollback(True)
+
+    def seed(self, following, posts_per_author):
+        prefix = f'bench-{uuid.uuid4().hex[:8]}'
+        # The follows below are bulk-loaded, so their counts are set here.
+        reader = User.objects.create(username=f'{prefix}-reader', following_count=following)
+        authors = User.objects.bulk_create(
+            User(username=f'{prefix}-{i}', followers_count=1) for i in range(following)
+        )
+        content = 'Benchmark post. ' * 20
+        Post.objects.bulk_create(
+            (
+                Post(author=author, title=f'Post {i}', content=content, excerpt=make_excerpt(content))
+                for i in range(posts_per_author)
+                for author in authors
+            ),
+            batch_size=1000,
+        )
+        Follow = User.followers.through
+        Follow.objects.bulk_create(
+            (Follow(from_customuser=author, to_customuser=reader) for author in authors),
+            batch_size=1000,
+        )
+        rebuild_timeline(reader)
+        return reader, [author.pk for author in authors]
+
+    def measure(self, reader, author_ids, options):
+        view = UserFeedView.as_view()
+        factory = APIRequestFactory()
+
+        def get_feed():
+            request = factory.get('/api/posts/feed/', HTTP_HOST=options['host'])
+            force_authenticate(request, user=reader)
+            view(request).render()
+
+        def cold_feed():
+            invalidate_authors(author_ids)
+            get_feed()
+
+        def author_in_query():
+            # The pull query the engines replace, rows only.
+            list(
+                Post.objects.filter(author__in=reader.following.all())
+                .select_related('author')
+                .order_by('-created_at', '-id')[:PostPagination.page_size + 1]
+            )
+
+        with override_settings(FEED_ENGINE='timeline'):
+            yield 'timeline', self.time(get_feed, options['requests'])
+        with override_settings(FEED_ENGINE='recent_index'):
+            yield 'recent_index (cold)', self.time(cold_feed, options['requests'])
+            yield 'recent_index (warm)', self.time(get_feed, options['requests'])
+        yield 'author__in query', self.time(author_in_query, options['requests'])
+
+    def time(self, call, requests):
+        call()  # first call pays for imports and lazy setup
+        latencies = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            call()
+            latencies.append((time.perf_counter() - started) * 1000)
+        return sorted(latencies)
+
+    def format_row(self, following, variant, latencies):
+        p95 = statistics.quantiles(latencies, n=20, method='inclusive')[-1] if len(latencies) > 1 else latencies[0]
+        return (
+            f'{following:>10}  {variant:<22}{statistics.median(latencies):>10.2f}'
+            f'{p95:>10.2f}{latencies[-1]:>10.2f}'
+        )
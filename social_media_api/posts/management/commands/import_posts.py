@@ -0,0 +1,47 @@
+import sys
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.bulk import import_posts
+
+
+class Command(BaseCommand):
+    help = 'Import posts from a newline-delimited JSON file (use - for stdin).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='NDJSON file with one post object per line, or - for stdin.')
+        parser.add_argument('--author', help='Username that owns rows without an "author" key.')
+        parser.add_argument('--batch-size', type=int, default=settings.POSTS_IMPORT_BATCH_SIZE,
+                            help=f'Rows per bulk insert (default: {settings.POSTS_IMPORT_BATCH_SIZE}).')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        default_author = None
+        if options['author']:
+            try:
+                default_author = User.objects.get(username=options['author'])
+            except User.DoesNotExist:
+                raise CommandError(f'User "{options["author"]}" does not exist.')
+
+        def resolve_authors(rows):
+            # One username lookup per batch.
+            usernames = {row.get('author') for row in rows if isinstance(row, dict) and row.get('author')}
+            users = {user.username: user for user in User.objects.filter(username__in=usernames)}
+            return [
+                users.get(row.get('author')) if isinstance(row, dict) and row.get('author') else default_author
+                for row in rows
+            ]
+
+        if options['path'] == '-':
+            result = import_posts(sys.stdin, resolve_authors=resolve_authors, batch_size=options['batch_size'])
+        else:
+            with open(options['path'], encoding='utf-8') as lines:
+                result = import_posts(lines, resolve_authors=resolve_authors, batch_size=options['batch_size'])
+
+        for error in result.errors:
+            self.stderr.write(f'line {error["line"]}: {error["errors"]}')
+        if result.failed > len(result.errors):
+            self.stderr.write(f'... and {result.failed - len(result.errors)} more error(s).')
+        self.stdout.write(self.style.SUCCESS(f'Imported {result.created} post(s), {result.failed} failed.'))
@@ -0,0 +1,59 @@
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import Comment, Like, Post
+from posts.trending import TRENDING_CACHE_KEY, time_units
+
+
+def _event_units(model, date_field, post_ids):
+    units = defaultdict(list)
+    rows = model.objects.filter(post_id__in=post_ids).values_list('post_id', date_field)
+    for post_id, moment in rows.iterator():
+        units[post_id].append(time_units(moment))
+    return units
+
+
+def _log_score(weighted_units):
+    # log2(sum(w * 2**u)), shifted by the largest u so nothing overflows.
+    top = max(u for _, u in weighted_units)
+    return top + math.log2(sum(w * 2 ** (u - top) for w, u in weighted_units))
+
+
+class Command(BaseCommand):
+    help = 'Recompute Post.trending_score from every like and comment, one primary-key range at a time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Posts recomputed per transaction (default: 1000).')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        scored = checked = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                post_ids = list(
+                    Post.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+                )
+                if not post_ids:
+                    break
+                likes = _event_units(Like, 'timestamp', post_ids)
+                comments = _event_units(Comment, 'created_at', post_ids)
+                scores = {}
+                for post_id in post_ids:
+                    events = [(settings.TRENDING_LIKE_WEIGHT, u) for u in likes[post_id]]
+                    events += [(settings.TRENDING_COMMENT_WEIGHT, u) for u in comments[post_id]]
+                    scores[post_id] = _log_score(events) if events else None
+                posts = [Post(pk=post_id, trending_score=score) for post_id, score in scores.items()]
+                Post.objects.bulk_update(posts, ['trending_score'])
+            checked += len(post_ids)
+            scored += sum(score is not None for score in scores.values())
+            last_pk = post_ids[-1]
+
+        cache.delete(TRENDING_CACHE_KEY)
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} post(s); {scored} have a trending score.'))
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from posts.models import Comment, Like, Post
+
+
+def _count_subquery(model):
+    counts = (
+        model.objects.filter(post=OuterRef('pk'))
+        .order_by()
+        .values('post')
+        .annotate(n=Count('pk'))
+        .values('n')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+class Command(BaseCommand):
+    help = 'Recompute Post.like_count and Post.comment_count, one primary-key range at a time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Posts checked per transaction (default: 1000).')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drifted posts without writing.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        dry_run = options['dry_run']
+        checked = repaired = 0
+        last_pk = 0
+        likes, comments = _count_subquery(Like), _count_subquery(Comment)
+        while True:
+            # Each chunk is its own short transaction so writers are never
+            # blocked for longer than one range takes to check.
+            with transaction.atomic():
+                pks = list(
+                    Post.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+                )
+                if not pks:
+                    break
+                drifted = Post.objects.filter(pk__gt=last_pk, pk__lte=pks[-1]).exclude(
+                    like_count=likes, comment_count=comments
+                )
+                rows = (
+                    drifted.order_by('pk')
+                    .annotate(actual_likes=likes, actual_comments=comments)
+                    .values_list('pk', 'like_count', 'comment_count', 'actual_likes', 'actual_comments')
+                )
+                found = 0
+                for pk, like_count, comment_count, actual_likes, actual_comments in rows:
+                    found += 1
+                    self.stdout.write(
+                        f'Post {pk}: likes {like_count} -> {actual_likes}, '
+                        f'comments {comment_count} -> {actual_comments}'
+                    )
+                if dry_run:
+                    repaired += found
+                else:
+                    # Counted and written by one statement, so an F() increment
+                    # committed after the report above is never overwritten.
+                    repaired += drifted.update(like_count=likes, comment_count=comments, version=F('version') + 1)
+            checked += len(pks)
+            last_pk = pks[-1]
+
+        verb = 'Found' if dry_run else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} post(s). {verb} {repaired} drifted post(s).'))
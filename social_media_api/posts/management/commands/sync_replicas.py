@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the primary SQLite database over every replica in REPLICA_DATABASES, '
+        'for trying the read-replica router locally.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--replica', action='append', dest='aliases',
+                            help='Only copy to this replica alias (repeatable).')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or settings.REPLICA_DATABASES
+        if not aliases:
+            raise CommandError('REPLICA_DATABASES is empty.')
+        primary = connections[DEFAULT_DB_ALIAS]
+        for alias in aliases:
+            if alias not in settings.REPLICA_DATABASES:
+                raise CommandError(f'{alias} is not in REPLICA_DATABASES.')
+            replica = connections[alias]
+            if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+                raise CommandError('Only SQLite replicas can be copied; use your database\'s replication.')
+            primary.ensure_connection()
+            replica.ensure_connection()
+            # The online backup API copies a consistent snapshot even while
+            # the primary is being written to.
+            primary.connection.backup(replica.connection)
+            self.stdout.write(f'Copied {primary.settings_dict["NAME"]} to {replica.settings_dict["NAME"]}.')
+        self.stdout.write(self.style.SUCCESS(f'Synced {len(aliases)} replica(s).'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts.feed_index import LOAD_CHUNK_SIZE, load_recent, store_recent
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Load the recent-post lists of authors into the feed index cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--author', type=int, action='append', dest='author_ids',
+                            help='Only warm the list of this author id (repeatable).')
+        parser.add_argument('--chunk-size', type=int, default=LOAD_CHUNK_SIZE,
+                            help='Authors loaded and stored per round trip.')
+
+    def handle(self, *args, **options):
+        authors = Post.objects.order_by('author_id').values_list('author_id', flat=True).distinct()
+        if options['author_ids']:
+            authors = authors.filter(author_id__in=options['author_ids'])
+        author_ids = list(authors)
+        chunk_size = options['chunk_size']
+        for start in range(0, len(author_ids), chunk_size):
+            store_recent(load_recent(author_ids[start:start + chunk_size]))
+        self.stdout.write(self.style.SUCCESS(f'Warmed {len(author_ids)} author list(s).'))
@@ -1,16 +1,64 @@
 from django.db import models
+from django.db.models import F
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.utils.text import Truncator
 
 
 # Create your models here.
 
+EXCERPT_LENGTH = 280
+
+
+def make_excerpt(content, length=EXCERPT_LENGTH):
+    # Whitespace-collapsed opening of a post, ending in an ellipsis if cut.
+    return Truncator(' '.join(content.split())).chars(length)
+
+
 class Post(models.Model):
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized engagement counters, kept in step with F() updates by the
+    # like and comment views; repair_post_counters fixes any drift.
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    # Bumped by every write that changes the post's own representation: edits
+    # and the counter updates alike. Part of the list ETag.
+    version = models.PositiveIntegerField(default=0, editable=False)
+    # Stored preview of content for list and feed responses, so they never
+    # need to read the full body.
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True, editable=False)
+    # Time-decayed engagement in log form (see posts/trending.py); null until
+    # the first like or comment.
+    trending_score = models.FloatField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset-paginated list and per-author reads (celebrity feed pull, exports).
+            models.Index(fields=['-created_at', '-id'], name='post_recent_idx'),
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_recent_idx'),
+            # Rebuilding the cached trending top-K.
+            models.Index(fields=['-trending_score'], name='post_trending_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.excerpt = make_excerpt(self.content)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content' in update_fields:
+            update_fields = kwargs['update_fields'] = {*update_fields, 'excerpt'}
+        bump = not self._state.adding
+        if bump:
+            # Incremented in the database, so an instance read before a
+            # concurrent like cannot write back an old version.
+            self.version = F('version') + 1
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'version'}
+        super().save(*args, **kwargs)
+        if bump:
+            self.refresh_from_db(fields=['version'])
 
     def _str_(self):
         return self.title
@@ -22,6 +70,12 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='comment_recent_idx'),
+            models.Index(fields=['post', '-created_at', '-id'], name='comment_post_recent_idx'),
+        ]
+
     def _str_(self):
         return self.content
     
@@ -32,5 +86,44 @@ class Like(models.Model):
     post = models.ForeignKey('Post', on_delete=models.CASCADE)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'], name='unique_like'),
+        ]
+
     def _str_(self):
-        return f'{self.user.username} likes {self.post.title}'
\ No newline at end of file
+        return f'{self.user.username} likes {self.post.title}'
+
+class TimelineEntry(models.Model):
+    # Materialized home timeline row: `post` shows up in `owner`'s feed.
+    # created_at is copied from the post so the feed is a range read on the index.
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'post'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-post'], name='timeline_owner_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.owner_id} <- {self.post_id}'
+
+
+class PostSearchDocument(models.Model):
+    # Read-only view of the SQLite FTS5 table behind post search (see posts/search.py).
+    # `document` is the table's hidden column of the same name, which FTS5
+    # treats as a full-text MATCH when compared with =; `rank` is its BM25 score.
+    post = models.OneToOneField(
+        Post, primary_key=True, db_column='rowid', db_constraint=False,
+        on_delete=models.DO_NOTHING, related_name='search_document',
+    )
+    document = models.TextField(db_column='posts_post_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'posts_post_fts'
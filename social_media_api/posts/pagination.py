@@ -0,0 +1,253 @@
+import json
+import math
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def positive_int(value, cutoff=None):
+    # A positive integer query parameter, capped at cutoff; ValueError otherwise.
+    number = int(value)
+    if number <= 0:
+        raise ValueError(f'{value!r} is not a positive integer.')
+    return number if cutoff is None else min(number, cutoff)
+
+
+class KeysetPagination(BasePagination):
+    # Newest-first keyset pagination over (created_at, id).
+    #
+    # Cursors are opaque tokens holding the key of the last row seen, so every
+    # page is an indexed range read: no OFFSET scan and, unless ?count=true is
+    # passed, no COUNT(*). Clients that still send ?page=N get the classic
+    # page-number response.
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    page_query_param = 'page'
+    # Descending key; the last field must be unique. Views can override this
+    # with a `cursor_fields` attribute or a `get_cursor_fields(queryset)` method,
+    # and walk the key in ascending order with `cursor_ascending = True`.
+    cursor_fields = ('created_at', 'id')
+    cursor_ascending = False
+    # The type of every cursor field's value (datetime, int, float or str);
+    # cursors holding anything else are rejected before they reach a query.
+    cursor_types = {'created_at': datetime, 'id': int}
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.start_page(queryset, request, view)
+        if self.legacy:
+            return self.legacy.paginate_queryset(queryset, request, view)
+        if self.count_requested(request):
+            self.count = queryset.count()
+        return self.finish_page(list(self.page_slice(queryset)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # paginate_queryset() for async views, reading through the async ORM.
+        queryset = self.start_page(queryset, request, view)
+        if self.legacy:
+            return await sync_to_async(self.legacy.paginate_queryset)(queryset, request, view)
+        if self.count_requested(request):
+            self.count = await queryset.acount()
+        return self.finish_page([row async for row in self.page_slice(queryset)])
+
+    def start_page(self, queryset, request, view):
+        self.request = request
+        self.legacy = None
+        self.fields = self.get_cursor_fields(queryset, view)
+        self.ascending = getattr(view, 'cursor_ascending', self.cursor_ascending)
+        if self.page_query_param in request.query_params:
+            self.legacy = self.get_page_number_pagination()
+            return queryset.order_by(*self.ordering(self.ascending))
+
+        self.base_url = request.build_absolute_uri()
+        self.page_size_value = self.get_page_size(request)
+        self.position, self.reverse = self.decode_cursor(request)
+        self.count = None
+        return queryset
+
+    def peek_cursor(self, request, view):
+        # (position, reverse) of the requested page, for views that assemble
+        # the candidate rows themselves before paginating them.
+        self.fields = self.get_cursor_fields(None, view)
+        return self.decode_cursor(request)
+
+    def count_requested(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ('1', 'true')
+
+    def ordering(self, ascending):
+        prefix = '' if ascending else '-'
+        return [prefix + field for field in self.fields]
+
+    def page_slice(self, queryset):
+        # Previous pages walk the key the other way.
+        after = self.reverse != self.ascending
+        queryset = queryset.order_by(*self.ordering(after))
+        if self.position is not None:
+            queryset = queryset.filter(self.build_keyset_filter(self.position, after))
+        return queryset[:self.page_size_value + 1]
+
+    def finish_page(self, results):
+        position = self.position
+        has_more = len(results) > self.page_size_value
+        results = results[:self.page_size_value]
+        if self.reverse:
+            results.reverse()
+
+        if self.reverse:
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.first_key = self.get_key(results[0]) if results else position
+        self.last_key = self.get_key(results[-1]) if results else position
+        return results
+
+    def get_cursor_fields(self, queryset, view):
+        if hasattr(view, 'get_cursor_fields'):
+            return tuple(view.get_cursor_fields(queryset))
+        return tuple(getattr(view, 'cursor_fields', self.cursor_fields))
+
+    def build_keyset_filter(self, position, after):
+        # (f1, f2, ...) < (v1, v2, ...) spelled out for backends without row
+        # values, plus a redundant f1 <= v1 so the planner can seek the index
+        # instead of scanning it from the start.
+        lookup = 'gt' if after else 'lt'
+        condition = Q()
+        for i, field in enumerate(self.fields):
+            clause = Q(**{f'{field}__{lookup}': position[i]})
+            for prev_field, prev_value in zip(self.fields[:i], position[:i]):
+                clause &= Q(**{prev_field: prev_value})
+            condition |= clause
+        return Q(**{f'{self.fields[0]}__{lookup}e': position[0]}) & condition
+
+    def get_key(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return positive_int(request.query_params[self.page_size_query_param], cutoff=self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_page_number_pagination(self):
+        paginator = PageNumberPagination()
+        paginator.page_size = self.page_size
+        paginator.page_size_query_param = self.page_size_query_param
+        paginator.max_page_size = self.max_page_size
+        paginator.page_query_param = self.page_query_param
+        return paginator
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        types = self.get_cursor_types()
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            values, reverse = payload['p'], payload.get('r', 0)
+            if not isinstance(values, list) or len(values) != len(types) or reverse not in (0, 1):
+                raise ValueError
+            return [self.decode_value(value, kind) for value, kind in zip(values, types)], bool(reverse)
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_cursor_types(self):
+        try:
+            return [self.cursor_types[field] for field in self.fields]
+        except KeyError as exc:
+            raise ImproperlyConfigured(f'{type(self).__name__}.cursor_types has no type for {exc}.')
+
+    # Datetimes travel as '@<isoformat>'; strings that start with '@' get
+    # another one.
+    def encode_value(self, value):
+        if isinstance(value, datetime):
+            return '@' + value.isoformat()
+        if isinstance(value, str) and value.startswith('@'):
+            return '@' + value
+        return value
+
+    def decode_value(self, value, kind):
+        # Raises ValueError unless value is a well-formed `kind`.
+        if kind is datetime:
+            moment = parse_datetime(value[1:]) if isinstance(value, str) and value.startswith('@') else None
+            if moment is None or (settings.USE_TZ and moment.tzinfo is None):
+                raise ValueError
+            return moment
+        if kind is int:
+            if type(value) is not int:
+                raise ValueError
+            return value
+        if kind is float:
+            if type(value) not in (int, float) or not math.isfinite(value):
+                raise ValueError
+            return float(value)
+        if kind is str:
+            if not isinstance(value, str):
+                raise ValueError
+            if value.startswith('@'):
+                if not value.startswith('@@'):
+                    raise ValueError
+                return value[1:]
+            return value
+        raise ImproperlyConfigured(f'Unsupported cursor type: {kind!r}')
+
+    def encode_cursor(self, position, reverse):
+        values = [self.encode_value(value) for value in position]
+        payload = json.dumps({'p': values, 'r': int(reverse)}, separators=(',', ':'))
+        encoded = urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if self.legacy:
+            return self.legacy.get_next_link()
+        if not self.has_next or self.last_key is None:
+            return None
+        return self.encode_cursor(self.last_key, reverse=False)
+
+    def get_previous_link(self):
+        if self.legacy:
+            return self.legacy.get_previous_link()
+        if not self.has_previous:
+            return None
+        if self.first_key is None:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.first_key, reverse=True)
+
+    def get_paginated_response(self, data):
+        if self.legacy:
+            return self.legacy.get_paginated_response(data)
+        body = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            body = {'count': self.count, **body}
+        return Response(body)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
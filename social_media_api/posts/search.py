@@ -0,0 +1,105 @@
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+from rest_framework import filters
+
+
+# Full-text search for posts.
+#
+# POSTS_SEARCH_BACKEND names a backend class; the default FTS5SearchBackend keeps
+# an SQLite FTS5 index of post titles and bodies so a search is an index lookup
+# ranked by BM25 instead of a LIKE '%term%' scan of posts_post. When no backend
+# is configured, or the database cannot serve it, PostSearchFilter falls back to
+# DRF's SearchFilter over `search_fields`.
+
+
+class FTS5SearchBackend:
+    table = 'posts_post_fts'
+
+    def __init__(self):
+        self._available = {}
+
+    def is_available(self, using='default'):
+        if using not in self._available:
+            connection = connections[using]
+            self._available[using] = (
+                connection.vendor == 'sqlite'
+                and self.table in connection.introspection.table_names()
+            )
+        return self._available[using]
+
+    def build_query(self, terms):
+        # Every term is a quoted prefix token, and FTS5 ANDs adjacent tokens,
+        # so "dja rest" matches posts containing words starting with both.
+        tokens = []
+        for term in terms:
+            word = ''.join(ch if ch.isalnum() else ' ' for ch in term).strip()
+            if word:
+                tokens.append('"%s"*' % word)
+        return ' '.join(tokens)
+
+    def search(self, queryset, terms):
+        query = self.build_query(terms)
+        if not query:
+            return queryset.none()
+        # FTS5's rank is bm25(), where lower is better; negate it so the
+        # keyset paginator can walk it in descending order.
+        return queryset.filter(search_document__document=query).annotate(
+            search_rank=F('search_document__rank') * -1
+        )
+
+    def index(self, post, using='default'):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [post.pk])
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, content) VALUES (%s, %s, %s)',
+                [post.pk, post.title, post.content],
+            )
+
+    def index_many(self, posts, using='default'):
+        # For bulk_create, which does not send post_save.
+        with connections[using].cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, title, content) VALUES (%s, %s, %s)',
+                [(post.pk, post.title, post.content) for post in posts],
+            )
+
+    def remove(self, post_id, using='default'):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [post_id])
+
+    def rebuild(self, using='default'):
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, content) '
+                f'SELECT id, title, content FROM posts_post'
+            )
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+
+
+_backends = {}
+
+
+def get_search_backend(using='default'):
+    path = getattr(settings, 'POSTS_SEARCH_BACKEND', None)
+    if not path:
+        return None
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    backend = _backends[path]
+    return backend if backend.is_available(using) else None
+
+
+class PostSearchFilter(filters.SearchFilter):
+    # Ranked full-text search when a backend is available, LIKE search otherwise.
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        backend = get_search_backend(queryset.db)
+        if backend is None:
+            return super().filter_queryset(request, queryset, view)
+        return backend.search(queryset, terms)
@@ -1,18 +1,47 @@
 from rest_framework import serializers
 from .models import Post, Comment, Like
 from django.contrib.auth import get_user_model
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from accounts.serializers import AvatarField
+from .sparse import SparseFieldsMixin
+from .viewer import viewer_flags
 
 
 User = get_user_model()
 
-class PostSerializer(serializers.ModelSerializer):
-    author = serializers.ReadOnlyField(source='author.username')
 
-    class Meta:
-        model = Post
-        fields = ('id', 'author', 'title', 'content', 'created_at', 'updated_at')
+def _latest_comments_queryset(post_ids, limit):
+    newest_first = Window(
+        RowNumber(),
+        partition_by=F('post_id'),
+        order_by=[F('created_at').desc(), F('id').desc()],
+    )
+    return (
+        Comment.objects.filter(post_id__in=post_ids)
+        .select_related('author')
+        .annotate(position=newest_first)
+        .filter(position__lte=limit)
+        .order_by('post_id', 'position')
+    )
+
+
+def latest_comments_by_post(post_ids, limit):
+    # The newest `limit` comments of each post, for a whole page in one query.
+    previews = {post_id: [] for post_id in post_ids}
+    for comment in _latest_comments_queryset(post_ids, limit):
+        previews[comment.post_id].append(comment)
+    return previews
 
-class CommentSerializer(serializers.ModelSerializer):
+
+async def alatest_comments_by_post(post_ids, limit):
+    previews = {post_id: [] for post_id in post_ids}
+    async for comment in _latest_comments_queryset(post_ids, limit):
+        previews[comment.post_id].append(comment)
+    return previews
+
+
+class CommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
 
     class Meta:
@@ -20,7 +49,99 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = ('id', 'post', 'author', 'content', 'created_at', 'updated_at')
 
 
-class LikeSerializer(serializers.ModelSerializer):
+def _viewer(context):
+    request = context.get('request')
+    return getattr(request, 'user', None)
+
+
+class LikedByMeField(serializers.ReadOnlyField):
+    # Whether the requesting user liked the post, buffered likes included.
+    def __init__(self, **kwargs):
+        super().__init__(source='id', **kwargs)
+
+    def to_representation(self, post_id):
+        liked, _ = self.parent.viewer_flags
+        return post_id in liked or post_id in self.context.get('pending_likes', ())
+
+
+class FollowingAuthorField(serializers.ReadOnlyField):
+    # Whether the requesting user follows the post's author. The source names
+    # the relation so sparse querysets keep its column; only the id is read.
+    def __init__(self, **kwargs):
+        super().__init__(source='author', **kwargs)
+
+    def get_attribute(self, instance):
+        return instance.author_id
+
+    def to_representation(self, author_id):
+        _, followed = self.parent.viewer_flags
+        return author_id in followed
+
+
+class PostListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Async views fetch the previews and flags themselves before serializing.
+        if self.context.get('preview_comments') and 'comment_previews' not in self.context:
+            data = list(data)
+            self.context['comment_previews'] = latest_comments_by_post(
+                [post.pk for post in data], self.context['preview_comments']
+            )
+        if self.child.has_viewer_flags and 'viewer_flags' not in self.context:
+            data = list(data)
+            user = _viewer(self.context)
+            self.context['viewer_flags'] = viewer_flags(user, data) if user else (set(), set())
+        return super().to_representation(data)
+
+
+class PostSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    author = serializers.ReadOnlyField(source='author.username')
+    author_avatar = AvatarField('small', source='author')
+    liked_by_me = LikedByMeField()
+    following_author = FollowingAuthorField()
+
+    class Meta:
+        model = Post
+        fields = (
+            'id', 'author', 'author_avatar', 'title', 'content', 'created_at', 'updated_at',
+            'like_count', 'comment_count', 'liked_by_me', 'following_author',
+        )
+        read_only_fields = ('like_count', 'comment_count')
+        list_serializer_class = PostListSerializer
+
+    @property
+    def has_viewer_flags(self):
+        return 'liked_by_me' in self.fields or 'following_author' in self.fields
+
+    def to_representation(self, instance):
+        # Lists look the flags up for the whole page in PostListSerializer.
+        self.viewer_flags = self.context.get('viewer_flags')
+        if self.viewer_flags is None and self.has_viewer_flags:
+            user = _viewer(self.context)
+            self.viewer_flags = viewer_flags(user, [instance]) if user else (set(), set())
+        data = super().to_representation(instance)
+        if 'like_count' in data and instance.pk in self.context.get('pending_likes', ()):
+            data['like_count'] += 1
+        # ?preview_comments=N embeds the newest N comments; lists prefetch them
+        # for the whole page in PostListSerializer.
+        limit = self.context.get('preview_comments')
+        if limit:
+            previews = self.context.get('comment_previews')
+            if previews is None:
+                previews = latest_comments_by_post([instance.pk], limit)
+            data['latest_comments'] = CommentSerializer(previews.get(instance.pk, []), many=True).data
+        return data
+
+
+class PostExcerptSerializer(PostSerializer):
+    # List and feed representation: the stored excerpt instead of the body.
+    class Meta(PostSerializer.Meta):
+        fields = (
+            'id', 'author', 'author_avatar', 'title', 'excerpt', 'created_at', 'updated_at',
+            'like_count', 'comment_count', 'liked_by_me', 'following_author',
+        )
+
+
+class LikeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Like
         fields = ('id', 'user', 'post', 'timestamp')
@@ -28,4 +149,17 @@ class LikeSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
-        return Like.objects.create(**validated_data)
\ No newline at end of file
+        return Like.objects.create(**validated_data)
+
+
+class LikeTargetSerializer(serializers.Serializer):
+    post = serializers.IntegerField(min_value=1)
+
+
+class LikeActionSerializer(LikeTargetSerializer):
+    action = serializers.ChoiceField(choices=('like', 'unlike'))
+
+
+class LikeBatchSerializer(serializers.Serializer):
+    # Offline clients replay their queued actions in order; the last action per post wins.
+    actions = LikeActionSerializer(many=True, allow_empty=False, max_length=500)
@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Post
+from .feed_index import invalidate_authors
+from .search import get_search_backend
+from .trending import forget_post
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, using, **kwargs):
+    backend = get_search_backend(using)
+    if backend is not None:
+        backend.index(instance, using=using)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, using, **kwargs):
+    backend = get_search_backend(using)
+    if backend is not None:
+        backend.remove(instance.pk, using=using)
+
+
+@receiver(post_delete, sender=Post)
+def drop_trending_post(sender, instance, **kwargs):
+    forget_post(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def refresh_recent_index(sender, instance, created, using, **kwargs):
+    # Edits keep (created_at, id); only a new post changes its author's list.
+    # Dropped after commit so a concurrent reload cannot cache the old list.
+    if created:
+        transaction.on_commit(lambda: invalidate_authors([instance.author_id]), using=using)
+
+
+@receiver(post_delete, sender=Post)
+def drop_from_recent_index(sender, instance, using, **kwargs):
+    transaction.on_commit(lambda: invalidate_authors([instance.author_id]), using=using)
@@ -0,0 +1,95 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+# Sparse fieldsets.
+#
+# ?fields=id,title,author trims a serializer's output to the named fields, and
+# views narrow their queryset with .only() to the columns those fields read (all
+# of the serializer's fields without ?fields=), so columns nobody renders (post
+# bodies above all) are never loaded from disk.
+
+FIELDS_QUERY_PARAM = 'fields'
+
+
+def requested_fields(request):
+    if request is None:
+        return None
+    value = request.query_params.get(FIELDS_QUERY_PARAM)
+    if not value:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def select_fields(fields, names):
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        raise serializers.ValidationError({FIELDS_QUERY_PARAM: [f"Unknown field: {name}." for name in unknown]})
+    return [name for name in fields if name in names]
+
+
+def only_columns(queryset, names):
+    # queryset loading just `names`, with '__' paths joining their relation.
+    # Names that are not model fields, such as annotations, are always selected.
+    columns, related = set(), set()
+    for name in names:
+        path = name.split('__')
+        try:
+            queryset.model._meta.get_field(path[0])
+        except FieldDoesNotExist:
+            continue
+        columns.add(name)
+        if len(path) > 1:
+            related.add(path[0])
+    # A relation left out must not be joined either: Django refuses to defer a
+    # relation and select_related() it at once.
+    queryset = queryset.select_related(None)
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*columns)
+
+
+class SparseFieldsMixin:
+    # Serializer side. Only serializers rendering existing objects are trimmed;
+    # ones bound to input data keep every field so validation is unaffected.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        names = requested_fields(self.context.get('request'))
+        if names is None or 'data' in kwargs:
+            return
+        selected = select_fields(self.fields, names)
+        for name in list(self.fields):
+            if name not in selected:
+                self.fields.pop(name)
+
+
+class SparseQuerysetMixin:
+    # View side: narrows reads to the columns behind the requested fields.
+    def get_queryset(self):
+        return self.sparse_queryset(super().get_queryset())
+
+    def sparse_queryset(self, queryset, serializer_class=None):
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        serializer_fields = (serializer_class or self.get_serializer_class())().fields
+        names = requested_fields(self.request)
+        selected = list(serializer_fields) if names is None else select_fields(serializer_fields, names)
+        columns = {queryset.model._meta.pk.name}
+        for name in selected:
+            field = serializer_fields[name]
+            # Fields reading several attributes name them in `sparse_sources`.
+            for source in getattr(field, 'sparse_sources', (field.source,)):
+                if source == '*':
+                    # Computed from the whole object; nothing can be deferred safely.
+                    return queryset
+                columns.add('__'.join(source.split('.')))
+        columns.update(self.get_sparse_required_fields(queryset))
+        return only_columns(queryset, columns)
+
+    def get_sparse_required_fields(self, queryset):
+        # Keyset pagination reads the cursor fields off every row.
+        paginator = self.paginator
+        if paginator is not None and hasattr(paginator, 'get_cursor_fields'):
+            return paginator.get_cursor_fields(queryset, self)
+        return ()
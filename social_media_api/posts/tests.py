@@ -1,3 +1,1191 @@
-from django.test import TestCase
+import csv
+import json
+import shutil
+import tempfile
+import time
+from base64 import urlsafe_b64encode
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Q
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from accounts.avatars import clear_profile_picture
+from accounts.follows import Follow, follow, followed_by, followers_of, unfollow
+from accounts.models import FollowSuggestion
+from notifications.models import Notification
+from query_budget import QueryBudgetMixin
+from .like_buffer import LikeBuffer, get_like_buffer
+from .bulk import import_posts
+from .likes import like_post, unlike_post, write_likes
+from .models import EXCERPT_LENGTH, Comment, Like, Post, TimelineEntry
+from .pagination import KeysetPagination
+from .trending import TRENDING_CACHE_KEY, current_score
+from .timeline import backfill_following, fan_out_post, fan_out_posts, get_feed_queryset, rebuild_timeline
+
+User = get_user_model()
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite-specific.')
+class QueryPlanTests(TestCase):
+    # Every hot queryset must be answered from an index: no full table scan,
+    # and, where the index can supply the order, no temporary sort either.
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader')
+        cls.author = User.objects.create_user('author')
+        follow(cls.reader, cls.author)
+        cls.posts = [
+            Post.objects.create(author=cls.author, title=f'post {i}', content='body')
+            for i in range(5)
+        ]
+        cls.post = cls.posts[-1]
+        rebuild_timeline(cls.reader)
+        Like.objects.create(user=cls.reader, post=cls.post)
+        Comment.objects.create(post=cls.post, author=cls.reader, content='comment')
+        Notification.objects.create(recipient=cls.author, actor=cls.reader, verb='liked your post')
+
+    def setUp(self):
+        cache.clear()
+
+    def plan_details(self, queryset):
+        # Each plan row is "<id> <parent> <notused> <detail>".
+        return [line.split(' ', 3)[-1] for line in queryset.explain().splitlines()]
+
+    def assertNoFullScan(self, queryset):
+        for detail in self.plan_details(queryset):
+            if detail.startswith('SCAN ') and 'USING' not in detail and 'VIRTUAL TABLE' not in detail:
+                self.fail(f'Full table scan: {detail}\n{queryset.query}')
+
+    def assertIndexed(self, queryset):
+        self.assertNoFullScan(queryset)
+        for detail in self.plan_details(queryset):
+            self.assertNotIn('TEMP B-TREE', detail, f'Sort not served by an index:\n{queryset.query}')
+
+    def keyset_page(self, queryset, fields, after):
+        paginator = KeysetPagination()
+        paginator.fields = fields
+        position = [getattr(after, field) for field in fields]
+        ordering = ['-' + field for field in fields]
+        return queryset.filter(paginator.build_keyset_filter(position, False)).order_by(*ordering)[:10]
+
+    def test_feed_from_timeline(self):
+        feed = get_feed_queryset(self.reader)
+        self.assertIndexed(feed[:10])
+        page = self.keyset_page(feed, ('feed_created_at', 'feed_post_id'), feed[1])
+        self.assertIndexed(page)
+        self.assertIn(
+            'SEARCH posts_timelineentry USING COVERING INDEX timeline_owner_recent_idx (owner_id=? AND created_at<?)',
+            self.plan_details(page),
+        )
+
+    @override_settings(FEED_CELEBRITY_THRESHOLD=1)
+    def test_feed_with_celebrity_pull(self):
+        # Merging two sources needs a sort, but both sides must still be index reads.
+        self.assertNoFullScan(get_feed_queryset(self.reader)[:10])
+
+    def test_post_list_pages(self):
+        self.assertIndexed(Post.objects.order_by('-created_at', '-id')[:10])
+        page = self.keyset_page(Post.objects.all(), ('created_at', 'id'), self.posts[2])
+        self.assertIndexed(page)
+        self.assertTrue(any(detail.startswith('SEARCH posts_post') for detail in self.plan_details(page)))
+
+    def test_posts_by_author(self):
+        self.assertIndexed(Post.objects.filter(author=self.author).order_by('-created_at', '-id')[:10])
+
+    def test_trending_top(self):
+        self.assertIndexed(Post.objects.filter(trending_score__isnull=False).order_by('-trending_score')[:100])
+
+    def test_like_lookup(self):
+        self.assertIndexed(Like.objects.filter(user=self.reader, post=self.post))
+
+    def test_comments_for_post(self):
+        self.assertIndexed(Comment.objects.filter(post=self.post).order_by('-created_at', '-id')[:20])
+
+    def test_notifications_for_recipient(self):
+        self.assertIndexed(Notification.objects.filter(recipient=self.author).order_by('-timestamp')[:20])
+
+    def test_follow_lists(self):
+        for follows, user in [(followers_of, self.author), (followed_by, self.reader)]:
+            rows = follows(user.pk)
+            self.assertIndexed(rows.order_by('-id')[:50])
+            self.assertIndexed(self.keyset_page(rows, ('id',), rows.get()))
+
+    def test_relationships(self):
+        ids = [self.author.pk, self.reader.pk + 100]
+        self.assertNoFullScan(Follow.objects.filter(
+            Q(to_customuser=self.reader, from_customuser__in=ids) | Q(from_customuser=self.reader, to_customuser__in=ids)
+        ))
+
+    def test_follow_suggestions(self):
+        self.assertIndexed(FollowSuggestion.objects.filter(user=self.reader).order_by('rank'))
+
+    def test_user_directory(self):
+        users = User.objects.filter(is_active=True)
+        self.assertIndexed(users.order_by('username_key', 'id')[:50])
+        prefix = users.filter(username_key__gte='au', username_key__lt='av').order_by('username_key', 'id')
+        self.assertIndexed(prefix[:50])
+        self.assertIn('user_username_key_idx', ' '.join(self.plan_details(prefix[:50])))
+
+    def test_celebrity_ids(self):
+        self.assertNoFullScan(User.objects.filter(followers_count__gte=10000).values_list('id', flat=True))
+
+
+class ListQueryBudgetTests(QueryBudgetMixin, TestCase):
+    # Every list endpoint must cost the same number of queries at N and 10*N rows.
+
+    def setUp(self):
+        cache.clear()
+        caches[settings.FEED_INDEX_CACHE].clear()
+        self.reader = User.objects.create_user('reader')
+        self.post = Post.objects.create(author=self.reader, title='thread', content='body')
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+        self.authors = 0
+
+    def new_author(self):
+        self.authors += 1
+        author = User.objects.create_user(f'author{self.authors}')
+        follow(self.reader, author)
+        return author
+
+    def seed_posts(self, n):
+        for i in range(n):
+            # Each row by a different followed author, so per-author lookups show up.
+            post = Post.objects.create(author=self.new_author(), title=f'post {i}', content='body')
+            Comment.objects.create(post=post, author=self.new_author(), content='first')
+            Comment.objects.create(post=post, author=self.new_author(), content='second')
+        rebuild_timeline(self.reader)
+
+    def seed_comments(self, n):
+        for i in range(n):
+            Comment.objects.create(post=self.post, author=self.new_author(), content=f'comment {i}')
+
+    def seed_following(self, n):
+        for _ in range(n):
+            self.new_author()
+
+    def seed_followers(self, n):
+        for _ in range(n):
+            self.authors += 1
+            follow(User.objects.create_user(f'follower{self.authors}'), self.reader)
+
+    def seed_suggestions(self, n):
+        rank = FollowSuggestion.objects.filter(user=self.reader).count()
+        for i in range(n):
+            self.authors += 1
+            suggested = User.objects.create_user(f'suggested{self.authors}')
+            FollowSuggestion.objects.create(user=self.reader, suggested=suggested, mutual=1, rank=rank + i + 1)
+
+    def get(self, url):
+        return lambda: self.client.get(url)
+
+    def test_list_endpoints(self):
+        endpoints = [
+            ('/api/posts/posts/', self.seed_posts),
+            ('/api/posts/posts/?page=1', self.seed_posts),
+            ('/api/posts/posts/?search=post', self.seed_posts),
+            ('/api/posts/posts/?preview_comments=2', self.seed_posts),
+            ('/api/posts/posts/?fields=id,title', self.seed_posts),
+            ('/api/posts/feed/', self.seed_posts),
+            ('/api/posts/feed/?preview_comments=2', self.seed_posts),
+            ('/api/posts/feed/?fields=id,author', self.seed_posts),
+            ('/api/posts/async/feed/?preview_comments=2', self.seed_posts),
+            ('/api/posts/comments/', self.seed_comments),
+            ('/api/posts/comments/?fields=id,content', self.seed_comments),
+            (f'/api/posts/posts/{self.post.pk}/comments/', self.seed_comments),
+            (f'/api/accounts/users/{self.reader.pk}/followers/', self.seed_followers),
+            (f'/api/accounts/users/{self.reader.pk}/following/', self.seed_following),
+            ('/api/accounts/suggestions/', self.seed_suggestions),
+            ('/api/accounts/users/', self.seed_following),
+            ('/api/accounts/users/?q=author', self.seed_following),
+        ]
+        for url, seed in endpoints:
+            with self.subTest(url=url):
+                self.assertQueryBudget(self.get(url), seed)
+
+    @override_settings(AUTOCOMPLETE_SYNC_INTERVAL=0)
+    def test_autocomplete_sync(self):
+        # Every request catches up with the users added since the last one.
+        endpoints = [
+            ('/api/accounts/autocomplete/?q=author', self.seed_following),
+        ]
+        for url, seed in endpoints:
+            with self.subTest(url=url):
+                self.assertQueryBudget(self.get(url), seed)
+
+    @override_settings(FEED_ENGINE='recent_index')
+    def test_feed_index_endpoints(self):
+        def cold_get(url):
+            # Every author's list is a cache miss, the costliest case.
+            def fetch():
+                caches[settings.FEED_INDEX_CACHE].clear()
+                return self.client.get(url)
+            return fetch
+
+        for url in ['/api/posts/feed/', '/api/posts/async/feed/?preview_comments=2']:
+            with self.subTest(url=url):
+                self.assertQueryBudget(cold_get(url), self.seed_posts)
+
+
+class KeysetCursorTests(APITestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('reader')
+        for i in range(3):
+            Post.objects.create(author=self.reader, title=f'post {i}', content='body')
+        self.client.force_authenticate(self.reader)
+
+    def cursor(self, payload):
+        return urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    def test_cursor_pages(self):
+        response = self.client.get('/api/posts/posts/?page_size=2')
+        self.assertEqual([post['title'] for post in response.json()['results']], ['post 2', 'post 1'])
+        response = self.client.get(response.json()['next'])
+        self.assertEqual([post['title'] for post in response.json()['results']], ['post 0'])
+
+    def test_page_size_bounds(self):
+        # Invalid sizes fall back to the default of 10, i.e. all three posts.
+        for page_size, expected in [('2', 2), ('1000', 3), ('0', 3), ('-1', 3), ('two', 3)]:
+            with self.subTest(page_size=page_size):
+                response = self.client.get('/api/posts/posts/', {'page_size': page_size})
+                self.assertEqual(len(response.json()['results']), expected)
+
+    def test_limit_parameters(self):
+        self.assertEqual(self.client.get('/api/posts/posts/trending/', {'limit': '2'}).status_code, 200)
+        for url, param in [('/api/posts/posts/trending/', 'limit'), ('/api/accounts/autocomplete/', 'limit'),
+                           ('/api/posts/posts/import/', 'batch_size')]:
+            for value in ['0', '-3', '1.5', 'ten']:
+                with self.subTest(url=url, value=value):
+                    method = self.client.post if url.endswith('import/') else self.client.get
+                    response = method(f'{url}?{param}={value}&q=re')
+                    self.assertEqual(response.status_code, 400)
+
+    def test_tampered_cursors_are_not_found(self):
+        post = Post.objects.earliest('id')
+        moment = '@' + post.created_at.isoformat()
+        payloads = [
+            {'p': [moment, str(post.pk)]},
+            {'p': [moment, True]},
+            {'p': [moment, 1.5]},
+            {'p': [post.created_at.isoformat(), post.pk]},
+            {'p': ['@yesterday', post.pk]},
+            {'p': ['@' + post.created_at.replace(tzinfo=None).isoformat(), post.pk]},
+            {'p': [moment, {'id': post.pk}]},
+            {'p': [moment]},
+            {'p': moment},
+            {'p': [moment, post.pk], 'r': 'yes'},
+            [moment, post.pk],
+        ]
+        for payload in payloads:
+            with self.subTest(payload=payload):
+                response = self.client.get('/api/posts/posts/', {'cursor': self.cursor(payload)})
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+        response = self.client.get('/api/posts/posts/', {'cursor': 'not base64!'})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get('/api/posts/posts/', {'cursor': self.cursor({'p': [moment, post.pk]})})
+        self.assertEqual(response.status_code, 200)
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.post = Post.objects.create(author=self.author, title='post', content='body')
+        Comment.objects.create(post=self.post, author=self.author, content='comment')
+
+    def test_author_changes_invalidate_etags(self):
+        urls = ['/api/posts/posts/', f'/api/posts/posts/{self.post.pk}/', '/api/posts/comments/']
+        for url in urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                self.author.username = f'renamed{self.author.profile_version}'
+                self.author.save()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(self.author.username, response.content.decode())
+
+    def test_list_etags_follow_each_row(self):
+        # Moving a like from one post to another leaves every total unchanged.
+        other = Post.objects.create(author=self.author, title='other', content='body')
+        reader = User.objects.create_user('reader')
+        like_post(reader, self.post.pk)
+        url = '/api/posts/posts/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        unlike_post(reader, self.post.pk)
+        like_post(reader, other.pk)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({post['id']: post['like_count'] for post in response.json()['results']},
+                         {self.post.pk: 0, other.pk: 1})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_list_etags_read_only_the_page(self):
+        for i in range(3):
+            Post.objects.create(author=self.author, title=f'more {i}', content='body')
+        url = '/api/posts/posts/?page_size=2'
+        with CaptureQueriesContext(connection) as queries:
+            etag = self.client.get(url)['ETag']
+        self.assertEqual(len(queries), 1)
+        self.assertIn('LIMIT 3', queries[0]['sql'])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('LIMIT 3', queries[0]['sql'])
+        self.assertNotIn('"content"', queries[0]['sql'])
+        # A post beyond the page leaves its ETag alone.
+        like_post(User.objects.create_user('reader'), self.post.pk)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_viewer_flags_in_etags(self):
+        reader = User.objects.create_user('reader')
+        self.client.force_authenticate(reader)
+        for url, change in [('/api/posts/posts/', follow), (f'/api/posts/posts/{self.post.pk}/', unfollow)]:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                change(reader, self.author)
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_no_last_modified(self):
+        # Likes leave updated_at alone, so If-Modified-Since cannot be honored.
+        url = f'/api/posts/posts/{self.post.pk}/'
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        like_post(self.author, self.post.pk)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['like_count'], 1)
+
+    def test_malformed_ids_are_not_found(self):
+        for url in ['/api/posts/posts/abc/', '/api/posts/comments/abc/', '/api/posts/posts/0/']:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_avatar_changes_invalidate_etags(self):
+        url = '/api/posts/posts/'
+        etag = self.client.get(url)['ETag']
+        clear_profile_picture(self.author)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(FEED_TIMELINE_LENGTH=2, FEED_FANOUT_BATCH_SIZE=2)
+class TimelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author')
+        self.readers = [User.objects.create_user(f'reader{i}') for i in range(3)]
+        for reader in self.readers:
+            follow(reader, self.author)
+
+    def timeline(self, reader):
+        return list(
+            TimelineEntry.objects.filter(owner=reader).order_by('-created_at', '-post_id').values_list('post_id', flat=True)
+        )
+
+    def test_fan_out_keeps_the_newest_entries(self):
+        posts = []
+        for i in range(4):
+            posts.append(Post.objects.create(author=self.author, title=f'post {i}', content='body'))
+            fan_out_post(posts[-1])
+        newest = [posts[3].pk, posts[2].pk]
+        for reader in self.readers:
+            self.assertEqual(self.timeline(reader), newest)
+
+    def test_bulk_fan_out_trims_every_batch(self):
+        posts = [Post.objects.create(author=self.author, title=f'post {i}', content='body') for i in range(3)]
+        fan_out_posts(posts)
+        newest = [posts[2].pk, posts[1].pk]
+        for reader in self.readers:
+            self.assertEqual(self.timeline(reader), newest)
+
+    def feed(self, reader):
+        client = APIClient()
+        client.force_authenticate(reader)
+        titles, url = [], '/api/posts/feed/?page_size=1'
+        while url:
+            body = client.get(url).json()
+            titles += [post['title'] for post in body['results']]
+            url = body['next']
+        return titles
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        posts = [Post.objects.create(author=self.author, title=f'post {i}', content='body') for i in range(3)]
+        newcomer = User.objects.create_user('newcomer')
+        client = APIClient()
+        client.force_authenticate(newcomer)
+        client.post(f'/api/accounts/follow/{self.author.pk}/')
+        self.assertEqual(self.timeline(newcomer), [posts[2].pk, posts[1].pk])
+
+        fan_out_posts(posts)
+        client.post(f'/api/accounts/unfollow/{self.author.pk}/')
+        self.assertEqual(self.timeline(newcomer), [])
+        self.assertEqual(self.feed(newcomer), [])
+        self.assertEqual(self.timeline(self.readers[0]), [posts[2].pk, posts[1].pk])
+
+    def test_feed_ends_with_the_timeline(self):
+        # Pushed feeds are only FEED_TIMELINE_LENGTH posts deep.
+        for i in range(3):
+            fan_out_post(Post.objects.create(author=self.author, title=f'post {i}', content='body'))
+        self.assertEqual(self.feed(self.readers[0]), ['post 2', 'post 1'])
+
+    @override_settings(FEED_CELEBRITY_THRESHOLD=3)
+    def test_celebrity_posts_are_pulled(self):
+        regular = User.objects.create_user('regular')
+        reader = self.readers[0]
+        follow(reader, regular)
+        for i, author in enumerate([self.author, regular, self.author]):
+            post = Post.objects.create(author=author, title=f'{author.username} {i}', content='body')
+            Post.objects.filter(pk=post.pk).update(created_at=datetime(2024, 5, 1, i, tzinfo=dt_timezone.utc))
+            post.refresh_from_db()
+            fan_out_post(post)
+        # Only the regular author's post was pushed, yet the feed merges all three.
+        self.assertEqual(TimelineEntry.objects.filter(owner=reader).count(), 1)
+        self.assertEqual(self.feed(reader), ['author 2', 'regular 1', 'author 0'])
+
+        newcomer = User.objects.create_user('newcomer')
+        follow(newcomer, self.author)
+        backfill_following(newcomer, self.author)
+        self.assertEqual(self.timeline(newcomer), [])
+        self.assertEqual(self.feed(newcomer), ['author 2', 'author 0'])
+
+
+class LikeTests(APITestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('reader')
+        self.author = User.objects.create_user('author')
+        self.post = Post.objects.create(author=self.author, title='liked', content='body')
+        self.other = Post.objects.create(author=self.author, title='other', content='body')
+        self.client.force_authenticate(self.reader)
+
+    def like_count(self, post):
+        post.refresh_from_db()
+        return post.like_count
+
+    def test_like_is_idempotent(self):
+        self.assertEqual(self.client.post('/api/posts/like/', {'post': self.post.pk}).status_code, 201)
+        self.assertEqual(self.client.post('/api/posts/like/', {'post': self.post.pk}).status_code, 200)
+        self.assertEqual(Like.objects.filter(user=self.reader, post=self.post).count(), 1)
+        self.assertEqual(self.like_count(self.post), 1)
+        self.assertEqual(Notification.objects.filter(recipient=self.author).count(), 1)
+
+    def test_unlike(self):
+        self.client.post('/api/posts/like/', {'post': self.post.pk})
+        self.assertEqual(self.client.delete('/api/posts/unlike/', {'post': self.post.pk}).status_code, 204)
+        self.assertEqual(self.client.delete('/api/posts/unlike/', {'post': self.post.pk}).status_code, 400)
+        self.assertEqual(self.like_count(self.post), 0)
+
+    def test_missing_and_malformed_posts(self):
+        missing = self.other.pk + 100
+        self.assertEqual(self.client.post('/api/posts/like/', {'post': missing}).status_code, 404)
+        self.assertEqual(self.client.delete('/api/posts/unlike/', {'post': missing}).status_code, 404)
+        self.assertEqual(self.client.post('/api/posts/like/', {'post': 'first'}).status_code, 400)
+        self.assertFalse(Like.objects.exists())
+
+    def test_batch_applies_the_last_action_per_post(self):
+        self.client.post('/api/posts/like/', {'post': self.other.pk})
+        missing = self.other.pk + 100
+        response = self.client.post('/api/posts/like/batch/', {'actions': [
+            {'post': self.post.pk, 'action': 'unlike'},
+            {'post': self.post.pk, 'action': 'like'},
+            {'post': self.other.pk, 'action': 'unlike'},
+            {'post': missing, 'action': 'like'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        results = {row['post']: row['result'] for row in response.json()['results']}
+        self.assertEqual(results, {self.post.pk: 'liked', self.other.pk: 'unliked', missing: 'not_found'})
+        self.assertEqual((self.like_count(self.post), self.like_count(self.other)), (1, 0))
+        self.assertEqual(list(Like.objects.values_list('post_id', flat=True)), [self.post.pk])
+
+        response = self.client.post('/api/posts/like/batch/', {'actions': [
+            {'post': self.post.pk, 'action': 'like'}, {'post': self.other.pk, 'action': 'unlike'},
+        ]}, format='json')
+        results = {row['post']: row['result'] for row in response.json()['results']}
+        self.assertEqual(results, {self.post.pk: 'already_liked', self.other.pk: 'not_liked'})
+        self.assertEqual((self.like_count(self.post), self.like_count(self.other)), (1, 0))
+
+
+class PostCounterTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.post = Post.objects.create(author=self.author, title='counted', content='body')
+        self.other = Post.objects.create(author=self.author, title='other', content='body')
+        self.client.force_authenticate(self.author)
+
+    def counters(self, post):
+        post.refresh_from_db()
+        return post.like_count, post.comment_count
+
+    def test_comment_count_follows_comments(self):
+        ids = []
+        for content in ['first', 'second']:
+            response = self.client.post('/api/posts/comments/', {'post': self.post.pk, 'content': content})
+            self.assertEqual(response.status_code, 201)
+            ids.append(response.json()['id'])
+        self.assertEqual(self.counters(self.post), (0, 2))
+
+        response = self.client.patch(f'/api/posts/comments/{ids[0]}/', {'post': self.other.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((self.counters(self.post), self.counters(self.other)), ((0, 1), (0, 1)))
+
+        for pk in ids:
+            self.assertEqual(self.client.delete(f'/api/posts/comments/{pk}/').status_code, 204)
+        self.assertEqual((self.counters(self.post), self.counters(self.other)), ((0, 0), (0, 0)))
+
+    def test_repair_post_counters(self):
+        like_post(User.objects.create_user('reader'), self.post.pk)
+        Comment.objects.create(post=self.other, author=self.author, content='comment')
+        Post.objects.filter(pk=self.post.pk).update(like_count=7, comment_count=3)
+
+        out = StringIO()
+        call_command('repair_post_counters', '--dry-run', stdout=out)
+        self.assertIn(f'Post {self.post.pk}: likes 7 -> 1, comments 3 -> 0', out.getvalue())
+        self.assertIn(f'Post {self.other.pk}: likes 0 -> 0, comments 0 -> 1', out.getvalue())
+        self.assertIn('Found 2 drifted post(s).', out.getvalue())
+        self.assertEqual(self.counters(self.post), (7, 3))
+
+        version = Post.objects.get(pk=self.post.pk).version
+        out = StringIO()
+        call_command('repair_post_counters', '--chunk-size=1', stdout=out)
+        self.assertIn('Checked 2 post(s). Repaired 2 drifted post(s).', out.getvalue())
+        self.assertEqual((self.counters(self.post), self.counters(self.other)), ((1, 0), (0, 1)))
+        self.assertEqual(Post.objects.get(pk=self.post.pk).version, version + 1)
+
+        out = StringIO()
+        call_command('repair_post_counters', stdout=out)
+        self.assertIn('Repaired 0 drifted post(s).', out.getvalue())
+
+
+class ExcerptTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author')
+        self.reader = User.objects.create_user('reader')
+        follow(self.reader, self.author)
+        self.body = 'word ' * 100
+        self.post = Post.objects.create(author=self.author, title='long', content=self.body)
+        fan_out_post(self.post)
+        like_post(self.reader, self.post.pk)
+        self.client.force_authenticate(self.reader)
+
+    def test_excerpt_follows_content(self):
+        self.assertEqual(len(self.post.excerpt), EXCERPT_LENGTH)
+        self.assertTrue(self.post.excerpt.endswith('…'))
+        self.post.content = 'short\n\n  and   spaced'
+        self.post.save(update_fields=['content'])
+        self.assertEqual(Post.objects.get(pk=self.post.pk).excerpt, 'short and spaced')
+        self.client.force_authenticate(self.author)
+        self.client.patch(f'/api/posts/posts/{self.post.pk}/', {'content': 'edited'})
+        self.assertEqual(Post.objects.get(pk=self.post.pk).excerpt, 'edited')
+
+    def test_lists_carry_excerpts_and_details_content(self):
+        for url in ['/api/posts/posts/', '/api/posts/feed/', '/api/posts/posts/trending/']:
+            with self.subTest(url=url):
+                [post] = self.client.get(url).json()['results']
+                self.assertEqual(post['excerpt'], self.post.excerpt)
+                self.assertNotIn('content', post)
+        post = self.client.get(f'/api/posts/posts/{self.post.pk}/').json()
+        self.assertEqual(post['content'], self.body)
+        self.assertNotIn('excerpt', post)
+
+
+class PostCommentsTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.post = Post.objects.create(author=self.author, title='post', content='body')
+        self.other = Post.objects.create(author=self.author, title='other', content='body')
+        for i in range(3):
+            Comment.objects.create(post=self.post, author=self.author, content=f'comment {i}')
+        Comment.objects.create(post=self.other, author=self.author, content='elsewhere')
+
+    def contents(self, comments):
+        return [comment['content'] for comment in comments]
+
+    def test_comments_of_a_post_newest_first(self):
+        url = f'/api/posts/posts/{self.post.pk}/comments/?page_size=2'
+        body = self.client.get(url).json()
+        self.assertEqual(self.contents(body['results']), ['comment 2', 'comment 1'])
+        self.assertEqual(body['results'][0]['author'], 'author')
+        body = self.client.get(body['next']).json()
+        self.assertEqual(self.contents(body['results']), ['comment 0'])
+        self.assertIsNone(body['next'])
+
+    def test_comments_of_missing_posts(self):
+        for pk in [0, 'abc']:
+            with self.subTest(pk=pk):
+                self.assertEqual(self.client.get(f'/api/posts/posts/{pk}/comments/').status_code, 404)
+
+    def test_preview_comments(self):
+        body = self.client.get('/api/posts/posts/?preview_comments=2').json()
+        previews = {post['id']: self.contents(post['latest_comments']) for post in body['results']}
+        self.assertEqual(previews, {self.post.pk: ['comment 2', 'comment 1'], self.other.pk: ['elsewhere']})
+        body = self.client.get(f'/api/posts/posts/{self.post.pk}/?preview_comments=1').json()
+        self.assertEqual(self.contents(body['latest_comments']), ['comment 2'])
+        body = self.client.get('/api/posts/posts/').json()
+        self.assertNotIn('latest_comments', body['results'][0])
+
+
+class SparseFieldsTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.post = Post.objects.create(author=self.author, title='sparse', content='a long body')
+        Comment.objects.create(post=self.post, author=self.author, content='comment')
+        self.client.force_authenticate(self.author)
+
+    def test_lists_only_load_requested_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/posts/posts/?fields=id,title')
+        self.assertEqual(response.json()['results'], [{'id': self.post.pk, 'title': 'sparse'}])
+        self.assertFalse([query for query in queries if '"content"' in query['sql']])
+
+    def test_fields_of_each_resource(self):
+        comment = Comment.objects.get()
+        body = self.client.get(f'/api/posts/posts/{self.post.pk}/?fields=author').json()
+        self.assertEqual(body, {'author': 'author'})
+        body = self.client.get('/api/posts/comments/?fields=post').json()
+        self.assertEqual(body['results'], [{'post': self.post.pk}])
+        body = self.client.get(f'/api/posts/posts/{self.post.pk}/comments/?fields=id,content').json()
+        self.assertEqual(body['results'], [{'id': comment.pk, 'content': 'comment'}])
+
+    def test_embedded_previews_and_responses_to_writes(self):
+        body = self.client.get('/api/posts/posts/?fields=title&preview_comments=1').json()
+        self.assertEqual(body['results'][0]['latest_comments'][0]['content'], 'comment')
+        # Serializers bound to input keep every field for validation.
+        response = self.client.patch(f'/api/posts/posts/{self.post.pk}/?fields=id', {'title': 'edited'}, format='json')
+        self.assertEqual(response.json()['title'], 'edited')
+        response = self.client.post('/api/posts/like/?fields=post', {'post': self.post.pk}, format='json')
+        self.assertEqual(response.json(), {'post': self.post.pk})
+
+    def test_unknown_fields_are_rejected(self):
+        self.assertEqual(self.client.get('/api/posts/posts/?fields=id,secret').status_code, 400)
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', is_staff=True)
+        self.author = User.objects.create_user('author')
+        self.posts = []
+        for day in (1, 2, 3):
+            post = Post.objects.create(author=self.author, title=f'day {day}', content='line\nbreak')
+            Post.objects.filter(pk=post.pk).update(created_at=datetime(2024, 5, day, 12, tzinfo=dt_timezone.utc))
+            self.posts.append(post)
+        Post.objects.create(author=self.admin, title='admin', content='body')
+        self.client.force_authenticate(self.admin)
+
+    def export(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def exported_titles(self, query):
+        lines = self.export(f'/api/posts/export/posts/?{query}').splitlines()
+        return [json.loads(line)['title'] for line in lines]
+
+    def test_filters(self):
+        self.assertEqual(self.exported_titles(f'author={self.author.pk}'), ['day 1', 'day 2', 'day 3'])
+        self.assertEqual(
+            self.exported_titles(f'author={self.author.pk}&since=2024-05-02T00:00:00Z'), ['day 2', 'day 3']
+        )
+        self.assertEqual(self.exported_titles('since=2024-05-02T00:00:00Z&until=2024-05-02T23:00:00Z'), ['day 2'])
+        self.assertEqual(self.exported_titles('until=2024-05-01T12:00:00Z'), [])
+
+    def test_bare_dates_cover_whole_days(self):
+        self.assertEqual(self.exported_titles(f'author={self.author.pk}&until=2024-05-02'), ['day 1', 'day 2'])
+        self.assertEqual(self.exported_titles('since=2024-05-02&until=2024-05-02'), ['day 2'])
+        self.assertEqual(self.exported_titles('until=2024-04-30'), [])
+
+    def test_csv(self):
+        rows = list(csv.reader(StringIO(self.export(f'/api/posts/export/posts/?output=csv&author={self.author.pk}'))))
+        self.assertEqual(rows[0][:3], ['id', 'author_id', 'title'])
+        self.assertEqual([row[2] for row in rows[1:]], ['day 1', 'day 2', 'day 3'])
+        self.assertEqual(rows[1][3], 'line\nbreak')
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get('/api/posts/export/likes/?until=someday').status_code, 400)
+        self.assertEqual(self.client.get('/api/posts/export/posts/?author=me').status_code, 400)
+        self.assertEqual(self.client.get('/api/posts/export/posts/?output=xml').status_code, 400)
+        self.assertEqual(self.client.get('/api/posts/export/users/').status_code, 404)
+        self.client.force_authenticate(self.author)
+        self.assertEqual(self.client.get('/api/posts/export/posts/').status_code, 403)
+
+
+class PostImportTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.reader = User.objects.create_user('reader')
+        follow(self.reader, self.author)
+        self.client.force_authenticate(self.author)
+
+    def ndjson(self, *rows):
+        return '\n'.join(row if isinstance(row, str) else json.dumps(row) for row in rows) + '\n'
+
+    def import_body(self, body, query=''):
+        response = self.client.post(f'/api/posts/posts/import/{query}', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_bad_rows_are_reported_and_skipped(self):
+        body = self.ndjson(
+            {'title': 'imported one', 'content': 'quokka facts'},
+            '{"title": "broken',
+            {'content': 'no title'},
+            '',
+            {'title': 'imported two', 'content': 'more quokka facts'},
+        )
+        result = self.import_body(body, '?batch_size=2')
+        self.assertEqual((result['created'], result['failed'], result['errors_truncated']), (2, 2, False))
+        self.assertEqual([error['line'] for error in result['errors']], [2, 3])
+        self.assertIn('Invalid JSON', result['errors'][0]['errors']['non_field_errors'][0])
+        self.assertIn('title', result['errors'][1]['errors'])
+
+        posts = Post.objects.order_by('pk')
+        self.assertEqual([post.title for post in posts], ['imported one', 'imported two'])
+        self.assertEqual({post.author for post in posts}, {self.author})
+        self.assertEqual(posts[0].excerpt, 'quokka facts')
+
+    def test_imported_posts_reach_timelines_and_search(self):
+        self.import_body(self.ndjson(
+            {'title': 'first', 'content': 'quokka facts'}, {'title': 'second', 'content': 'wombat facts'},
+        ))
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(owner=self.reader).values_list('post__title', flat=True)),
+            {'first', 'second'},
+        )
+        titles = [post['title'] for post in self.client.get('/api/posts/posts/?search=quokka').json()['results']]
+        self.assertEqual(titles, ['first'])
+
+    def test_errors_are_truncated(self):
+        result = import_posts(
+            [self.ndjson({'title': 'kept', 'content': 'body'}), '{}\n', '{"title": ""}\n', '{"title": 1}\n'],
+            author=self.author, max_errors=2,
+        ).as_dict()
+        self.assertEqual((result['created'], result['failed']), (1, 3))
+        self.assertEqual([error['line'] for error in result['errors']], [2, 3])
+        self.assertTrue(result['errors_truncated'])
+
+    def test_import_command(self):
+        User.objects.create_user('guest')
+        rows = self.ndjson(
+            {'title': 'by default', 'content': 'body'},
+            {'title': 'by guest', 'content': 'body', 'author': 'guest'},
+            {'title': 'by nobody', 'content': 'body', 'author': 'nobody'},
+            'not json',
+        )
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as file:
+            file.write(rows)
+        self.addCleanup(Path(file.name).unlink)
+        out, err = StringIO(), StringIO()
+        call_command('import_posts', file.name, '--author=author', '--batch-size=2', stdout=out, stderr=err)
+        self.assertIn('Imported 2 post(s), 2 failed.', out.getvalue())
+        self.assertIn("line 3: {'author': ['Unknown author.']}", err.getvalue())
+        self.assertIn('line 4: ', err.getvalue())
+        self.assertEqual(
+            dict(Post.objects.values_list('title', 'author__username')),
+            {'by default': 'author', 'by guest': 'guest'},
+        )
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.reader, post__title='by default').exists())
+
+
+class TrendingTests(APITestCase):
+    # Engagement is timed by patching the clock trending.py reads.
+    start = datetime(2024, 5, 1, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author')
+        self.fans = [User.objects.create_user(f'fan{i}') for i in range(4)]
+        self.client.force_authenticate(self.author)
+
+    def post_at(self, title, hours):
+        post = Post.objects.create(author=self.author, title=title, content='body')
+        Post.objects.filter(pk=post.pk).update(created_at=self.at(hours))
+        return post
+
+    def at(self, hours):
+        return self.start + timedelta(seconds=hours * 3600)
+
+    def clock(self, hours):
+        return mock.patch('posts.trending.timezone.now', return_value=self.at(hours))
+
+    def like(self, post, likes, hours):
+        with self.clock(hours), self.captureOnCommitCallbacks(execute=True):
+            for fan in self.fans[:likes]:
+                like_post(fan, post.pk)
+
+    def trending(self, hours, **params):
+        with self.clock(hours):
+            response = self.client.get('/api/posts/posts/trending/', params)
+        return [post['title'] for post in response.json()['results']]
+
+    @override_settings(TRENDING_HALF_LIFE=3600)
+    def test_ranked_by_weighted_engagement(self):
+        liked, commented = self.post_at('liked', 0), self.post_at('commented', 0)
+        # No engagement, no score: left out rather than ranked last.
+        self.post_at('quiet', 0)
+        self.like(liked, 3, hours=0)
+        self.like(commented, 1, hours=0)
+        with self.clock(0):
+            # A comment weighs two likes.
+            self.client.post('/api/posts/comments/', {'post': commented.pk, 'content': 'nice'})
+        self.assertEqual(self.trending(0), ['liked', 'commented'])
+        self.assertEqual(self.trending(0, limit=1), ['liked'])
+        self.assertNotIn('quiet', self.trending(0))
+
+    @override_settings(TRENDING_HALF_LIFE=3600)
+    def test_engagement_decays(self):
+        old, new, newest = self.post_at('old', 0), self.post_at('new', 1), self.post_at('newest', 3)
+        self.like(old, 4, hours=0)
+        # One half-life on, the old post's four likes weigh two: still ahead.
+        self.like(new, 1, hours=1)
+        self.assertEqual(self.trending(1), ['old', 'new'])
+        # Three half-lives on they weigh half a like, the new post's a quarter.
+        self.like(newest, 1, hours=3)
+        self.assertEqual(self.trending(3), ['newest', 'old', 'new'])
+        old.refresh_from_db()
+        with self.clock(3):
+            self.assertAlmostEqual(current_score(old.trending_score), 0.5)
+
+    @override_settings(TRENDING_HALF_LIFE=3600, TRENDING_TOP_K=2)
+    def test_cached_top_posts_merge_new_engagement(self):
+        first, second, third = self.post_at('first', 0), self.post_at('second', 0), self.post_at('third', 0)
+        self.like(first, 3, hours=0)
+        self.like(second, 2, hours=0)
+        self.assertEqual(self.trending(0), ['first', 'second'])
+        self.assertIsNotNone(cache.get(TRENDING_CACHE_KEY))
+
+        # Merged into the cached list as it happens: no rebuild from the index.
+        self.like(third, 4, hours=0)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.trending(0), ['third', 'first'])
+        self.assertFalse([query for query in queries if 'trending_score' in query['sql'] and 'ORDER BY' in query['sql']])
+
+        # A deleted post leaves the list and the next read refills its slot.
+        third.delete()
+        self.assertEqual(self.trending(0), ['first', 'second'])
+
+
+class PostSearchTests(APITestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.client.force_authenticate(self.author)
+        for title, content in [('Django tips', 'about the orm'), ('cooking', 'django django django'),
+                               ('misc', 'nothing'), ('Djangonaut', 'space')]:
+            self.client.post('/api/posts/posts/', {'title': title, 'content': content})
+
+    def search(self, query, **params):
+        titles, url = [], '/api/posts/posts/'
+        params = {'search': query, **params}
+        while url:
+            body = self.client.get(url, params).json()
+            titles += [post['title'] for post in body['results']]
+            url, params = body['next'], None
+        return titles
+
+    def test_prefix_terms_are_ranked_and_paged(self):
+        titles = self.search('djang', page_size=1)
+        self.assertEqual(sorted(titles), ['Django tips', 'Djangonaut', 'cooking'])
+        # BM25: the post mentioning django three times ranks first.
+        self.assertEqual(titles[0], 'cooking')
+        self.assertEqual(self.search('tips orm'), ['Django tips'])
+        self.assertEqual(self.search('!!!'), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        post = Post.objects.get(title='misc')
+        self.client.patch(f'/api/posts/posts/{post.pk}/', {'content': 'django now'})
+        self.assertIn('misc', self.search('django'))
+        self.client.delete(f'/api/posts/posts/{post.pk}/')
+        self.assertNotIn('misc', self.search('django'))
+
+    @override_settings(POSTS_SEARCH_BACKEND=None)
+    def test_fallback_without_an_index(self):
+        self.assertEqual(sorted(self.search('jang')), ['Django tips', 'Djangonaut', 'cooking'])
+
+
+class AsyncEndpointTests(TransactionTestCase):
+    async def asetup(self):
+        cache.clear()
+        self.reader = await User.objects.acreate_user('reader')
+        self.author = await User.objects.acreate_user('author')
+        self.post = await Post.objects.acreate(author=self.author, title='async', content='body')
+        await Comment.objects.acreate(post=self.post, author=self.author, content='comment')
+        token = await Token.objects.acreate(user=self.reader)
+        self.headers = {'Authorization': f'Token {token.key}'}
+
+    async def aget(self, url):
+        return await self.async_client.get(url, headers=self.headers)
+
+    async def apost(self, url, data=None):
+        return await self.async_client.post(url, data, content_type='application/json', headers=self.headers)
+
+    async def feed_titles(self, query=''):
+        response = await self.aget(f'/api/posts/async/feed/{query}')
+        self.assertEqual(response.status_code, 200)
+        return [post['title'] for post in response.json()['results']]
+
+    async def test_follow_and_feed(self):
+        await self.asetup()
+        self.assertEqual(await self.feed_titles(), [])
+        self.assertEqual((await self.apost(f'/api/accounts/async/follow/{self.author.pk}/')).status_code, 200)
+        self.assertEqual(await self.feed_titles(), ['async'])
+        self.assertEqual(await self.feed_titles('?page=1'), ['async'])
+        response = await self.aget('/api/posts/async/feed/?preview_comments=1&fields=id,title')
+        [post] = response.json()['results']
+        self.assertEqual(post['latest_comments'][0]['content'], 'comment')
+        self.assertEqual((await self.aget('/api/posts/async/feed/?cursor=zzz')).status_code, 404)
+
+        self.assertEqual((await self.apost(f'/api/accounts/async/follow/{self.reader.pk}/')).status_code, 400)
+        self.assertEqual((await self.apost('/api/accounts/async/follow/999/')).status_code, 404)
+        self.assertEqual((await self.apost(f'/api/accounts/async/unfollow/{self.author.pk}/')).status_code, 200)
+        self.assertEqual(await self.feed_titles(), [])
+        self.assertEqual((await self.async_client.get('/api/posts/async/feed/')).status_code, 401)
+
+    async def test_like_and_unlike(self):
+        await self.asetup()
+        self.assertEqual((await self.apost('/api/posts/async/like/', {'post': self.post.pk})).status_code, 201)
+        self.assertEqual((await self.apost('/api/posts/async/like/', {'post': self.post.pk})).status_code, 200)
+        self.assertEqual((await Post.objects.aget(pk=self.post.pk)).like_count, 1)
+        self.assertEqual((await self.apost('/api/posts/async/like/', {'post': self.post.pk + 1})).status_code, 404)
+        self.assertEqual((await self.apost('/api/posts/async/like/', {})).status_code, 400)
+        response = await self.async_client.delete(
+            '/api/posts/async/unlike/', {'post': self.post.pk}, content_type='application/json', headers=self.headers
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual((await Post.objects.aget(pk=self.post.pk)).like_count, 0)
+
+
+@override_settings(LIKES_WRITE_BEHIND={'FLUSH_INTERVAL': None})
+class LikeBufferTests(APITestCase):
+    # FLUSH_INTERVAL None: no flusher thread, likes are written by flush().
+
+    def setUp(self):
+        self.reader = User.objects.create_user('reader')
+        self.author = User.objects.create_user('author')
+        self.post = Post.objects.create(author=self.author, title='buffered', content='body')
+        self.client.force_authenticate(self.reader)
+
+    def like_count_seen_by(self, user):
+        self.client.force_authenticate(user)
+        return self.client.get('/api/posts/posts/').json()['results'][0]['like_count']
+
+    def test_likes_are_acknowledged_then_flushed(self):
+        self.assertEqual(self.client.post('/api/posts/like/', {'post': self.post.pk}).status_code, 202)
+        self.assertEqual(self.client.post('/api/posts/like/', {'post': self.post.pk}).status_code, 200)
+        self.assertFalse(Like.objects.exists())
+        # The liker reads their own buffered like; others see the stored count.
+        self.assertEqual(self.like_count_seen_by(self.reader), 1)
+        self.assertEqual(self.like_count_seen_by(self.author), 0)
+
+        self.assertEqual(get_like_buffer().flush(), 1)
+        self.assertEqual(Like.objects.get().user, self.reader)
+        self.assertEqual(self.like_count_seen_by(self.author), 1)
+        self.assertEqual(Notification.objects.filter(recipient=self.author).count(), 1)
+
+    def test_unlike_settles_a_buffered_like(self):
+        self.client.post('/api/posts/like/', {'post': self.post.pk})
+        self.assertEqual(self.client.delete('/api/posts/unlike/', {'post': self.post.pk}).status_code, 204)
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(Post.objects.get().like_count, 0)
+        self.assertFalse(get_like_buffer().pending_for(self.reader.pk))
+
+    def test_likes_stored_meanwhile_are_skipped(self):
+        buffer = get_like_buffer()
+        users = [User.objects.create_user(f'user{i}') for i in range(5)]
+        for user in users:
+            self.assertEqual(buffer.submit(user, self.post.pk), 'accepted')
+        like_post(users[0], self.post.pk)
+        self.assertEqual(buffer.flush(), 4)
+        self.assertEqual(Like.objects.count(), 5)
+        # Only the likes actually inserted are counted and notified.
+        self.assertEqual(Post.objects.get().like_count, 5)
+        self.assertEqual(Notification.objects.filter(recipient=self.author).count(), 5)
+
+    def test_likes_of_deleted_users_and_posts_are_skipped(self):
+        gone = Post.objects.create(author=self.author, title='gone', content='body')
+        pairs = [(self.reader.pk, self.post.pk), (self.reader.pk, gone.pk), (self.author.pk + 100, self.post.pk)]
+        gone.delete()
+        self.assertEqual(write_likes(pairs), 1)
+        self.assertEqual(list(Like.objects.values_list('user', 'post')), [(self.reader.pk, self.post.pk)])
+        self.assertEqual(Post.objects.get().like_count, 1)
+
+
+@override_settings(LIKES_WRITE_BEHIND={'FLUSH_INTERVAL': None})
+class ViewerFlagTests(APITestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user('reader')
+        self.followed = User.objects.create_user('followed')
+        self.stranger = User.objects.create_user('stranger')
+        follow(self.reader, self.followed)
+        self.posts = {
+            title: Post.objects.create(author=author, title=title, content='body')
+            for title, author in [('liked', self.followed), ('unliked', self.followed),
+                                  ('liked elsewhere', self.stranger), ('buffered', self.stranger),
+                                  ('ignored', self.stranger)]
+        }
+        like_post(self.reader, self.posts['liked'].pk)
+        like_post(self.reader, self.posts['liked elsewhere'].pk)
+        like_post(self.followed, self.posts['ignored'].pk)
+        buffer = get_like_buffer()
+        self.addCleanup(buffer.flush)
+        self.client.force_authenticate(self.reader)
+        self.assertEqual(self.client.post('/api/posts/like/', {'post': self.posts['buffered'].pk}).status_code, 202)
+
+    def flags(self, post):
+        return post['liked_by_me'], post['following_author']
+
+    def test_flags_per_row(self):
+        expected = {
+            'liked': (True, True),
+            'unliked': (False, True),
+            'liked elsewhere': (True, False),
+            'buffered': (True, False),
+            'ignored': (False, False),
+        }
+        results = self.client.get('/api/posts/posts/').json()['results']
+        self.assertEqual({post['title']: self.flags(post) for post in results}, expected)
+        for title, flags in expected.items():
+            with self.subTest(title=title):
+                post = self.client.get(f'/api/posts/posts/{self.posts[title].pk}/').json()
+                self.assertEqual(self.flags(post), flags)
+        rebuild_timeline(self.reader)
+        results = self.client.get('/api/posts/feed/').json()['results']
+        self.assertEqual({post['title']: self.flags(post) for post in results},
+                         {'liked': (True, True), 'unliked': (False, True)})
+
+    def test_flags_of_other_viewers(self):
+        self.client.force_authenticate(self.followed)
+        results = self.client.get('/api/posts/posts/').json()['results']
+        self.assertEqual({post['title'] for post in results if post['liked_by_me']}, {'ignored'})
+        self.assertFalse([post for post in results if post['following_author']])
+        self.client.logout()
+        results = self.client.get('/api/posts/posts/').json()['results']
+        self.assertFalse([post for post in results if post['liked_by_me'] or post['following_author']])
+
+
+class LikeJournalTests(TestCase):
+    def setUp(self):
+        journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, journal_dir)
+        self.journal_dir = Path(journal_dir)
+        self.author = User.objects.create_user('author')
+        self.post = Post.objects.create(author=self.author, title='journaled', content='body')
+
+    def test_segments_of_a_crashed_process_are_replayed(self):
+        reader = User.objects.create_user('reader')
+        # Left behind by a crash while writing the second line.
+        (self.journal_dir / 'likes-crashed.ndjson').write_text(
+            json.dumps({'user': reader.pk, 'post': self.post.pk}) + '\n{"user": 1, "po'
+        )
+        buffer = LikeBuffer(flush_interval=None, journal_dir=self.journal_dir, fsync=True)
+        self.assertEqual(buffer.pending_for(reader.pk), {self.post.pk})
+        self.assertEqual(buffer.submit(self.author, self.post.pk), 'accepted')
+
+        # Segments held by a live buffer are not adopted by another process.
+        self.assertEqual(LikeBuffer(flush_interval=None, journal_dir=self.journal_dir).flush(), 0)
+
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(set(Like.objects.values_list('user_id', flat=True)), {reader.pk, self.author.pk})
+        # Only the empty segments the two buffers write to next remain.
+        self.assertFalse([path for path in self.journal_dir.iterdir() if path.stat().st_size])
+        self.assertEqual(LikeBuffer(flush_interval=None, journal_dir=self.journal_dir).flush(), 0)
+
+
+class LikeFlusherTests(TransactionTestCase):
+    # The flusher thread writes through its own connection.
+
+    def test_flusher_writes_buffered_likes(self):
+        author = User.objects.create_user('author')
+        post = Post.objects.create(author=author, title='flushed', content='body')
+        buffer = LikeBuffer(flush_interval=0.01)
+        users = [User.objects.create_user(f'user{i}') for i in range(3)]
+        for user in users:
+            buffer.submit(user, post.pk)
+        # Likes stop being pending once written; reading the table meanwhile
+        # would contend with the flusher for SQLite's shared-cache test database.
+        deadline = time.monotonic() + 5
+        while any(buffer.pending_for(user.pk) for user in users) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(Post.objects.get().like_count, 3)
+        self.assertEqual(Like.objects.count(), 3)
+
+    def test_idle_flusher_sleeps(self):
+        author = User.objects.create_user('author')
+        post = Post.objects.create(author=author, title='flushed', content='body')
+        buffer = LikeBuffer(flush_interval=0.001)
+        with mock.patch.object(buffer, 'flush', wraps=buffer.flush) as flush:
+            buffer.submit(author, post.pk)
+            deadline = time.monotonic() + 5
+            while buffer.pending_for(author.pk) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            flushes = flush.call_count
+            time.sleep(0.05)
+        self.assertEqual(flush.call_count, flushes)
+
+
+class MigrationTestCase(TransactionTestCase):
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+
+class CounterBackfillMigrationTests(MigrationTestCase):
+    before = [('accounts', '0002_alter_customuser_followers'), ('posts', '0003_timelineentry')]
+    after = [('accounts', '0002_alter_customuser_followers'), ('posts', '0004_post_comment_count_post_like_count')]
+
+    def test_existing_likes_and_comments_are_counted(self):
+        apps = self.migrate(self.before)
+        author = apps.get_model('accounts', 'CustomUser').objects.create(username='author')
+        Post = apps.get_model('posts', 'Post')
+        busy = Post.objects.create(author=author, title='busy', content='body')
+        quiet = Post.objects.create(author=author, title='quiet', content='body')
+        for i in range(3):
+            liker = apps.get_model('accounts', 'CustomUser').objects.create(username=f'liker{i}')
+            apps.get_model('posts', 'Like').objects.create(user=liker, post=busy)
+        apps.get_model('posts', 'Comment').objects.create(post=busy, author=author, content='first')
+
+        Post = self.migrate(self.after).get_model('posts', 'Post')
+        counters = dict(Post.objects.values_list('pk', 'like_count'))
+        self.assertEqual(counters, {busy.pk: 3, quiet.pk: 0})
+        self.assertEqual(Post.objects.get(pk=busy.pk).comment_count, 1)
+
+
+class DuplicateLikeMigrationTests(MigrationTestCase):
+    before = [('accounts', '0002_alter_customuser_followers'), ('posts', '0005_post_search_index')]
+    after = [('accounts', '0002_alter_customuser_followers'), ('posts', '0006_unique_like')]
+
+    def test_duplicates_are_removed_and_recounted(self):
+        apps = self.migrate(self.before)
+        User = apps.get_model('accounts', 'CustomUser')
+        author, liker = User.objects.create(username='author'), User.objects.create(username='liker')
+        Post, Like = apps.get_model('posts', 'Post'), apps.get_model('posts', 'Like')
+        doubled = Post.objects.create(author=author, title='doubled', content='body')
+        single = Post.objects.create(author=author, title='single', content='body')
+        first = Like.objects.create(user=liker, post=doubled)
+        Like.objects.create(user=liker, post=doubled)
+        Like.objects.create(user=author, post=single)
+        Post.objects.filter(pk=doubled.pk).update(like_count=2)
+        Post.objects.filter(pk=single.pk).update(like_count=1)
+
+        apps = self.migrate(self.after)
+        likes = apps.get_model('posts', 'Like').objects.filter(post=doubled.pk)
+        self.assertEqual(list(likes.values_list('pk', flat=True)), [first.pk])
+        counters = dict(apps.get_model('posts', 'Post').objects.values_list('pk', 'like_count'))
+        self.assertEqual(counters, {doubled.pk: 1, single.pk: 1})
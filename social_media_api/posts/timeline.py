@@ -0,0 +1,189 @@
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .models import Post, TimelineEntry
+
+
+# Fan-out-on-write home timelines.
+#
+# Every post by a regular author is copied into a TimelineEntry row for each of
+# its followers when it is created, so reading a feed is a single range scan of
+# the (owner, created_at) index. Authors with more than
+# FEED_CELEBRITY_THRESHOLD followers are not fanned out; their posts are merged
+# in at read time instead, so one post never means millions of inserts. Each
+# timeline keeps its newest FEED_TIMELINE_LENGTH entries; older ones are
+# deleted as new ones arrive. That is also how deep a feed goes: paging past
+# the oldest kept entry ends the feed (no next link) rather than falling back
+# to a pull over every followed author, which is the query fan-out avoids.
+# Pulled celebrity posts are not limited.
+
+User = get_user_model()
+
+CELEBRITY_CACHE_KEY = 'feed:celebrity_ids'
+
+
+def get_celebrity_ids():
+    celebrity_ids = cache.get(CELEBRITY_CACHE_KEY)
+    if celebrity_ids is None:
+        celebrity_ids = set(
+            User.objects.filter(followers_count__gte=settings.FEED_CELEBRITY_THRESHOLD)
+            .values_list('id', flat=True)
+        )
+        cache.set(CELEBRITY_CACHE_KEY, celebrity_ids, settings.FEED_CELEBRITY_CACHE_TIMEOUT)
+    return celebrity_ids
+
+
+def is_celebrity(user):
+    return user.pk in get_celebrity_ids()
+
+
+def _bulk_insert(entries):
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=settings.FEED_FANOUT_BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def fan_out_post(post):
+    # Push a new post into every follower's timeline.
+    fan_out_posts([post])
+
+
+def fan_out_posts(posts):
+    # Same as fan_out_post for many posts, with one follower query for the lot.
+    celebrity_ids = get_celebrity_ids()
+    posts_by_author = defaultdict(list)
+    for post in posts:
+        if post.author_id not in celebrity_ids:
+            posts_by_author[post.author_id].append(post)
+    if not posts_by_author:
+        return
+    followers = User.objects.filter(following__in=list(posts_by_author)).values_list('following', 'id')
+    batch = []
+    for author_id, follower_id in followers.iterator(chunk_size=settings.FEED_FANOUT_BATCH_SIZE):
+        for post in posts_by_author[author_id]:
+            batch.append(TimelineEntry(owner_id=follower_id, post_id=post.pk, created_at=post.created_at))
+        if len(batch) >= settings.FEED_FANOUT_BATCH_SIZE:
+            _insert_and_trim(batch)
+            batch = []
+    if batch:
+        _insert_and_trim(batch)
+
+
+def _insert_and_trim(entries):
+    _bulk_insert(entries)
+    trim_timelines({entry.owner_id for entry in entries})
+
+
+def backfill_following(user, author):
+    # Copy the most recent posts of a newly followed author into user's timeline.
+    if is_celebrity(author):
+        return
+    recent = (
+        Post.objects.filter(author=author)
+        .order_by('-created_at', '-id')
+        .values_list('id', 'created_at')[:settings.FEED_BACKFILL_SIZE]
+    )
+    _bulk_insert([
+        TimelineEntry(owner=user, post_id=post_id, created_at=created_at)
+        for post_id, created_at in recent
+    ])
+    trim_timeline(user)
+
+
+def remove_following(user, author):
+    TimelineEntry.objects.filter(owner=user, post__author=author).delete()
+
+
+async def aremove_following(user, author):
+    await TimelineEntry.objects.filter(owner=user, post__author=author).adelete()
+
+
+def trim_timeline(user, length=None):
+    # Keep only the newest `length` entries of a timeline.
+    length = settings.FEED_TIMELINE_LENGTH if length is None else length
+    oldest_kept = (
+        TimelineEntry.objects.filter(owner=user)
+        .order_by('-created_at', '-post_id')
+        .values_list('created_at', 'post_id')[length:length + 1]
+    )
+    oldest_kept = list(oldest_kept)
+    if not oldest_kept:
+        return
+    created_at, post_id = oldest_kept[0]
+    TimelineEntry.objects.filter(owner=user).filter(
+        Q(created_at__lt=created_at) | Q(created_at=created_at, post_id__lte=post_id)
+    ).delete()
+
+
+def trim_timelines(owner_ids, length=None):
+    # trim_timeline for many owners in one statement: each owner's entries are
+    # numbered newest first along the timeline index and those past `length`
+    # are deleted.
+    length = settings.FEED_TIMELINE_LENGTH if length is None else length
+    ranked = TimelineEntry.objects.filter(owner_id__in=list(owner_ids)).annotate(
+        position=Window(
+            RowNumber(), partition_by=[F('owner_id')], order_by=[F('created_at').desc(), F('post_id').desc()]
+        )
+    )
+    TimelineEntry.objects.filter(pk__in=ranked.filter(position__gt=length).values('pk')).delete()
+
+
+def rebuild_timeline(user):
+    # Recompute a timeline from the follow graph, e.g. after enabling fan-out.
+    TimelineEntry.objects.filter(owner=user).delete()
+    celebrity_ids = get_celebrity_ids()
+    recent = (
+        Post.objects.filter(author__in=user.following.exclude(id__in=celebrity_ids))
+        .order_by('-created_at', '-id')
+        .values_list('id', 'created_at')[:settings.FEED_TIMELINE_LENGTH]
+    )
+    _bulk_insert([
+        TimelineEntry(owner=user, post_id=post_id, created_at=created_at)
+        for post_id, created_at in recent
+    ])
+
+
+def get_feed_queryset(user):
+    # Rows carry feed_created_at/feed_post_id, the keys the feed is ordered
+    # and paginated by (see UserFeedView.cursor_fields).
+    celebrity_ids = get_celebrity_ids()
+    followed_celebrities = []
+    if celebrity_ids:
+        followed_celebrities = list(
+            user.following.filter(id__in=celebrity_ids).values_list('id', flat=True)
+        )
+    return _feed_queryset(user, followed_celebrities)
+
+
+async def aget_feed_queryset(user):
+    # get_feed_queryset() for async views.
+    celebrity_ids = await sync_to_async(get_celebrity_ids)()
+    followed_celebrities = []
+    if celebrity_ids:
+        followed_celebrities = [
+            pk async for pk in user.following.filter(id__in=celebrity_ids).values_list('id', flat=True)
+        ]
+    return _feed_queryset(user, followed_celebrities)
+
+
+def _feed_queryset(user, followed_celebrities):
+    if not followed_celebrities:
+        # Pure push mode: walk the owner's timeline index newest first.
+        return Post.objects.filter(timeline_entries__owner=user).annotate(
+            feed_created_at=F('timeline_entries__created_at'),
+            feed_post_id=F('timeline_entries__post_id'),
+        ).order_by('-feed_created_at', '-feed_post_id')
+    # Hybrid mode: merge the materialized timeline with posts pulled from celebrities.
+    return Post.objects.filter(
+        Q(id__in=TimelineEntry.objects.filter(owner=user).values('post_id'))
+        | Q(author_id__in=followed_celebrities)
+    ).annotate(
+        feed_created_at=F('created_at'),
+        feed_post_id=F('id'),
+    ).order_by('-feed_created_at', '-feed_post_id')
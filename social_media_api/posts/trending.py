@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Coalesce, Log, Power
+from django.utils import timezone
+
+from .models import Post
+
+
+# Trending posts.
+#
+# Every like or comment adds its weight to a post's engagement score, which
+# halves every TRENDING_HALF_LIFE seconds. Instead of the decaying score itself
+# a post stores
+#
+#     trending_score = log2(score at t) + t / half_life
+#
+# which stays constant between events and orders posts exactly as their
+# current scores would, so an event is one UPDATE and the ranking is one
+# indexed column. The best TRENDING_TOP_K posts are also kept in the cache as
+# [(post_id, trending_score), ...] and merged in place as events arrive, so
+# reading the ranking never touches the Like or Comment tables. The list is
+# rebuilt from the index every TRENDING_CACHE_TIMEOUT seconds.
+
+TRENDING_CACHE_KEY = 'trending:top'
+
+
+def time_units(moment=None):
+    return (moment or timezone.now()).timestamp() / settings.TRENDING_HALF_LIFE
+
+
+def current_score(trending_score, moment=None):
+    return 2 ** (trending_score - time_units(moment))
+
+
+def record_engagement(post_ids, weight, using='default', **updates):
+    # Adds `weight` at the current time to each post's score; `updates` are
+    # further column updates (the event's counter) for the same statement.
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    now = time_units()
+    decayed = Coalesce(Power(Value(2.0), F('trending_score') - now), Value(0.0), output_field=FloatField())
+    Post.objects.using(using).filter(pk__in=post_ids).update(
+        trending_score=Log(Value(2.0), decayed + weight) + now, **updates
+    )
+    scores = list(Post.objects.using(using).filter(pk__in=post_ids).values_list('id', 'trending_score'))
+    # A rolled-back event must not leave its score in the cache.
+    transaction.on_commit(lambda: _merge_top(scores), using=using)
+
+
+def _merge_top(scores):
+    # Only the posts in `scores` moved, and every other score decays at the same
+    # rate, so merging them into the cached list keeps it the exact top K.
+    # Concurrent merges can drop an update until the next rebuild.
+    cached = cache.get(TRENDING_CACHE_KEY)
+    if cached is None:
+        return  # the next read rebuilds from the index, these scores included
+    expires_at, top = cached
+    remaining = expires_at - timezone.now().timestamp()
+    if remaining <= 0:
+        cache.delete(TRENDING_CACHE_KEY)
+        return
+    ranked = dict(top)
+    ranked.update(scores)
+    top = sorted(ranked.items(), key=lambda item: item[1], reverse=True)[:settings.TRENDING_TOP_K]
+    cache.set(TRENDING_CACHE_KEY, (expires_at, top), remaining)
+
+
+def get_top_posts(using='default'):
+    cached = cache.get(TRENDING_CACHE_KEY)
+    if cached is not None:
+        return cached[1]
+    top = list(
+        Post.objects.using(using)
+        .filter(trending_score__isnull=False)
+        .order_by('-trending_score')
+        .values_list('id', 'trending_score')[:settings.TRENDING_TOP_K]
+    )
+    expires_at = timezone.now().timestamp() + settings.TRENDING_CACHE_TIMEOUT
+    cache.set(TRENDING_CACHE_KEY, (expires_at, top), settings.TRENDING_CACHE_TIMEOUT)
+    return top
+
+
+def forget_post(post_id):
+    cached = cache.get(TRENDING_CACHE_KEY)
+    if cached is not None and any(pk == post_id for pk, _ in cached[1]):
+        # Let the next read refill the freed slot from the index.
+        cache.delete(TRENDING_CACHE_KEY)
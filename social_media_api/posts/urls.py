@@ -1,5 +1,6 @@
 from rest_framework.routers import DefaultRouter
-from .views import PostViewSet, CommentViewSet, UserFeedView, LikePostView, UnlikePostView
+from .views import PostViewSet, CommentViewSet, UserFeedView, LikePostView, UnlikePostView, LikeBatchView, ExportView
+from .views import AsyncUserFeedView, AsyncLikePostView, AsyncUnlikePostView
 from django.urls import path
 
 router = DefaultRouter()
@@ -9,7 +10,13 @@ router.register(r'comments', CommentViewSet, basename='comment')
 urlpatterns = [
     path('feed/', UserFeedView.as_view(), name='user_feed'),
     path('like/', LikePostView.as_view(), name='like_post'),
+    path('like/batch/', LikeBatchView.as_view(), name='like_batch'),
+    path('export/<str:resource>/', ExportView.as_view(), name='export'),
     path('unlike/', UnlikePostView.as_view(), name='unlike_post'),
+    # Async implementations of the same endpoints, for ASGI deployments.
+    path('async/feed/', AsyncUserFeedView.as_view(), name='async_user_feed'),
+    path('async/like/', AsyncLikePostView.as_view(), name='async_like_post'),
+    path('async/unlike/', AsyncUnlikePostView.as_view(), name='async_unlike_post'),
 ]
 
 urlpatterns += router.urls
\ No newline at end of file
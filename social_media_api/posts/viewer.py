@@ -0,0 +1,43 @@
+from django.contrib.auth import get_user_model
+
+from .models import Like
+
+
+# Per-viewer flags on posts.
+#
+# liked_by_me and following_author depend on who is asking, so they are not
+# columns. Lists look them up for the whole page at once: one Like query over
+# the page's post ids and one follow-graph query over its author ids, both
+# answered from the (user, post) and (from, to) unique indexes.
+
+User = get_user_model()
+Follow = User.followers.through
+
+
+def _liked_queryset(user, post_ids):
+    return Like.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', flat=True)
+
+
+def _followed_queryset(user, author_ids):
+    return Follow.objects.filter(to_customuser=user, from_customuser__in=author_ids).values_list(
+        'from_customuser_id', flat=True
+    )
+
+
+def viewer_flags(user, posts):
+    # (ids of the posts user liked, ids of their authors user follows).
+    if not user.is_authenticated:
+        return set(), set()
+    posts = list(posts)
+    liked = set(_liked_queryset(user, [post.pk for post in posts]))
+    followed = set(_followed_queryset(user, {post.author_id for post in posts}))
+    return liked, followed
+
+
+async def aviewer_flags(user, posts):
+    if not user.is_authenticated:
+        return set(), set()
+    liked = {pk async for pk in _liked_queryset(user, [post.pk for post in posts])}
+    followed = {pk async for pk in _followed_queryset(user, {post.author_id for post in posts})}
+    return liked, followed
+
@@ -1,101 +1,412 @@
+from datetime import datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
 from rest_framework.response import Response
-from rest_framework import viewsets, permissions, status, filters, generics
-from .models import Post, Comment, Like
-from .serializers import PostSerializer, CommentSerializer, LikeSerializer
+from rest_framework import viewsets, permissions, status, generics
+from rest_framework.decorators import action
+from rest_framework.views import APIView
+from .models import Post, Comment
+from .serializers import PostSerializer, PostExcerptSerializer, CommentSerializer, LikeSerializer, LikeTargetSerializer, LikeBatchSerializer, alatest_comments_by_post
 from .permissions import IsAuthorOrReadOnly
-from rest_framework.pagination import PageNumberPagination
+from .pagination import KeysetPagination, positive_int
+from .search import PostSearchFilter
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.contrib.contenttypes.models import ContentType
-from notifications.models import Notification
+from django.db import transaction
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .timeline import aget_feed_queryset, fan_out_post, get_feed_queryset
+from .feed_index import get_index_feed_queryset
+from .likes import like_post, unlike_post, apply_like_actions
+from .trending import get_top_posts, record_engagement
+from .viewer import aviewer_flags, viewer_flags
+from .like_buffer import get_like_buffer, pending_likes_for
+from .bulk import NDJSONParser, import_posts
+from .export import EXPORT_FORMATS, EXPORT_RESOURCES
+from .conditional import ConditionalGetMixin
+from .sparse import SparseQuerysetMixin
+from social_media_api.async_api import AsyncAPIView
 
 
 
 # Create your views here.
-class PostPagination(PageNumberPagination):
+class PostPagination(KeysetPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
+    # Posts, search results (PostViewSet.get_cursor_fields) and feed rows.
+    cursor_types = {
+        'created_at': datetime, 'id': int, 'search_rank': float, 'feed_created_at': datetime, 'feed_post_id': int,
+    }
 
-class CommentPagination(PageNumberPagination):
+class CommentPagination(KeysetPagination):
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 100
 
-class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.all()
+class CommentPreviewMixin:
+    # Reads ?preview_comments=N (at most max_preview_comments) into the
+    # serializer context for PostSerializer.
+    max_preview_comments = 10
+
+    def get_preview_comments(self):
+        try:
+            limit = int(self.request.query_params.get('preview_comments', 0))
+        except ValueError:
+            return 0
+        return max(0, min(limit, self.max_preview_comments))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['preview_comments'] = self.get_preview_comments()
+        return context
+
+class PendingLikesMixin:
+    # With write-behind likes, the requesting user's likes that are still
+    # buffered are counted in the like_count they see (read-your-own-writes).
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['pending_likes'] = pending_likes_for(self.request.user)
+        return context
+
+# Responses for LikeBuffer.submit() outcomes.
+BUFFERED_LIKE_RESPONSES = {
+    'accepted': ({"detail": "Like accepted."}, status.HTTP_202_ACCEPTED),
+    'already_liked': ({"detail": "You have already liked this post."}, status.HTTP_200_OK),
+    'not_found': ({"detail": "Post not found."}, status.HTTP_404_NOT_FOUND),
+}
+
+class PostViewSet(PendingLikesMixin, CommentPreviewMixin, ConditionalGetMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
+    queryset = Post.objects.select_related('author')
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
     pagination_class = PostPagination
-    filter_backends = [filters.SearchFilter]
+    filter_backends = [PostSearchFilter]
     search_fields = ['title', 'content']
+    # version follows edits and the counters; profile_version the author's
+    # name and avatar.
+    etag_fields = ('id', 'version', 'author__profile_version')
+
+    def use_conditional_get(self, request):
+        # Embedded comments and buffered likes can change the response without
+        # touching the post's validators.
+        return not self.get_preview_comments() and not pending_likes_for(request.user)
+
+    def get_etag_extra(self, request, rows, context):
+        # liked_by_me and following_author differ per user and change without
+        # touching the post; rendered lists have already looked them up.
+        if not self.get_serializer().has_viewer_flags:
+            return ()
+        liked, followed = context['viewer_flags'] if 'viewer_flags' in context else viewer_flags(request.user, rows)
+        return (sorted(liked), sorted(followed))
+
+    def get_serializer_class(self):
+        # Lists carry excerpts; only a single post is sent with its full body.
+        if self.action in ('list', 'trending'):
+            return PostExcerptSerializer
+        return super().get_serializer_class()
+
+    def get_cursor_fields(self, queryset):
+        # Full-text results are paged by relevance instead of recency.
+        if 'search_rank' in queryset.query.annotations:
+            return ('search_rank', 'id')
+        return PostPagination.cursor_fields
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        post = serializer.save(author=self.request.user)
+        fan_out_post(post)
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[NDJSONParser],
+            permission_classes=[permissions.IsAuthenticated])
+    def import_posts(self, request):
+        # Streams an application/x-ndjson body, one post object per line.
+        try:
+            batch_size = positive_int(
+                request.query_params.get('batch_size', settings.POSTS_IMPORT_BATCH_SIZE),
+                cutoff=settings.POSTS_IMPORT_MAX_BATCH_SIZE,
+            )
+        except ValueError:
+            return Response({"detail": "batch_size must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+        result = import_posts(request.data, author=request.user, batch_size=batch_size)
+        return Response(result.as_dict(), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def trending(self, request):
+        # /posts/trending/?limit=N: highest time-decayed engagement first, from
+        # the cached top-K list; the Like table is only read for liked_by_me.
+        try:
+            limit = positive_int(request.query_params.get('limit', PostPagination.page_size),
+                                 cutoff=settings.TRENDING_TOP_K)
+        except ValueError:
+            return Response({"detail": "limit must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+        top = get_top_posts()
+        # in_bulk of the whole list, so posts deleted since it was cached are skipped.
+        posts = self.get_queryset().in_bulk([post_id for post_id, _ in top])
+        ranked = [posts[post_id] for post_id, _ in top if post_id in posts][:limit]
+        return Response({"results": self.get_serializer(ranked, many=True).data})
 
-class CommentViewSet(viewsets.ModelViewSet):
-    queryset = Comment.objects.all()
+    @action(detail=True, methods=['get'], pagination_class=CommentPagination)
+    def comments(self, request, pk=None):
+        # /posts/{id}/comments/: one post's thread, newest first, read from the
+        # (post, created_at, id) index with authors joined in.
+        post = generics.get_object_or_404(Post.objects.only('pk'), pk=pk)
+        comments = Comment.objects.filter(post=post).select_related('author')
+        comments = self.sparse_queryset(comments, CommentSerializer)
+        page = self.paginate_queryset(comments)
+        serializer = CommentSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+class CommentViewSet(ConditionalGetMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
+    queryset = Comment.objects.select_related('author')
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
     pagination_class = CommentPagination
+    # Renaming the author does not touch updated_at.
+    etag_fields = ('id', 'updated_at', 'author__profile_version')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        post_id = self.request.query_params.get('post')
+        if post_id is not None and post_id.isdigit():
+            queryset = queryset.filter(post_id=post_id)
+        return queryset
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        comment = serializer.save(author=self.request.user)
+        record_engagement([comment.post_id], settings.TRENDING_COMMENT_WEIGHT,
+                          comment_count=F('comment_count') + 1, version=F('version') + 1)
 
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_post_id = serializer.instance.post_id
+        comment = serializer.save()
+        if comment.post_id != old_post_id:
+            Post.objects.filter(pk=old_post_id, comment_count__gt=0).update(
+                comment_count=F('comment_count') - 1, version=F('version') + 1
+            )
+            Post.objects.filter(pk=comment.post_id).update(
+                comment_count=F('comment_count') + 1, version=F('version') + 1
+            )
 
-class UserFeedView(generics.ListAPIView):
-    serializer_class = PostSerializer
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        post_id = instance.post_id
+        instance.delete()
+        Post.objects.filter(pk=post_id, comment_count__gt=0).update(
+            comment_count=F('comment_count') - 1, version=F('version') + 1
+        )
+
+
+class FeedEngineMixin:
+    # settings.FEED_ENGINE picks where feed pages come from: 'timeline' (the
+    # fan-out timelines) or 'recent_index' (per-author lists in the cache).
+    # The index serves cursor pages; legacy ?page= and ?count=true requests,
+    # which need the whole feed, use the timeline.
+    def use_feed_index(self):
+        return (
+            settings.FEED_ENGINE == 'recent_index'
+            and self.paginator.page_query_param not in self.request.query_params
+            and not self.paginator.count_requested(self.request)
+        )
+
+    def get_index_feed_queryset(self):
+        position, reverse = self.paginator.peek_cursor(self.request, self)
+        page_size = self.paginator.get_page_size(self.request)
+        return get_index_feed_queryset(self.request.user, position, reverse, limit=page_size + 1)
+
+
+class UserFeedView(FeedEngineMixin, PendingLikesMixin, CommentPreviewMixin, SparseQuerysetMixin, generics.ListAPIView):
+    serializer_class = PostExcerptSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PostPagination
+    cursor_fields = ('feed_created_at', 'feed_post_id')
 
     def get_queryset(self):
-        user = self.request.user
-        following_users = user.following.all()
-        return Post.objects.filter(author__in=following_users).order_by('-created_at')
+        if self.use_feed_index():
+            queryset = self.get_index_feed_queryset()
+        else:
+            queryset = get_feed_queryset(self.request.user)
+        return self.sparse_queryset(queryset.select_related('author'))
     
 class LikePostView(generics.CreateAPIView):
     serializer_class = LikeSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def create(self, request, *args, **kwargs):
-        post_id = request.data.get('post')
-        try:
-            post = Post.objects.get(id=post_id)
-        except Post.DoesNotExist:
-            return Response({"detail": "Post not found."}, status=status.HTTP_404_NOT_FOUND)
+        target = LikeTargetSerializer(data=request.data)
+        target.is_valid(raise_exception=True)
+        post_id = target.validated_data['post']
 
-        if Like.objects.filter(user=request.user, post=post).exists():
-            return Response({"detail": "You have already liked this post."}, status=status.HTTP_400_BAD_REQUEST)
+        buffer = get_like_buffer()
+        if buffer is not None:
+            detail, code = BUFFERED_LIKE_RESPONSES[buffer.submit(request.user, post_id)]
+            return Response(detail, status=code)
 
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
-
-        # Create notification
-        Notification.objects.create(
-            recipient=post.author,
-            actor=request.user,
-            verb="liked your post",
-            target_type=ContentType.objects.get_for_model(Post),
-            target_id=post.id,
-        )
+        like = like_post(request.user, post_id)
+        if like is not None:
+            return Response(self.get_serializer(like).data, status=status.HTTP_201_CREATED)
 
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        # Nothing was inserted: the post is either missing or already liked.
+        if not Post.objects.filter(pk=post_id).exists():
+            return Response({"detail": "Post not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"detail": "You have already liked this post."}, status=status.HTTP_200_OK)
 
 class UnlikePostView(generics.DestroyAPIView):
     serializer_class = LikeSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def destroy(self, request, *args, **kwargs):
-        post_id = request.data.get('post')
-        try:
-            post = Post.objects.get(id=post_id)
-        except Post.DoesNotExist:
+        target = LikeTargetSerializer(data=request.data)
+        target.is_valid(raise_exception=True)
+        post_id = target.validated_data['post']
+
+        buffer = get_like_buffer()
+        if buffer is not None:
+            buffer.settle(request.user.pk, post_id)
+        if unlike_post(request.user, post_id):
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        if not Post.objects.filter(pk=post_id).exists():
             return Response({"detail": "Post not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"detail": "You have not liked this post."}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            like = Like.objects.get(user=request.user, post=post)
-        except Like.DoesNotExist:
-            return Response({"detail": "You have not liked this post."}, status=status.HTTP_400_BAD_REQUEST)
+class AsyncUserFeedView(FeedEngineMixin, PendingLikesMixin, CommentPreviewMixin, SparseQuerysetMixin, AsyncAPIView):
+    # UserFeedView on the async ORM.
+    serializer_class = PostExcerptSerializer
+    pagination_class = PostPagination
+    cursor_fields = UserFeedView.cursor_fields
+
+    async def get(self, request):
+        if self.use_feed_index():
+            # Cache reads have no async API on most backends.
+            queryset = await sync_to_async(self.get_index_feed_queryset)()
+        else:
+            queryset = await aget_feed_queryset(request.user)
+        queryset = self.sparse_queryset(queryset.select_related('author'))
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        context = self.get_serializer_context()
+        if context['preview_comments']:
+            context['comment_previews'] = await alatest_comments_by_post(
+                [post.pk for post in page], context['preview_comments']
+            )
+        serializer = self.get_serializer_class()(page, many=True, context=context)
+        if serializer.child.has_viewer_flags:
+            context['viewer_flags'] = await aviewer_flags(request.user, page)
+        return self.respond(self.paginator.get_paginated_response(serializer.data).data)
+
+class AsyncLikePostView(AsyncAPIView):
+    # LikePostView on the async ORM.
+    async def post(self, request):
+        target = LikeTargetSerializer(data=request.data)
+        target.is_valid(raise_exception=True)
+        post_id = target.validated_data['post']
+
+        buffer = get_like_buffer()
+        if buffer is not None:
+            detail, code = BUFFERED_LIKE_RESPONSES[await sync_to_async(buffer.submit)(request.user, post_id)]
+            return self.respond(detail, status=code)
+
+        # The insert and its counter and notification writes share a
+        # transaction, which the async ORM cannot open yet.
+        like = await sync_to_async(like_post)(request.user, post_id)
+        if like is not None:
+            data = LikeSerializer(like, context=self.get_serializer_context()).data
+            return self.respond(data, status=status.HTTP_201_CREATED)
+
+        if not await Post.objects.filter(pk=post_id).aexists():
+            return self.respond({"detail": "Post not found."}, status=status.HTTP_404_NOT_FOUND)
+        return self.respond({"detail": "You have already liked this post."}, status=status.HTTP_200_OK)
 
-        like.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+class AsyncUnlikePostView(AsyncAPIView):
+    # UnlikePostView on the async ORM.
+    async def delete(self, request):
+        target = LikeTargetSerializer(data=request.data)
+        target.is_valid(raise_exception=True)
+        post_id = target.validated_data['post']
+
+        buffer = get_like_buffer()
+        if buffer is not None:
+            await sync_to_async(buffer.settle)(request.user.pk, post_id)
+        if await sync_to_async(unlike_post)(request.user, post_id):
+            return self.respond(None, status=status.HTTP_204_NO_CONTENT)
+
+        if not await Post.objects.filter(pk=post_id).aexists():
+            return self.respond({"detail": "Post not found."}, status=status.HTTP_404_NOT_FOUND)
+        return self.respond({"detail": "You have not liked this post."}, status=status.HTTP_400_BAD_REQUEST)
+
+class LikeBatchView(generics.GenericAPIView):
+    serializer_class = LikeBatchSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        actions = [(item['post'], item['action']) for item in serializer.validated_data['actions']]
+        buffer = get_like_buffer()
+        if buffer is not None:
+            buffer.settle(request.user.pk)
+        results = apply_like_actions(request.user, actions)
+        return Response(
+            {"results": [{"post": post_id, "result": result} for post_id, result in results.items()]},
+            status=status.HTTP_200_OK,
+        )
+
+class ExportView(APIView):
+    # Dumps posts, comments or likes as NDJSON (default) or CSV for backups and
+    # analytics: ?output=csv, ?author=<user id>, ?since= / ?until= (ISO date or
+    # datetime; until is exclusive, except that a bare date includes that day).
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, resource):
+        exporter = EXPORT_RESOURCES.get(resource)
+        if exporter is None:
+            return Response({"detail": "Unknown export."}, status=status.HTTP_404_NOT_FOUND)
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            return Response({"detail": f"output must be one of: {', '.join(EXPORT_FORMATS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        criteria = {}
+        author = request.query_params.get('author')
+        if author is not None:
+            if not author.isdigit():
+                return Response({"detail": "author must be a user id."}, status=status.HTTP_400_BAD_REQUEST)
+            criteria['author'] = int(author)
+        for name in ('since', 'until'):
+            value = request.query_params.get(name)
+            if value is None:
+                continue
+            parsed = self.parse_moment(value, end_of_day=name == 'until')
+            if parsed is None:
+                return Response({"detail": f"{name} must be an ISO date or datetime."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            criteria[name] = parsed
+
+        content_type, encode = EXPORT_FORMATS[output]
+        rows = exporter.get_rows(**criteria)
+        response = StreamingHttpResponse(encode(exporter.fields, rows), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{resource}.{output}"'
+        return response
+
+    def parse_moment(self, value, end_of_day=False):
+        # A bare date is its midnight, or with end_of_day the next midnight.
+        # parse_datetime() also accepts bare dates, so they are told apart first.
+        try:
+            day = parse_date(value)
+            if day is None:
+                moment = parse_datetime(value)
+                if moment is None:
+                    return None
+            else:
+                if end_of_day:
+                    day += timedelta(days=1)
+                moment = datetime.combine(day, time.min)
+        except ValueError:
+            return None
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
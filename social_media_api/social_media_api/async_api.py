@@ -0,0 +1,80 @@
+from functools import cached_property
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+
+# Async counterparts of DRF views.
+#
+# DRF's APIView is synchronous, so under ASGI every request holds a worker
+# thread for as long as its queries run. AsyncAPIView is a plain async Django
+# view that keeps DRF's request parsing, authentication, serializers and error
+# format, but awaits the async ORM in between so that one process can keep
+# many slow requests in flight.
+
+
+class AsyncAPIView(View):
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES
+    serializer_class = None
+    pagination_class = None
+    require_authentication = True
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # As with APIView, CSRF is only enforced for session authentication.
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.request = Request(
+            request,
+            parsers=[parser() for parser in self.parser_classes],
+            authenticators=[authenticator() for authenticator in self.authentication_classes],
+        )
+        try:
+            # Authenticators look users and sessions up synchronously.
+            await sync_to_async(self.authenticate)(self.request)
+            return await super().dispatch(self.request, *args, **kwargs)
+        except Http404 as exc:
+            return self.handle_exception(exceptions.NotFound(*exc.args))
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+
+    def authenticate(self, request):
+        if self.require_authentication and not request.user.is_authenticated:
+            raise exceptions.NotAuthenticated()
+
+    def handle_exception(self, exc):
+        status = exc.status_code
+        headers = {}
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            authenticators = self.request.authenticators
+            header = authenticators[0].authenticate_header(self.request) if authenticators else None
+            if header:
+                headers['WWW-Authenticate'] = header
+            else:
+                status = exceptions.PermissionDenied.status_code
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        return self.respond(data, status=status, headers=headers)
+
+    def respond(self, data, status=200, headers=None):
+        if data is None:
+            return HttpResponse(status=status, headers=headers)
+        return JsonResponse(data, status=status, headers=headers, encoder=JSONEncoder, safe=False)
+
+    def get_serializer_class(self):
+        return self.serializer_class
+
+    def get_serializer_context(self):
+        return {'request': self.request, 'view': self}
+
+    @cached_property
+    def paginator(self):
+        return self.pagination_class() if self.pagination_class is not None else None
@@ -0,0 +1,244 @@
+import contextvars
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.functional import empty
+
+
+# Read replicas.
+#
+# With REPLICA_DATABASES naming aliases of DATABASES, ReplicaRouter sends the
+# reads of GET, HEAD and OPTIONS requests to a healthy replica and everything
+# else to the primary ('default'). Reads stay on the primary when
+#   - they happen outside a request (management commands, background threads)
+#     or inside a transaction on the primary;
+#   - the request is not a safe method, or has already written something
+#     (an INSERT, UPDATE, DELETE or DDL statement executed on the primary);
+#   - the client wrote within the last REPLICA_STICKY_SECONDS, so users read
+#     their own writes. This is remembered per user in the cache, and per
+#     client in a cookie for writers that are not logged in;
+#   - the model belongs to one of REPLICA_PRIMARY_APPS (sessions and tokens,
+#     which are read right after they are created);
+#   - no replica is healthy. Replicas are probed at most every
+#     REPLICA_HEALTH_INTERVAL seconds, and one whose query fails is left out
+#     until the next probe; the failed safe request is retried on the primary.
+
+STICKY_CACHE_KEY = 'db:sticky:{}'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+WRITE_STATEMENTS = {'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'MERGE', 'CREATE', 'ALTER', 'DROP', 'TRUNCATE'}
+
+_routing = contextvars.ContextVar('replica_routing', default=None)
+
+# alias -> (healthy, monotonic time of the last probe). Racing threads at
+# worst probe the same replica twice.
+_health = {}
+
+
+def replica_aliases():
+    return settings.REPLICA_DATABASES
+
+
+def probe(alias):
+    try:
+        with connections[alias].cursor() as cursor:
+            # A fresh SQLite file opens fine; make sure the schema is there.
+            cursor.execute('SELECT 1 FROM django_migrations LIMIT 1')
+    except DatabaseError:
+        return False
+    return True
+
+
+def is_healthy(alias):
+    now = time.monotonic()
+    healthy, checked_at = _health.get(alias, (None, 0.0))
+    if healthy is None or now - checked_at >= settings.REPLICA_HEALTH_INTERVAL:
+        healthy = probe(alias)
+        _health[alias] = (healthy, now)
+    return healthy
+
+
+def mark_unhealthy(alias):
+    _health[alias] = (False, time.monotonic())
+
+
+def _watch_replica(execute, sql, params, many, context):
+    try:
+        return execute(sql, params, many, context)
+    except DatabaseError:
+        mark_unhealthy(context['connection'].alias)
+        state = _routing.get()
+        if state is not None:
+            state.replica_failed = True
+        raise
+
+
+def is_write(sql):
+    words = sql.lstrip().split(None, 1)
+    return bool(words) and words[0].upper() in WRITE_STATEMENTS
+
+
+def _watch_primary(execute, sql, params, many, context):
+    # Django also asks db_for_write when it only assigns a foreign key or
+    # picks a manager's database, so writes are recorded where they run.
+    state = _routing.get()
+    if state is not None and not state.wrote and is_write(sql):
+        state.wrote = True
+    return execute(sql, params, many, context)
+
+
+def _add_wrapper(connection, wrapper):
+    if wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(wrapper)
+
+
+@receiver(connection_created)
+def watch_connection(sender, connection, **kwargs):
+    if connection.alias == DEFAULT_DB_ALIAS:
+        _add_wrapper(connection, _watch_primary)
+    elif connection.alias in replica_aliases():
+        _add_wrapper(connection, _watch_replica)
+
+
+def _known_user(request):
+    # The requesting user if authentication has already run; never triggers it.
+    user = request.__dict__.get('user')
+    if user is None or getattr(user, '_wrapped', None) is empty:
+        return None
+    return user if user.is_authenticated else None
+
+
+class RoutingState:
+    def __init__(self, request, use_replicas):
+        self.request = request
+        self.use_replicas = use_replicas
+        self.wrote = False
+        self.replica_failed = False
+        self.replica = None
+        self._pinned = None
+
+    def pinned(self):
+        # Until authentication has run the user is unknown and may still turn
+        # out to be pinned, so only a known answer is kept.
+        if self._pinned is None:
+            user = _known_user(self.request)
+            if user is None:
+                return False
+            self._pinned = cache.get(STICKY_CACHE_KEY.format(user.pk)) is not None
+        return self._pinned
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if (
+            state is None
+            or not state.use_replicas
+            or state.wrote
+            or model._meta.app_label in settings.REPLICA_PRIMARY_APPS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+            or state.pinned()
+        ):
+            return DEFAULT_DB_ALIAS
+        if state.replica is None or (state.replica != DEFAULT_DB_ALIAS and not is_healthy(state.replica)):
+            # One replica per request, so its reads see a single snapshot.
+            healthy = [alias for alias in replica_aliases() if is_healthy(alias)]
+            state.replica = random.choice(healthy) if healthy else DEFAULT_DB_ALIAS
+            if state.replica != DEFAULT_DB_ALIAS:
+                # In case this thread's connection was opened before the router loaded.
+                _add_wrapper(connections[state.replica], _watch_replica)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        # The primary's connection in this thread may predate the router.
+        if _routing.get() is not None:
+            _add_wrapper(connections[DEFAULT_DB_ALIAS], _watch_primary)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary (see sync_replicas).
+        if db in replica_aliases():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    # Opens the routing state ReplicaRouter reads for the duration of a request.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not replica_aliases():
+            return self.get_response(request)
+        state = self.start(request)
+        token = _routing.set(state)
+        try:
+            response = self.get_response(request)
+            if self.should_retry(state, response):
+                state.use_replicas = False
+                response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.finish(request, state, response)
+
+    async def __acall__(self, request):
+        if not replica_aliases():
+            return await self.get_response(request)
+        state = self.start(request)
+        token = _routing.set(state)
+        try:
+            response = await self.get_response(request)
+            if self.should_retry(state, response):
+                state.use_replicas = False
+                response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.finish(request, state, response)
+
+    def start(self, request):
+        _add_wrapper(connections[DEFAULT_DB_ALIAS], _watch_primary)
+        use_replicas = (
+            request.method in SAFE_METHODS
+            and settings.REPLICA_STICKY_COOKIE not in request.COOKIES
+        )
+        return RoutingState(request, use_replicas)
+
+    def should_retry(self, state, response):
+        # Safe requests can be replayed; a streamed body fails only after
+        # its headers have been sent, so it cannot be.
+        return (
+            state.replica_failed
+            and state.use_replicas
+            and response.status_code >= 500
+            and not response.streaming
+        )
+
+    def finish(self, request, state, response):
+        if state.wrote or request.method not in SAFE_METHODS:
+            seconds = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                settings.REPLICA_STICKY_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax'
+            )
+            user = _known_user(request)
+            if user is not None:
+                cache.set(STICKY_CACHE_KEY.format(user.pk), True, seconds)
+        return response
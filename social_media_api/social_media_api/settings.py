@@ -50,6 +50,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'social_media_api.db_router.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -86,6 +87,59 @@ DATABASES = {
 }
 
 
+# Read replicas (social_media_api/db_router.py)
+# Reads of safe requests go to the aliases in REPLICA_DATABASES; writes and
+# everything else to 'default'. To try it locally with SQLite files:
+#     DATABASES['replica1'] = {**DATABASES['default'], 'NAME': BASE_DIR / 'db.replica1.sqlite3',
+#                              'TEST': {'MIRROR': 'default'}}
+#     REPLICA_DATABASES = ['replica1']
+# then copy the primary over with `python manage.py sync_replicas`.
+
+DATABASE_ROUTERS = ['social_media_api.db_router.ReplicaRouter']
+REPLICA_DATABASES = []
+# Reads stay on the primary this long after a client's last write.
+REPLICA_STICKY_SECONDS = 10
+REPLICA_STICKY_COOKIE = 'db_sticky'
+REPLICA_PRIMARY_APPS = ['sessions', 'authtoken']
+REPLICA_HEALTH_INTERVAL = 10
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.1/ref/settings/#caches
+# 'default' is Django's implicit per-process cache. The feed index holds one
+# entry per author, more than LocMemCache's default 300; in production point
+# both at a shared cache (Redis, memcached).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'feed_index': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'feed-index',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+
+# REST framework
+# Tokens are resolved through a per-process LRU of TOKEN_AUTH_LRU_SIZE users
+# (trusted for TOKEN_AUTH_LOCAL_TTL seconds) in front of the default cache
+# (TOKEN_AUTH_CACHE_TIMEOUT seconds); see accounts/authentication.py.
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'accounts.authentication.CachedTokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+}
+
+TOKEN_AUTH_LRU_SIZE = 10000
+TOKEN_AUTH_LOCAL_TTL = 5
+TOKEN_AUTH_CACHE_TIMEOUT = 300
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -122,7 +176,111 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Spool every upload to a temporary file in chunks instead of holding small
+# ones in memory.
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler']
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+AUTH_USER_MODEL = 'accounts.CustomUser'
+
+
+# Home timeline (posts/timeline.py)
+# Posts are pushed into each follower's timeline on write, except for authors
+# with at least FEED_CELEBRITY_THRESHOLD followers, whose posts are pulled at read time.
+# A timeline holds the newest FEED_TIMELINE_LENGTH pushed posts, and the feed
+# ends there.
+
+FEED_CELEBRITY_THRESHOLD = 10000
+FEED_CELEBRITY_CACHE_TIMEOUT = 300
+FEED_BACKFILL_SIZE = 200
+FEED_TIMELINE_LENGTH = 1000
+FEED_FANOUT_BATCH_SIZE = 1000
+
+# 'timeline' serves feeds from the timelines above; 'recent_index' merges
+# per-author lists of recent posts kept in the cache (posts/feed_index.py).
+FEED_ENGINE = 'timeline'
+FEED_INDEX_CACHE = 'feed_index'
+FEED_INDEX_AUTHOR_LENGTH = 100
+FEED_INDEX_TIMEOUT = 24 * 60 * 60
+
+
+# Post search (posts/search.py). Set to None to use plain LIKE search.
+
+POSTS_SEARCH_BACKEND = 'posts.search.FTS5SearchBackend'
+
+
+# Bulk NDJSON post import (posts/bulk.py)
+
+POSTS_IMPORT_BATCH_SIZE = 500
+POSTS_IMPORT_MAX_BATCH_SIZE = 5000
+
+
+# Trending posts (posts/trending.py)
+# Likes and comments add their weight to a post's score, which halves every
+# TRENDING_HALF_LIFE seconds. The best TRENDING_TOP_K posts are cached.
+
+TRENDING_HALF_LIFE = 6 * 60 * 60
+TRENDING_LIKE_WEIGHT = 1.0
+TRENDING_COMMENT_WEIGHT = 2.0
+TRENDING_TOP_K = 100
+TRENDING_CACHE_TIMEOUT = 300
+
+
+# Write-behind likes (posts/like_buffer.py)
+# None writes every like in its own transaction. A dict buffers accepted likes
+# per process and writes them in batches, e.g.
+#     LIKES_WRITE_BEHIND = {
+#         'FLUSH_INTERVAL': 0.005,  # seconds between flushes
+#         'FLUSH_SIZE': 500,        # flush early once this many likes wait
+#         'JOURNAL_DIR': BASE_DIR / 'like_journal',  # omit to buffer in memory only
+#         'FSYNC': False,           # fsync the journal before acknowledging a like
+#     }
+
+LIKES_WRITE_BEHIND = None
+
+
+# Profile pictures (accounts/avatars.py)
+# Square thumbnails rendered per bucket (edge length in pixels) by a pool of
+# AVATAR_WORKERS threads. After changing the buckets run rebuild_avatars.
+
+AVATAR_SIZES = {'small': 64, 'medium': 256}
+AVATAR_WORKERS = 2
+AVATAR_THUMBNAIL_QUALITY = 85
+AVATAR_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+AVATAR_MAX_PIXELS = 40_000_000
+
+
+# Follow relationships (accounts/follows.py)
+# relationships/?ids= answers at most RELATIONSHIPS_MAX_IDS users per request
+# with one query. A dict caches the follow id sets of the requesting users
+# instead, for users with at most MAX_SIZE follows on a side, e.g.
+#     RELATIONSHIPS_CACHE = {'TIMEOUT': 300, 'MAX_SIZE': 5000}
+
+RELATIONSHIPS_MAX_IDS = 300
+RELATIONSHIPS_CACHE = None
+
+
+# Follow suggestions (accounts/suggestions.py)
+# Rebuilt periodically by build_follow_suggestions, FOLLOW_SUGGESTIONS_CHUNK_SIZE
+# users per query; each user keeps their best FOLLOW_SUGGESTIONS_COUNT.
+
+FOLLOW_SUGGESTIONS_COUNT = 20
+FOLLOW_SUGGESTIONS_CHUNK_SIZE = 500
+
+
+# Username autocomplete (accounts/autocomplete.py)
+# Each process answers from an in-memory index of usernames and picks up new
+# and renamed users at most every AUTOCOMPLETE_SYNC_INTERVAL seconds. Falling
+# more than AUTOCOMPLETE_JOURNAL_LENGTH changes behind reloads the index.
+
+AUTOCOMPLETE_SYNC_INTERVAL = 1
+AUTOCOMPLETE_JOURNAL_LENGTH = 10000
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
@@ -0,0 +1,103 @@
+import base64
+import time
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from posts.models import Post
+from social_media_api import db_router
+
+User = get_user_model()
+
+# Two SQLite replicas for the tests below. The aliases have to exist before
+# the test runner sets up databases, and stay unused elsewhere since
+# REPLICA_DATABASES is empty outside these tests.
+REPLICAS = ('replica1', 'replica2')
+for alias in REPLICAS:
+    connections.settings.setdefault(alias, {
+        **connections.settings['default'],
+        'NAME': ':memory:',
+        'TEST': {**connections.settings['default']['TEST'], 'NAME': None, 'MIRROR': None},
+    })
+
+
+@override_settings(REPLICA_DATABASES=list(REPLICAS))
+class ReplicaRouterTests(TransactionTestCase):
+    # The replicas are copied from the test database with sync_replicas, so
+    # rows written after the copy exist on the primary only.
+    databases = {'default', *REPLICAS}
+
+    def setUp(self):
+        cache.clear()
+        db_router._health.clear()
+        self.author = User.objects.create_user('author', password='secret')
+        self.reader = User.objects.create_user('reader', password='secret')
+        Post.objects.create(author=self.author, title='synced', content='body')
+        call_command('sync_replicas', stdout=StringIO())
+        Post.objects.create(author=self.author, title='primary only', content='body')
+
+    def basic_client(self, user):
+        client = APIClient()
+        credentials = base64.b64encode(f'{user.username}:secret'.encode()).decode()
+        client.credentials(HTTP_AUTHORIZATION=f'Basic {credentials}')
+        return client
+
+    def titles(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        return sorted(post['title'] for post in response.json()['results'])
+
+    def test_safe_requests_read_from_a_replica(self):
+        self.assertEqual(self.titles(APIClient().get('/api/posts/posts/')), ['synced'])
+        self.assertEqual(self.titles(self.basic_client(self.reader).get('/api/posts/posts/')), ['synced'])
+
+    def test_token_reads_are_not_pinned(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.reader).key}')
+        for _ in range(2):  # the second request is a token cache hit
+            response = client.get('/api/posts/posts/')
+            self.assertEqual(self.titles(response), ['synced'])
+            self.assertNotIn('db_sticky', response.cookies)
+        self.assertIsNone(cache.get(db_router.STICKY_CACHE_KEY.format(self.reader.pk)))
+
+    def test_writer_reads_own_writes(self):
+        response = self.basic_client(self.author).post('/api/posts/posts/', {'title': 'new', 'content': 'body'})
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('db_sticky', response.cookies)
+        # A fresh client of the same user is pinned through the cache.
+        self.assertEqual(
+            self.titles(self.basic_client(self.author).get('/api/posts/posts/')),
+            ['new', 'primary only', 'synced'],
+        )
+        self.assertEqual(self.titles(self.basic_client(self.reader).get('/api/posts/posts/')), ['synced'])
+
+    @override_settings(REPLICA_STICKY_SECONDS=1)
+    def test_pin_expires(self):
+        self.basic_client(self.author).post('/api/posts/posts/', {'title': 'new', 'content': 'body'})
+        self.assertEqual(len(self.titles(self.basic_client(self.author).get('/api/posts/posts/'))), 3)
+        time.sleep(1.1)
+        self.assertEqual(self.titles(self.basic_client(self.author).get('/api/posts/posts/')), ['synced'])
+
+    def test_unhealthy_replicas_fall_back_to_the_primary(self):
+        with connections['replica2'].cursor() as cursor:
+            cursor.execute('DROP TABLE django_migrations')
+        for _ in range(4):
+            self.assertEqual(self.titles(APIClient().get('/api/posts/posts/')), ['synced'])
+        self.assertFalse(db_router._health['replica2'][0])
+
+        # replica1 still passes the probe, but its query fails: the request is
+        # retried on the primary and replica1 is left out.
+        with connections['replica1'].cursor() as cursor:
+            cursor.execute('DROP TABLE posts_post')
+        db_router._health.clear()
+        db_router._health['replica2'] = (False, time.monotonic())
+        # The failed first attempt is still reported to the test client.
+        client = APIClient(raise_request_exception=False)
+        self.assertEqual(self.titles(client.get('/api/posts/posts/')), ['primary only', 'synced'])
+        self.assertFalse(db_router._health['replica1'][0])
+        self.assertEqual(self.titles(APIClient().get('/api/posts/posts/')), ['primary only', 'synced'])